@@ -0,0 +1,103 @@
+"""Regression suite for the data_quality checks
+
+Runs data_quality.validate_frames over the fixture games (see benchmarks/fixtures) and checks the issues it reports
+against the expected ones checked in to benchmarks/data_quality_expected.json. Besides each game as recorded, the games
+a franchise with a changed abbr plays in are checked with the abbr it used in another season:
+    <game_id>                        each fixture game as recorded
+    <game_id> as <abbr>              the franchise listed as <abbr> everywhere - an abbr it dropped before the season
+    <game_id> as <abbr> in drives    only the play by play lists it as <abbr>, the schedule has the right abbr
+    <game_id>@<season>               the same game played in an earlier season, when the franchise used <abbr>
+    <game_id>@<season> as <abbr>     ... listed as <abbr>, which was right that season
+    python benchmarks/data_quality_regression.py
+    python benchmarks/data_quality_regression.py --record    # after an intended change, to update the expectations
+"""
+import json
+import logging
+import os
+import sys
+import tempfile
+from parser_benchmarks import fixture_games, read_fixture
+from pynfldata.data_tools import columnar
+from pynfldata.data_tools import data_quality
+from pynfldata.data_tools import game_cache
+from pynfldata.data_tools import nfl_types
+from pynfldata.data_tools import raw_store
+
+EXPECTED_FILENAME = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data_quality_expected.json')
+# franchise abbr -> (a season it was listed under another abbr, that abbr) - see team_functions.TEAM_ABBR_HISTORY
+OLD_ABBRS = {'JAX': (2012, 'JAC')}
+
+
+# a Game (without details) with another season and one team abbr swapped for another
+def _replace_game(game, season_year: int, old: str = None, new: str = None):
+    home_team, away_team = [new if x == old else x for x in (game.home_team, game.away_team)]
+    return nfl_types.Game(season_year, game.season_type, game.game_week, home_team, away_team, game.game_id,
+                          game.home_score, game.away_score)
+
+
+# a boxscorePbp payload with every attribute holding one team abbr given another
+def _replace_abbr(raw_data: bytes, old: str, new: str):
+    return raw_data.replace('"{}"'.format(old).encode(), '"{}"'.format(new).encode())
+
+
+# {case: (Game without details, boxscorePbp payload)} for every case described above
+def fixture_cases():
+    cases = {}
+    for game in fixture_games():
+        raw_data = read_fixture('boxscorePbp/{}.xml'.format(game.game_id))
+        cases[game.game_id] = (game, raw_data)
+        for abbr, (season_year, old_abbr) in OLD_ABBRS.items():
+            if abbr not in (game.home_team, game.away_team):
+                continue
+            old_raw_data = _replace_abbr(raw_data, abbr, old_abbr)
+            cases['{} as {}'.format(game.game_id, old_abbr)] = (
+                _replace_game(game, game.season_year, abbr, old_abbr), old_raw_data)
+            cases['{} as {} in drives'.format(game.game_id, old_abbr)] = (game, old_raw_data)
+            cases['{}@{}'.format(game.game_id, season_year)] = (_replace_game(game, season_year), raw_data)
+            cases['{}@{} as {}'.format(game.game_id, season_year, old_abbr)] = (
+                _replace_game(game, season_year, abbr, old_abbr), old_raw_data)
+    return cases
+
+
+# {case: [[check, severity, drive_id, detail], ...]} for every fixture case, each parsed from its own raw store
+def check_fixture_cases():
+    old_store = raw_store.get_store()
+    game_cache.set_cache(None)
+    results = {}
+    try:
+        for case, (game, raw_data) in fixture_cases().items():
+            with tempfile.TemporaryDirectory() as folder:
+                store = raw_store.FileStore(folder)
+                store.put('boxscorePbp', game.game_id, raw_data)
+                raw_store.set_store(store)
+                builder = columnar.ColumnarBuilder(descriptions=False)
+                builder.add_game(game.get_game_details())
+            issues = data_quality.validate_frames(*builder.to_frames())
+            results[case] = [[row.check, row.severity, None if row.drive_id is None else int(row.drive_id), row.detail]
+                             for row in issues.astype(object).where(issues.notna(), None).itertuples()]
+    finally:
+        raw_store.set_store(old_store)
+    return results
+
+
+def main(args: list):
+    logging.getLogger('nfl_types.py').setLevel(logging.ERROR)
+    current = check_fixture_cases()
+    if '--record' in args:
+        with open(EXPECTED_FILENAME, 'w') as outfile:
+            json.dump(current, outfile, indent=1, sort_keys=True)
+        print('Recorded {} cases'.format(len(current)))
+        return 0
+    with open(EXPECTED_FILENAME, 'r') as infile:
+        expected = json.load(infile)
+    changed = 0
+    for case in sorted(set(expected) | set(current)):
+        if expected.get(case) != current.get(case):
+            print('{}: expected {}, got {}'.format(case, expected.get(case), current.get(case)))
+            changed += 1
+    print('{} cases, {} changed'.format(len(current), changed))
+    return 1 if changed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
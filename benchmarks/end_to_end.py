@@ -0,0 +1,137 @@
+"""End-to-end timings of the ingest entry points against a local feeds_server
+
+Starts a feeds_server on the fixtures (or any folder of recorded payloads), points the package at it and runs, each in
+its own empty temporary folder so every payload is downloaded from the server. Results say where the payloads came
+from (see parser_benchmarks.get_fixtures_source) - the checked-in fixtures are generated stand-ins:
+    drive_parser          - one season's NDJSON output, as drive_parser.build_and_save_json writes it
+    play_parser_bigquery  - load_new_games into a SQLite stand-in warehouse
+    *_pipeline            - the same two on async_pipeline
+    drive_parser_spark    - the same season on drive_parser_spark, as Parquet, on a local[N] master (--spark-master).
+                            Needs pyspark and a JVM, so it only runs when picked with --pipeline
+    coaches               - the coaches scrape for every team of the season
+Network conditions are set with the server's options, the client side with --workers/--client-rate:
+    python benchmarks/end_to_end.py --latency 0.05 --jitter 0.05 --error-rate 0.02 --rate 20 --output e2e.json
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+import logging
+from parser_benchmarks import FIXTURES_FOLDER, get_fixtures_source
+from pynfldata.data_tools import build_manifest
+from pynfldata.data_tools import downloader
+from pynfldata.data_tools import feeds_server
+from pynfldata.data_tools import raw_store
+from pynfldata.data_tools import transport
+from pynfldata.data_tools import warehouse
+from pynfldata.coaches_data import coaches_parser
+from pynfldata.plays_data import play_parser_bigquery
+
+SEASON_YEAR = 2019
+SPARK_MASTER = 'local[4]'
+
+
+def run_drive_parser():
+    manifest = build_manifest.BuildManifest('output/drives_manifest.json')
+    return build_manifest.build_season_json(SEASON_YEAR, 'output/drives_{}.json'.format(SEASON_YEAR), manifest)
+
+
+def run_play_parser_bigquery():
+    return play_parser_bigquery.load_new_games(warehouse.SQLiteWarehouse('warehouse.sqlite'))
+
+
+def run_drive_parser_pipeline():
+    manifest = build_manifest.BuildManifest('output/drives_manifest.json')
+    return build_manifest.build_season_json(SEASON_YEAR, 'output/drives_{}.json'.format(SEASON_YEAR), manifest,
+                                            pipeline={})
+
+
+def run_play_parser_bigquery_pipeline():
+    return play_parser_bigquery.load_new_games(warehouse.SQLiteWarehouse('warehouse.sqlite'), pipeline={})
+
+
+def run_drive_parser_spark():
+    # imported here so pyspark (and a JVM) is only needed when this pipeline is run
+    from pynfldata.drives_data import drive_parser_spark
+    drive_parser_spark.get_games_df(SEASON_YEAR, SEASON_YEAR + 1, SPARK_MASTER).write.partitionBy('season_year') \
+        .mode('overwrite').parquet(os.path.abspath('output/drives_spark.pq'))
+    return drive_parser_spark.get_spark(SPARK_MASTER).read.parquet(os.path.abspath('output/drives_spark.pq')).count()
+
+
+def run_coaches():
+    os.makedirs('output', exist_ok=True)
+    with open(coaches_parser.TEAMS_FILENAME, 'w') as outfile:
+        outfile.write('season,teamId,abbr\n')
+        for team in coaches_parser.get_teams_json(SEASON_YEAR):
+            if team['@teamType'] != 'PRO':
+                outfile.write('{},{},{}\n'.format(team['@season'], int(team['@teamId']), team['@abbr']))
+    coaches_parser.save_coaches_df()
+    return len(coaches_parser.get_coaches_data())
+
+
+PIPELINES = {'drive_parser': run_drive_parser,
+             'play_parser_bigquery': run_play_parser_bigquery,
+             'drive_parser_pipeline': run_drive_parser_pipeline,
+             'play_parser_bigquery_pipeline': run_play_parser_bigquery_pipeline,
+             'drive_parser_spark': run_drive_parser_spark,
+             'coaches': run_coaches}
+# pipelines that only run when asked for by name
+OPTIONAL_PIPELINES = ['drive_parser_spark']
+
+
+# run each pipeline in a fresh folder with fresh caches, returning its time, result and the requests the server saw
+def run_pipelines(folder: str, pipelines: list = None, workers: int = 4, client_rate: float = 1000,
+                  **server_options):
+    logging.getLogger().setLevel(logging.WARNING)
+    server = feeds_server.start_server(os.path.abspath(folder), **server_options)
+    old_base_url = transport.get_base_url()
+    transport.set_base_url(server.base_url)
+    cwd = os.getcwd()
+    results = {}
+    try:
+        for name, pipeline in PIPELINES.items():
+            if name not in (pipelines if pipelines is not None else set(PIPELINES) - set(OPTIONAL_PIPELINES)):
+                continue
+            with tempfile.TemporaryDirectory() as work:
+                os.chdir(work)
+                downloader.configure(client_rate, client_rate, workers, transport.HTTPTransport(workers))
+                raw_store.set_store(raw_store.FileStore())
+                stats_before = dict(server.stats)
+                start = time.perf_counter()
+                result = pipeline()
+                results[name] = {'seconds': round(time.perf_counter() - start, 3),
+                                 'result': result,
+                                 'server': {k: v - stats_before[k] for k, v in server.stats.items()}}
+                os.chdir(cwd)
+    finally:
+        os.chdir(cwd)
+        transport.set_base_url(old_base_url)
+        server.shutdown()
+
+    return {'payloads': get_fixtures_source(folder), 'server_options': server_options, 'workers': workers,
+            'client_rate': client_rate, 'pipelines': results}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Time the ingest entry points against a local feeds_server')
+    parser.add_argument('folder', nargs='?', default=FIXTURES_FOLDER)
+    parser.add_argument('--pipeline', action='append', choices=list(PIPELINES))
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--client-rate', type=float, default=1000, help='the downloader\'s requests per second')
+    parser.add_argument('--latency', type=float, default=0)
+    parser.add_argument('--jitter', type=float, default=0)
+    parser.add_argument('--error-rate', type=float, default=0)
+    parser.add_argument('--rate', type=float, help='server-side requests per second before answering 429')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--spark-master', default=SPARK_MASTER, help='the master drive_parser_spark runs on')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    args = parser.parse_args()
+    SPARK_MASTER = args.spark_master
+
+    e2e_results = run_pipelines(args.folder, args.pipeline, args.workers, args.client_rate, latency=args.latency,
+                                jitter=args.jitter, error_rate=args.error_rate, rate=args.rate, seed=args.seed)
+    if args.output:
+        with open(args.output, 'w') as outfile:
+            json.dump(e2e_results, outfile, indent=1)
+    print(json.dumps(e2e_results, indent=1))
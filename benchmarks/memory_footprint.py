@@ -0,0 +1,38 @@
+"""Measure the memory held by one season of parsed Game objects
+
+Run from a folder whose data/ already holds the season (e.g. after drive_parser has run once) so nothing needs to be
+downloaded:
+    python benchmarks/memory_footprint.py 2018
+    python benchmarks/memory_footprint.py 2018 --summary    # drive summaries only, see Game.get_game_details
+"""
+import gc
+import json
+import sys
+import tracemalloc
+from pynfldata.data_tools import functions as f
+
+
+# parse every game of a season and report how much memory the resulting objects keep alive
+def measure_season(season_year: int, summary: bool = False):
+    gc.collect()
+    tracemalloc.start()
+    games = f.get_games_for_years(season_year, season_year + 1, summary=summary)
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    num_drives = sum(len(g.drives) for g in games)
+    num_plays = None if summary else sum(len(d.plays) for g in games for d in g.drives)
+    return {'season_year': season_year,
+            'summary': summary,
+            'games': len(games),
+            'drives': num_drives,
+            'plays': num_plays,
+            'retained_bytes': current,
+            'peak_bytes': peak,
+            'bytes_per_drive': round(current / num_drives, 1) if num_drives else None,
+            'bytes_per_play': round(current / num_plays, 1) if num_plays else None}
+
+
+if __name__ == '__main__':
+    print(json.dumps(measure_season(int(sys.argv[1]), '--summary' in sys.argv[2:]), indent=2))
@@ -0,0 +1,250 @@
+"""Offline micro-benchmarks for the parsing stages, using the feeds-rs payloads in benchmarks/fixtures
+
+Each stage is timed on its own, over --repeat rounds, and reported as the median seconds per round, throughput
+(plays/sec, drives/sec, games/sec or rows/sec) and the peak memory (tracemalloc) of one extra, untimed round.
+Nothing touches the network. Fixtures are found next to this script, so it can be run from any folder:
+    python benchmarks/parser_benchmarks.py --output before.json
+    python benchmarks/parser_benchmarks.py --compare before.json
+Fixtures are stored under their feeds-rs path (see transport.get_payload_filename), so feeds_server can serve them too.
+--record-fixtures downloads the current versions of the same paths. The checked-in fixtures are generated stand-ins
+(see benchmarks/fixtures/README.md), and every result says which payloads it was measured on - see get_fixtures_source.
+"""
+import argparse
+import datetime
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+import tracemalloc
+import pandas as pd
+import xmltodict
+from pynfldata.data_tools import downloader
+from pynfldata.data_tools import functions as f
+from pynfldata.data_tools import nfl_types
+from pynfldata.data_tools import pbp_parser
+from pynfldata.data_tools import raw_store
+from pynfldata.data_tools import team_functions
+from pynfldata.data_tools import transport
+
+FIXTURES_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+# names where a fixtures folder's payloads came from, e.g. 'generated stand-ins, not real feeds-rs responses'
+SOURCE_FILENAME = 'SOURCE'
+FIXTURE_PATHS = ['schedules',
+                 'schedules/2019',
+                 'scores/2019/REG/1',
+                 'boxscorePbp/2019090800.xml',
+                 'boxscorePbp/2019090801.xml',
+                 'boxscorePbp/2019090802.xml',
+                 'teams/2019.xml']
+
+
+# where the payloads in a fixtures folder came from, as written to its SOURCE file, or None if it doesn't say
+def get_fixtures_source(folder: str = FIXTURES_FOLDER):
+    filename = os.path.join(folder, SOURCE_FILENAME)
+    if not os.path.exists(filename):
+        return None
+    with open(filename) as infile:
+        return infile.read().strip()
+
+
+def read_fixture(path: str):
+    with open(transport.get_payload_filename(FIXTURES_FOLDER, path), 'rb') as infile:
+        return infile.read()
+
+
+# every team of the fixture season, as the teams feed lists them
+def fixture_teams():
+    return xmltodict.parse(read_fixture('teams/2019.xml'))['teamsFeed']['teams']['team']
+
+
+# re-download every fixture from nfl.com, plus each fixture team's coach
+def record_fixtures():
+    downloader.configure(transport=transport.RecordingTransport(FIXTURES_FOLDER))
+    paths = FIXTURE_PATHS[:]
+    for path in paths:
+        f.download_xml(transport.get_url(path), 1)
+        print('Recorded {}'.format(path))
+        if path.startswith('teams/'):
+            paths += ['coach/byTeam/{}/2019'.format(x['@teamId']) for x in fixture_teams() if x['@teamType'] != 'PRO']
+    with open(os.path.join(FIXTURES_FOLDER, SOURCE_FILENAME), 'w') as outfile:
+        outfile.write('recorded from {} on {}\n'.format(transport.get_base_url(), datetime.date.today().isoformat()))
+
+
+# Game objects (without details) for the fixture week, built like functions.get_games_from_schedule does
+def fixture_games():
+    games = []
+    for game in f._parse_game_score(read_fixture('scores/2019/REG/1')):
+        schedule_dict = game['gameSchedule']
+        games.append(nfl_types.Game(int(schedule_dict['@season']), schedule_dict['@seasonType'],
+                                    int(schedule_dict['@week']), schedule_dict['@homeTeamAbbr'],
+                                    schedule_dict['@visitorTeamAbbr'], schedule_dict['@gameId'],
+                                    game['score']['homeTeamScore']['@pointTotal'],
+                                    game['score']['visitorTeamScore']['@pointTotal']))
+    return games
+
+
+def _copy_game(game):
+    return nfl_types.Game(game.season_year, game.season_type, game.game_week, game.home_team, game.away_team,
+                          game.game_id, game.home_score, game.away_score)
+
+
+# xmltodict play dicts of every fixture game, drive by drive, as _parse_game_dict sees them
+def fixture_drive_dicts():
+    drives = []
+    for game in fixture_games():
+        feed = xmltodict.parse(read_fixture('boxscorePbp/{}.xml'.format(game.game_id)))['boxScorePBPFeed']
+        drives += feed['drives']['drive']
+    return drives
+
+
+# one row per team and season since 1969, with the abbreviation the team had that season
+def fixture_teams_df():
+    rows = [{'season': season, 'teamId': x['@teamId'], 'abbr': team_functions.get_season_abbr(x['@abbr'], season)}
+            for season in range(1969, 2020) for x in fixture_teams() if x['@teamType'] != 'PRO']
+    return pd.DataFrame(rows)
+
+
+# each stage is (setup, run, units): setup() builds the input outside the timer, run(state) is what's timed and
+# units(state) gives the {unit: count} that one run processes
+def _stages():
+    play_dicts = [y for x in fixture_drive_dicts() for y in x['plays']['play']]
+
+    def drive_setup():
+        return [(int(float(x['@sequence'])), [nfl_types._process_play_dict(y) for y in x['plays']['play']],
+                 x['@possessionTeamAbbr']) for x in fixture_drive_dicts()]
+
+    def details_setup():
+        return [_copy_game(g) for g in fixture_games()]
+
+    def exported_setup():
+        return [g.get_game_details() for g in details_setup()]
+
+    # the games whose drives don't add up on their own, with drives built and scoring plays ready to reconcile
+    def remedy_setup():
+        games = []
+        for game in details_setup():
+            raw_data = read_fixture('boxscorePbp/{}.xml'.format(game.game_id))
+            drives, scoring_plays = pbp_parser.parse_boxscore_xml(raw_data)
+            game._get_drive_details(drives)
+            if not game.check_score_integrity():
+                games.append((game, scoring_plays))
+        return games
+
+    def count_plays(games):
+        return sum(len(d.plays) for g in games for d in g.drives)
+
+    return {
+        'process_play_dict': (lambda: play_dicts,
+                              lambda state: [nfl_types._process_play_dict(x) for x in state],
+                              lambda state: {'plays': len(state)}),
+        'drive_construction': (drive_setup,
+                               lambda state: [nfl_types.Drive(*x) for x in state],
+                               lambda state: {'drives': len(state), 'plays': sum(len(x[1]) for x in state)}),
+        'get_game_details': (details_setup,
+                             lambda state: [g.get_game_details() for g in state],
+                             lambda state: {'games': len(state), 'plays': count_plays(exported_setup())}),
+        'export': (exported_setup,
+                   lambda state: [g.export() for g in state],
+                   lambda state: {'games': len(state), 'plays': count_plays(state)}),
+        'remedy_incorrect_scoreline': (remedy_setup,
+                                       lambda state: [g._remedy_incorrect_scoreline(s) for g, s in state],
+                                       lambda state: {'games': len(state)}),
+        'make_teams_continuous': (fixture_teams_df,
+                                  lambda state: team_functions.make_teams_continuous(state, 'abbr', 'season'),
+                                  lambda state: {'rows': len(state)}),
+    }
+
+
+def _time_stage(setup, run, units, repeat: int):
+    timings = []
+    for _ in range(repeat):
+        state = setup()
+        start = time.perf_counter()
+        run(state)
+        timings.append(time.perf_counter() - start)
+
+    state = setup()
+    tracemalloc.start()
+    run(state)
+    peak_bytes = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    seconds = statistics.median(timings)
+    counts = units(state)
+    return {'seconds': seconds,
+            'min_seconds': min(timings),
+            'counts': counts,
+            'per_sec': {unit: round(count / seconds, 1) if seconds else None for unit, count in counts.items()},
+            'peak_bytes': peak_bytes}
+
+
+def _get_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        return None
+
+
+# run every stage (or the ones named) against the fixtures. Game details are read from a throwaway local store
+def run_benchmarks(repeat: int = 20, stages: list = None):
+    logging.getLogger('nfl_types.py').setLevel(logging.ERROR)
+    old_store = raw_store.get_store()
+    with tempfile.TemporaryDirectory() as folder:
+        store = raw_store.FileStore(folder)
+        for game in fixture_games():
+            store.put('boxscorePbp', game.game_id, read_fixture('boxscorePbp/{}.xml'.format(game.game_id)))
+        raw_store.set_store(store)
+        try:
+            results = {name: _time_stage(*stage, repeat) for name, stage in _stages().items()
+                       if stages is None or name in stages}
+        finally:
+            raw_store.set_store(old_store)
+
+    return {'commit': _get_commit(),
+            'fixtures': get_fixtures_source(),
+            'python': platform.python_version(),
+            'repeat': repeat,
+            'stages': results}
+
+
+# print each stage's time next to an earlier run's
+def compare(current: dict, previous: dict):
+    if current.get('fixtures') != previous.get('fixtures'):
+        print('Measured on different fixtures: {!r} and {!r}'.format(previous.get('fixtures'), current.get('fixtures')))
+    print('{:<28}{:>12}{:>12}{:>8}'.format('stage', previous.get('commit') or 'previous',
+                                          current.get('commit') or 'current', 'ratio'))
+    for name, result in current['stages'].items():
+        old = previous['stages'].get(name)
+        if old is None:
+            print('{:<28}{:>12}{:>12.6f}'.format(name, '-', result['seconds']))
+        else:
+            print('{:<28}{:>12.6f}{:>12.6f}{:>8.2f}'.format(name, old['seconds'], result['seconds'],
+                                                         result['seconds'] / old['seconds']))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Time the parsing stages against recorded feeds-rs fixtures')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--stage', action='append', help='only run this stage (can be given more than once)')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    parser.add_argument('--compare', help='compare against results previously written with --output')
+    parser.add_argument('--record-fixtures', action='store_true', help='re-download the fixtures from nfl.com')
+    args = parser.parse_args()
+
+    if args.record_fixtures:
+        record_fixtures()
+    else:
+        benchmark_results = run_benchmarks(args.repeat, args.stage)
+        if args.output:
+            with open(args.output, 'w') as outfile:
+                json.dump(benchmark_results, outfile, indent=1)
+        if args.compare:
+            with open(args.compare) as infile:
+                compare(benchmark_results, json.load(infile))
+        else:
+            print(json.dumps(benchmark_results, indent=1))
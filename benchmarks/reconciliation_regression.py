@@ -0,0 +1,151 @@
+"""Regression suite for Game._remedy_incorrect_scoreline
+
+Without arguments, checks known mismatched games against the expected results checked in to
+benchmarks/reconciliation_expected.json. Every case is parsed from the fixtures (see benchmarks/fixtures), in full and
+summary mode, and must reconcile the same scoring plays, end with the same scoring drives and match the final score:
+    <game_id>                              each fixture game as recorded - 2019090800 needs a scoring play reconciled
+    <game_id>@<season>                     the same game played in an earlier season, when a team used another abbr
+    <game_id> without drive scoring plays  every scoring play taken out of the drives, so all come from scoringPlays
+    python benchmarks/reconciliation_regression.py
+    python benchmarks/reconciliation_regression.py --record    # after an intended change, to update the expectations
+
+With a season or a range of seasons, parses every game of those seasons from the local data/ folder instead and
+compares against results recorded for them earlier with --record (benchmarks/reconciliation_results.json, not checked
+in). Recording only replaces the results of the seasons given:
+    python benchmarks/reconciliation_regression.py 2009 2018 --record
+    python benchmarks/reconciliation_regression.py 2009 2018
+    python benchmarks/reconciliation_regression.py 2018
+"""
+import dataclasses as dc
+import json
+import logging
+import os
+import re
+import sys
+import tempfile
+from parser_benchmarks import fixture_games, read_fixture
+from pynfldata.data_tools import functions as f
+from pynfldata.data_tools import game_cache
+from pynfldata.data_tools import nfl_types
+from pynfldata.data_tools import raw_store
+
+EXPECTED_FILENAME = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'reconciliation_expected.json')
+RESULTS_FILENAME = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'reconciliation_results.json')
+# a season the fixtures' JAX played as JAC - see team_functions.TEAM_ABBR_HISTORY
+RELOCATED_SEASON = 2012
+
+
+# parse the seasons, returning {game_id: {'season_year': int, 'reconciled_play_ids': [...], 'score_matches': bool}}
+# for every game that needed reconciling - the ones that had scoring plays added (see Game.reconciled_play_ids) or
+# still don't add up. Playoff game_ids start with the following year, so results are told apart by season_year
+def find_reconciled_games(start_year: int, end_year: int):
+    # games from the game cache aren't parsed, so there'd be nothing to say what was reconciled
+    game_cache.set_cache(None)
+    results = {}
+    for game in f.iter_games_for_years(start_year, end_year + 1):
+        score_matches = game.check_score_integrity()
+        if game.reconciled_play_ids or not score_matches:
+            results[game.game_id] = {'season_year': game.season_year, 'reconciled_play_ids': game.reconciled_play_ids,
+                                     'score_matches': score_matches}
+    return results
+
+
+# a boxscorePbp payload with every scoring play taken out of the drives, leaving them in the scoringPlays block only
+def remove_drive_scoring_plays(raw_data: bytes):
+    drives_end = raw_data.index(b'</drives>')
+    drives = re.sub(rb'<play [^>]*scoringType="[^"]*"[^>]*?(/>|>.*?</play>)', b'', raw_data[:drives_end], flags=re.S)
+    return drives + raw_data[drives_end:]
+
+
+# {case: (Game without details, boxscorePbp payload)} for every case described above
+def fixture_cases():
+    cases = {}
+    for game in fixture_games():
+        raw_data = read_fixture('boxscorePbp/{}.xml'.format(game.game_id))
+        cases[game.game_id] = (game, raw_data)
+        cases['{}@{}'.format(game.game_id, RELOCATED_SEASON)] = (
+            nfl_types.Game(RELOCATED_SEASON, game.season_type, game.game_week, game.home_team, game.away_team,
+                           game.game_id, game.home_score, game.away_score), raw_data)
+        cases['{} without drive scoring plays'.format(game.game_id)] = (game, remove_drive_scoring_plays(raw_data))
+    return cases
+
+
+# what a parsed game's reconciliation came to
+def get_result(game):
+    return {'reconciled_play_ids': game.reconciled_play_ids,
+            'score_matches': game.check_score_integrity(),
+            'scoring_drives': [[x.drive_id, x.scoring_team, x.points] for x in game.drives if x.points]}
+
+
+# {case: {'full': result, 'summary': result}} for every fixture case, each parsed from its own throwaway raw store
+def check_fixture_cases():
+    old_store = raw_store.get_store()
+    game_cache.set_cache(None)
+    results = {}
+    try:
+        for case, (game, raw_data) in fixture_cases().items():
+            with tempfile.TemporaryDirectory() as folder:
+                store = raw_store.FileStore(folder)
+                store.put('boxscorePbp', game.game_id, raw_data)
+                raw_store.set_store(store)
+                results[case] = {'full': get_result(dc.replace(game).get_game_details()),
+                                 'summary': get_result(dc.replace(game).get_game_details(summary=True))}
+    finally:
+        raw_store.set_store(old_store)
+    return results
+
+
+# print every difference between expected and current results, returning how many cases differ
+def compare(expected: dict, current: dict, modes: list = (None,)):
+    changed = 0
+    for case in sorted(set(expected) | set(current)):
+        for mode in modes:
+            got = current.get(case) if mode is None else (current.get(case) or {}).get(mode)
+            if expected.get(case) != got:
+                print('{}{}: expected {}, got {}'.format(case, '' if mode is None else ' ({})'.format(mode),
+                                                       expected.get(case), got))
+                changed += 1
+    return changed
+
+
+def main(args: list):
+    years = [int(x) for x in args if x.isdigit()]
+    if not years:
+        logging.getLogger('nfl_types.py').setLevel(logging.ERROR)
+        current = check_fixture_cases()
+        if '--record' in args:
+            with open(EXPECTED_FILENAME, 'w') as outfile:
+                json.dump({k: v['full'] for k, v in current.items()}, outfile, indent=1, sort_keys=True)
+            print('Recorded {} cases'.format(len(current)))
+            return 0
+        with open(EXPECTED_FILENAME, 'r') as infile:
+            expected = json.load(infile)
+        changed = compare(expected, current, ['full', 'summary'])
+        print('{} cases, {} changed'.format(len(current), changed))
+        return 1 if changed else 0
+
+    if len(years) > 2:
+        print('Expected a season or a start and end season, got {}'.format(years))
+        return 2
+    start_year, end_year = years[0], years[-1]
+    current = find_reconciled_games(start_year, end_year)
+    recorded = {}
+    if os.path.exists(RESULTS_FILENAME):
+        with open(RESULTS_FILENAME, 'r') as infile:
+            # results recorded before season_year was stored can't be told apart by season, so they're dropped
+            recorded = {k: v for k, v in json.load(infile).items() if 'season_year' in v}
+    in_range = {k: v for k, v in recorded.items() if start_year <= v['season_year'] <= end_year}
+    if '--record' in args:
+        recorded = {k: v for k, v in recorded.items() if k not in in_range}
+        recorded.update(current)
+        with open(RESULTS_FILENAME, 'w') as outfile:
+            json.dump(recorded, outfile, indent=1, sort_keys=True)
+        print('Recorded {} reconciled games'.format(len(current)))
+        return 0
+    changed = compare(in_range, current)
+    print('{} reconciled games, {} changed'.format(len(current), changed))
+    return 1 if changed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
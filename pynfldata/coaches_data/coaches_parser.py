@@ -1,6 +1,9 @@
 from pynfldata.data_tools import functions as f
+from pynfldata.data_tools import downloader
+from pynfldata.data_tools import transport
 import xmltodict
 import pandas as pd
+import json
 import logging
 import os
 
@@ -15,12 +18,15 @@ logger.setLevel(logging.DEBUG)
 
 TEAMS_FILENAME = 'output/teams.csv'
 COACHES_FILENAME = 'output/coaches.csv'
+# results fetched so far by an unfinished save_teams_df/save_coaches_df, so a rerun picks up where it stopped
+TEAMS_CHECKPOINT_FILENAME = 'output/teams_checkpoint.json'
+COACHES_CHECKPOINT_FILENAME = 'output/coaches_checkpoint.json'
 
 
 # fetch the list of teams for a given year
 def get_teams_json(team_year: int):
     logger.debug('Getting team data for {}'.format(str(team_year)))
-    url = "http://www.nfl.com/feeds-rs/teams/{year}.xml".format(year=team_year)
+    url = transport.get_url('teams/{year}.xml'.format(year=team_year))
     xml_string = f.download_xml(url, 1)
     data_dict = xmltodict.parse(xml_string)
 
@@ -30,19 +36,57 @@ def get_teams_json(team_year: int):
 # fetch coach info for a given team/year
 def get_coaches_json(team_year: int, team_id: int):
     logger.debug('Getting coach info for {team:04}, {year:04}'.format(team=team_id, year=team_year))
-    url = "http://www.nfl.com/feeds-rs/coach/byTeam/{team:04}/{year:04}".format(team=team_id, year=team_year)
+    url = transport.get_url('coach/byTeam/{team:04}/{year:04}'.format(team=team_id, year=team_year))
     xml_string = f.download_xml(url, 1)
     data_dict = xmltodict.parse(xml_string)
 
     return [data_dict['coach']]
 
 
+# call func(*item) for every item (a tuple of ints) that isn't in the checkpoint file yet, concurrently within the
+# shared rate limit. Each chunk's results are appended to the checkpoint as one line per item as soon as the chunk is
+# done, so an interrupted run only loses the chunk in flight. Returns {item: result} for every item
+def _fetch_with_checkpoint(func, items: list, checkpoint_filename: str, chunk_size: int = 50):
+    done = {}
+    if os.path.isfile(checkpoint_filename):
+        with open(checkpoint_filename) as fh:
+            for line in fh:
+                try:
+                    entry = json.loads(line)
+                except ValueError:  # the last line of a run that was killed mid-write
+                    continue
+                done[tuple(entry['item'])] = entry['result']
+
+    todo = [x for x in items if x not in done]
+    logger.info('{} of {} already fetched, fetching {}'.format(len(items) - len(todo), len(items), len(todo)))
+    os.makedirs(os.path.dirname(checkpoint_filename), exist_ok=True)
+    with open(checkpoint_filename, 'ab') as fh:
+        # make sure a half-written last line doesn't swallow the first new one
+        if fh.tell() > 0:
+            with open(checkpoint_filename, 'rb') as last:
+                last.seek(-1, os.SEEK_END)
+                if last.read(1) != b'\n':
+                    fh.write(b'\n')
+
+        for i in range(0, len(todo), chunk_size):
+            chunk = todo[i:i + chunk_size]
+            results = downloader.get_downloader().map(lambda x: func(*x), chunk)
+            for item, result in zip(chunk, results):
+                fh.write((json.dumps({'item': list(item), 'result': result}) + '\n').encode())
+                done[item] = result
+            fh.flush()
+
+    return {item: done[item] for item in items}
+
+
 # primary function to get and save basic raw teams data
 def save_teams_df():
     # for each year, get the list of teams for that year
+    years = [(year,) for year in range(1969, 2020)]
+    teams_by_year = _fetch_with_checkpoint(get_teams_json, years, TEAMS_CHECKPOINT_FILENAME)
     teams_list = []
-    for year in range(1969, 2020):
-        teams_list += get_teams_json(year)
+    for year in years:
+        teams_list += teams_by_year[year]
 
     df = pd.DataFrame().from_dict(teams_list)
 
@@ -55,6 +99,7 @@ def save_teams_df():
     df = df.set_index(['season', 'teamId'])
 
     df.to_csv(TEAMS_FILENAME)
+    os.remove(TEAMS_CHECKPOINT_FILENAME)
 
 
 # function to read the teams data if it exists and generate it if not
@@ -69,17 +114,16 @@ def get_teams_data():
 def save_coaches_df():
     teams_df = get_teams_data().set_index(['season', 'teamId'])
 
-    team_list = [x[0] for x in teams_df.iterrows()]  # every team/year combo
-
-    for team_tuple in team_list:
-        raw_coach_data = get_coaches_json(team_tuple[0], team_tuple[1])
-        logger.debug('Coaches found: {}'.format(str(len(raw_coach_data))))
+    team_list = [(int(x[0]), int(x[1])) for x in teams_df.index]  # every team/year combo
+    coaches_by_team = _fetch_with_checkpoint(get_coaches_json, team_list, COACHES_CHECKPOINT_FILENAME)
 
-        coach_data = raw_coach_data[0]
-        teams_df.loc[team_tuple, 'coachName'] = coach_data['@displayName']
-        teams_df.loc[team_tuple, 'coachNFLID'] = coach_data['@nflId']
+    # set the coach columns in one go, rather than a cell at a time
+    coach_data = [coaches_by_team[x][0] for x in team_list]
+    teams_df['coachName'] = [x['@displayName'] for x in coach_data]
+    teams_df['coachNFLID'] = [x['@nflId'] for x in coach_data]
 
     teams_df.to_csv(COACHES_FILENAME)
+    os.remove(COACHES_CHECKPOINT_FILENAME)
 
 
 # function to read the coaches data if it exists and generate it if not
@@ -0,0 +1,234 @@
+"""Staged asyncio pipeline for getting games, so downloading and parsing overlap instead of running one after the other
+
+    schedule -> scores -> boxscorePbp fetch -> parse -> output
+
+Each stage runs its own number of concurrent tasks (see DEFAULT_CONCURRENCY) and hands work to the next through a
+bounded queue, so a slow stage holds back the ones before it. Network and disk work runs on a thread pool - requests
+still go through the shared downloader and its rate limit - and parsing on a single thread, or on a process pool when
+the parse concurrency is over 1, like functions.iter_parse_games. At most window games are between admission to the
+fetch stage and output at any time, so memory stays capped however far ahead the network gets.
+
+Games come out in the same order, and as the same Game objects (or export() dicts), as functions.iter_games_for_years
+gives, so callers can swap one for the other:
+
+    for game_dict in async_pipeline.iter_games_for_years(2009, 2019, export=True, concurrency={'fetch': 16}):
+        writer.write(game_dict)
+
+iter_games() is the general version, yielding (game, result, failure) for every game, and iter_games_async() is the
+same as an async generator for use from a running event loop.
+"""
+import asyncio
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import functools
+import threading
+from pynfldata.data_tools import feed_cache
+from pynfldata.data_tools import functions as f
+from pynfldata.data_tools import game_cache
+from pynfldata.data_tools import metrics
+from pynfldata.data_tools import raw_store
+
+# number of concurrent tasks for each stage. parse > 1 parses on that many worker processes
+DEFAULT_CONCURRENCY = {'schedule': 1, 'scores': 4, 'fetch': 8, 'parse': 1}
+DEFAULT_QUEUE_SIZE = 16
+DEFAULT_WINDOW = 64
+
+
+class _Pipeline:
+    def __init__(self, years: list, export: bool = False, summary: bool = False, exclude: set = frozenset(),
+                 skip=None, concurrency: dict = None, queue_size: int = DEFAULT_QUEUE_SIZE,
+                 window: int = DEFAULT_WINDOW):
+        self.years = list(years)
+        self.export = export
+        self.summary = summary
+        self.exclude = exclude
+        self.skip = skip
+        self.concurrency = dict(DEFAULT_CONCURRENCY, **(concurrency or {}))
+        self.queue_size = queue_size
+        self.window = window
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        io_workers = self.concurrency['schedule'] + self.concurrency['scores'] + self.concurrency['fetch']
+        self._io_executor = ThreadPoolExecutor(max_workers=io_workers)
+        if self.concurrency['parse'] > 1:
+            self._parse_executor = ProcessPoolExecutor(max_workers=self.concurrency['parse'],
+                                                       initializer=f._init_parse_worker,
+                                                       initargs=(raw_store.get_store(), metrics.get_profile_game(),
+                                                                 game_cache.get_cache()))
+            self._parse = functools.partial(f._parse_game_in_worker, export=self.export, summary=self.summary)
+        else:
+            self._parse_executor = ThreadPoolExecutor(max_workers=1)
+            self._parse = functools.partial(f._parse_game, export=self.export, summary=self.summary)
+
+        # every year, week and game gets a future as soon as it's known, resolved when its stage is done with it
+        self._year_futures = [loop.create_future() for _ in self.years]
+        self._year_queue = asyncio.Queue()
+        for item in zip(self.years, self._year_futures):
+            self._year_queue.put_nowait(item)
+        self._week_queue = asyncio.Queue(self.queue_size)
+        self._fetch_queue = asyncio.Queue(self.queue_size)
+        self._parse_queue = asyncio.Queue(self.queue_size)
+        self._output_queue = asyncio.Queue()
+        self._window = asyncio.Semaphore(self.window)
+        self._finalizers = []
+
+        stages = [(self._schedule_stage, 'schedule'), (self._scores_stage, 'scores'), (self._fetch_stage, 'fetch'),
+                  (self._parse_stage, 'parse')]
+        tasks = [asyncio.ensure_future(stage()) for stage, name in stages for _ in range(self.concurrency[name])]
+        tasks.append(asyncio.ensure_future(self._admit()))
+        try:
+            while True:
+                game_future = await self._output_queue.get()
+                if game_future is None:
+                    break
+                item = await game_future
+                self._window.release()
+                yield item
+            await asyncio.gather(*self._finalizers)
+        finally:
+            for task in tasks + self._finalizers:
+                task.cancel()
+            await asyncio.gather(*tasks, *self._finalizers, return_exceptions=True)
+            # games still in flight after an error or an early exit are dropped, errors included
+            while not self._output_queue.empty():
+                game_future = self._output_queue.get_nowait()
+                if game_future is not None and not game_future.cancel():
+                    game_future.exception()
+            self._io_executor.shutdown(wait=True)
+            self._parse_executor.shutdown(wait=True)
+
+    def _in_thread(self, func, *args):
+        return asyncio.get_running_loop().run_in_executor(self._io_executor, func, *args)
+
+    # get a year's schedule and queue up its weeks for the scores stage
+    async def _schedule_stage(self):
+        while True:
+            year, year_future = await self._year_queue.get()
+            try:
+                with metrics.timer('schedule'):
+                    schedule_url, weeks = await self._in_thread(f.get_schedule_weeks, year)
+                week_futures = [asyncio.get_running_loop().create_future() for _ in weeks]
+                year_future.set_result(week_futures)
+            except Exception as e:
+                year_future.set_exception(e)
+                continue
+            self._finalizers.append(asyncio.ensure_future(self._mark_final(schedule_url, week_futures)))
+            for item in zip(weeks, week_futures):
+                await self._week_queue.put(item)
+
+    # once every week of a year has been fetched, check whether its schedule can be cached for good, like
+    # functions.get_games_from_schedule does
+    async def _mark_final(self, schedule_url: str, week_futures: list):
+        weeks = await asyncio.gather(*week_futures)
+        if all(num_final == num_scheduled for _, num_final, num_scheduled in weeks):
+            await self._in_thread(feed_cache.mark_final, schedule_url)
+
+    # get a week's scores and resolve the week to its finished games
+    async def _scores_stage(self):
+        while True:
+            week, week_future = await self._week_queue.get()
+            try:
+                scores = await self._in_thread(f.get_game_score, *week)
+                games = f.get_final_games(scores)
+                week_future.set_result((f.filter_games(games, self.exclude), len(games), len(scores)))
+            except Exception as e:
+                week_future.set_exception(e)
+
+    # walk years, weeks and games in order, admitting games to the fetch stage as the window allows. Admitting in
+    # order means the earliest games are always the ones in flight, so the output can't wait on a game stuck behind
+    # later ones
+    async def _admit(self):
+        try:
+            for year_future in self._year_futures:
+                for week_future in await year_future:
+                    games, _, _ = await week_future
+                    for game in games:
+                        await self._window.acquire()
+                        game_future = asyncio.get_running_loop().create_future()
+                        await self._output_queue.put(game_future)
+                        await self._fetch_queue.put((game, game_future))
+        except Exception as e:
+            # hand the error to the output, which raises it once it gets there
+            failed = asyncio.get_running_loop().create_future()
+            failed.set_exception(e)
+            await self._output_queue.put(failed)
+        await self._output_queue.put(None)
+
+    # make sure a game's raw data is stored locally, downloading it if not. Games that are in the game cache don't
+    # need it, and games the skip function turns down are passed straight to the output
+    def _fetch(self, game):
+        if self.skip is not None:
+            return self.skip(game, f.get_raw_data(game.url, 2))
+        cache = game_cache.get_cache()
+        if cache is None or not cache.contains([game]):
+            f.fetch_data(game.url, 2)
+        return False
+
+    async def _fetch_stage(self):
+        while True:
+            game, game_future = await self._fetch_queue.get()
+            try:
+                if await self._in_thread(self._fetch, game):
+                    game_future.set_result((game, None, None))
+                    continue
+            except Exception as e:
+                game_future.set_exception(e)
+                continue
+            await self._parse_queue.put((game, game_future))
+
+    async def _parse_stage(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            game, game_future = await self._parse_queue.get()
+            try:
+                parsed = await loop.run_in_executor(self._parse_executor, self._parse, game)
+            except Exception as e:
+                game_future.set_exception(e)
+                continue
+            if len(parsed) == 3:
+                metrics.merge(parsed[2])
+            game_future.set_result((game, parsed[0], parsed[1]))
+
+
+# async generator of (game, result, failure) for every finished game of the given years, in schedule order.
+# result is the parsed Game (or its export() dict), failure a (game_id, error) tuple for a game that couldn't be parsed.
+# Games in exclude, the pro bowl and known bad games are left out, like functions.get_season_games does.
+# skip(game, raw_data) is called in the fetch stage, e.g. to check a build manifest - games it returns True for aren't
+# parsed and come out as (game, None, None).
+# concurrency sets the number of tasks per stage (see DEFAULT_CONCURRENCY), queue_size the size of the queues between
+# them and window the number of games allowed between admission and output
+def iter_games_async(years: list, export: bool = False, summary: bool = False, exclude: set = frozenset(),
+                     skip=None, concurrency: dict = None, queue_size: int = DEFAULT_QUEUE_SIZE,
+                     window: int = DEFAULT_WINDOW):
+    return _Pipeline(years, export, summary, exclude, skip, concurrency, queue_size, window).run()
+
+
+# iter_games_async as a normal generator. The pipeline runs on an event loop in a background thread, so it keeps
+# fetching and parsing while the caller works on what it has been given
+def iter_games(years: list, **kwargs):
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    games = iter_games_async(years, **kwargs)
+    try:
+        while True:
+            try:
+                yield asyncio.run_coroutine_threadsafe(games.__anext__(), loop).result()
+            except StopAsyncIteration:
+                return
+    finally:
+        asyncio.run_coroutine_threadsafe(games.aclose(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+
+
+# drop-in for functions.iter_games_for_years: yield Game objects (or their export() dicts) in schedule order,
+# logging games that can't be parsed and appending their (game_id, error) tuples to failures if given
+def iter_games_for_years(start_year: int, end_year: int, export: bool = False, summary: bool = False,
+                         failures: list = None, **kwargs):
+    for game, result, failure in iter_games(range(start_year, end_year), export=export, summary=summary, **kwargs):
+        if failure is not None:
+            f.log_failure(failure, failures)
+        else:
+            yield result
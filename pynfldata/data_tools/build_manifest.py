@@ -0,0 +1,190 @@
+"""Manifest of built games, so reruns only reparse games that are new or changed
+
+For every game_id the manifest records a hash of the game's inputs (its raw boxscorePbp data plus the schedule and score
+fields that go into the export), the parser version and the output file it was written to. A game is only parsed again
+when one of those changes, and a season's output is only rewritten when at least one of its games changed - any
+unchanged games' lines are copied over from the existing output as they are.
+
+The parser version is a hash of the source of the modules that decide what a game's output line looks like, so editing
+the parsing logic invalidates every entry without having to remember to bump anything.
+"""
+import contextlib
+import functools
+import hashlib
+import json
+import logging
+import os
+from pynfldata.data_tools import async_pipeline
+from pynfldata.data_tools import functions as f
+from pynfldata.data_tools import game_cache
+from pynfldata.data_tools import ndjson_writer
+from pynfldata.data_tools import nfl_types
+from pynfldata.data_tools import pbp_parser
+from pynfldata.data_tools import team_functions
+
+# setup logging
+logger = logging.getLogger('build_manifest.py')
+handler = logging.StreamHandler()
+formatter = logging.Formatter('%(asctime)s %(levelname)-8s %(message)s')
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+logger.setLevel(logging.INFO)
+
+PARSER_MODULES = [nfl_types, pbp_parser, team_functions, ndjson_writer]
+
+
+# hash of the source of PARSER_MODULES
+@functools.lru_cache(maxsize=None)
+def get_parser_version():
+    return game_cache.get_source_hash(PARSER_MODULES)
+
+
+# hash of everything a game's output is built from - its raw data and the fields that come from schedule/scores
+def get_input_hash(game, raw_data):
+    h = hashlib.sha1(raw_data if isinstance(raw_data, bytes) else raw_data.encode())
+    h.update(repr((game.season_year, game.season_type, game.game_week, game.home_team, game.away_team,
+                   game.home_score, game.away_score)).encode())
+    return h.hexdigest()
+
+
+class BuildManifest:
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.games = {}
+        if os.path.exists(filename):
+            with open(filename) as fh:
+                self.games = json.load(fh)['games']
+
+    # forget everything, so the next build parses every game again
+    def clear(self):
+        self.games = {}
+
+    # True if game_id was last built from the same inputs, by the same parser, into output
+    def is_current(self, game_id: str, input_hash: str, output: str):
+        entry = self.games.get(game_id)
+        return (entry is not None and entry['input_hash'] == input_hash and entry['output'] == output
+                and entry['parser_version'] == get_parser_version())
+
+    # failed games are remembered too, so they aren't retried until their inputs or the parser change
+    def record(self, game_id: str, input_hash: str, output: str, failed: bool = False):
+        self.games[game_id] = {'input_hash': input_hash, 'parser_version': get_parser_version(), 'output': output,
+                               'failed': failed}
+
+    # game_ids recorded as written to output
+    def get_output_games(self, output: str):
+        return [k for k, v in self.games.items() if v['output'] == output]
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.filename) or '.', exist_ok=True)
+        folder, name = os.path.split(self.filename)
+        temp_filename = os.path.join(folder or '.', '.{}.tmp'.format(name))
+        with open(temp_filename, 'w') as fh:
+            json.dump({'games': self.games}, fh, indent=1, sort_keys=True)
+        os.replace(temp_filename, self.filename)
+
+
+# reads an existing output file's lines alongside the schedule, one at a time. The output was written in schedule
+# order, so a game's line is normally the next one in the file - lines passed over on the way (games that are being
+# reparsed or are no longer scheduled) are kept only in case a game turns up out of order
+class _ExistingLines:
+    def __init__(self, filename: str):
+        self._lines = ndjson_writer.iter_lines(filename) if os.path.exists(filename) else iter(())
+        self._skipped = {}
+
+    # the existing line for game_id, or None if the file doesn't have one
+    def get(self, game_id: str):
+        if game_id in self._skipped:
+            return self._skipped.pop(game_id)
+        for line_game_id, line in self._lines:
+            if line_game_id == game_id:
+                return line
+            self._skipped[line_game_id] = line
+        return None
+
+    def close(self):
+        if hasattr(self._lines, 'close'):
+            self._lines.close()
+
+
+# build (or patch) one season's NDJSON output, parsing only games that changed since the manifest was written.
+# returns the number of games parsed, or None if the output was already up to date and wasn't touched.
+# pipeline gets the games through async_pipeline instead, with the given options (e.g. {'concurrency': {'fetch': 16}})
+def build_season_json(year: int, filename: str, manifest: BuildManifest, compress: bool = False, workers: int = 1,
+                      pipeline: dict = None):
+    if pipeline is not None:
+        concurrency = dict({'parse': workers}, **pipeline.get('concurrency', {}))
+        return _build_season_json_pipelined(year, filename, manifest, compress, dict(pipeline, concurrency=concurrency))
+
+    games = f.get_season_games(year)
+    # only hashes and game_ids are held for the whole season - existing lines are streamed in while writing
+    input_hashes = {g.game_id: get_input_hash(g, f.get_raw_data(g.url)) for g in games}
+    existing_ids = ndjson_writer.read_game_ids(filename) if os.path.exists(filename) else set()
+
+    # a game needs parsing if its inputs or the parser changed, or its line went missing from the output
+    changed = [g for g in games
+               if not manifest.is_current(g.game_id, input_hashes[g.game_id], filename)
+               or (g.game_id not in existing_ids and not manifest.games[g.game_id]['failed'])]
+    stale = set(manifest.get_output_games(filename)) - set(input_hashes)
+    if not changed and not stale and os.path.exists(filename):
+        return None
+
+    for game_id in stale:
+        del manifest.games[game_id]
+
+    # write the season in schedule order, like a full build would, parsing changed games as they come up
+    changed_ids = set(g.game_id for g in changed)
+    parsed = f.iter_parse_games(changed, workers, export=True)
+    with ndjson_writer.NDJSONWriter(filename, compress) as writer, \
+            contextlib.closing(_ExistingLines(filename)) as existing_lines:
+        for g in games:
+            if g.game_id in changed_ids:
+                result, failure = next(parsed)
+                if failure is not None:
+                    f.log_failure(failure)
+                else:
+                    writer.write(result)
+                manifest.record(g.game_id, input_hashes[g.game_id], filename, failed=failure is not None)
+            elif not manifest.games[g.game_id]['failed']:
+                writer.write_line(existing_lines.get(g.game_id))
+    manifest.save()
+    logger.info('Parsed {} of {} games for {}'.format(len(changed), len(games), year))
+    return len(changed)
+
+
+# build_season_json on async_pipeline - whether a game changed is checked in the pipeline's fetch stage, so unchanged
+# games are never parsed, and the output is written as games come out of it
+def _build_season_json_pipelined(year: int, filename: str, manifest: BuildManifest, compress: bool, pipeline: dict):
+    existing_ids = ndjson_writer.read_game_ids(filename) if os.path.exists(filename) else set()
+    input_hashes = {}
+
+    # a game needs parsing if its inputs or the parser changed, or its line went missing from the output
+    def is_unchanged(game, raw_data):
+        input_hashes[game.game_id] = get_input_hash(game, raw_data)
+        return (manifest.is_current(game.game_id, input_hashes[game.game_id], filename)
+                and (game.game_id in existing_ids or manifest.games[game.game_id]['failed']))
+
+    num_parsed = 0
+    with ndjson_writer.NDJSONWriter(filename, compress) as writer, \
+            contextlib.closing(_ExistingLines(filename)) as existing_lines:
+        for game, result, failure in async_pipeline.iter_games([year], export=True, skip=is_unchanged, **pipeline):
+            if result is None and failure is None:
+                if not manifest.games[game.game_id]['failed']:
+                    writer.write_line(existing_lines.get(game.game_id))
+                continue
+            num_parsed += 1
+            if failure is not None:
+                f.log_failure(failure)
+            else:
+                writer.write(result)
+            manifest.record(game.game_id, input_hashes[game.game_id], filename, failed=failure is not None)
+
+        stale = set(manifest.get_output_games(filename)) - set(input_hashes)
+        if not num_parsed and not stale and os.path.exists(filename):
+            writer.discard()
+            return None
+
+    for game_id in stale:
+        del manifest.games[game_id]
+    manifest.save()
+    logger.info('Parsed {} of {} games for {}'.format(num_parsed, len(input_hashes), year))
+    return num_parsed
@@ -0,0 +1,180 @@
+"""Columnar alternative to Game.export
+
+ColumnarBuilder appends each game's drives and plays to typed column buffers (array.array, plus a null mask for
+nullable ints) instead of building nested dicts. Games point into the drives table and drives into the plays table with
+offset arrays, so the game -> drive -> play nesting can still be recovered. to_arrays() returns NumPy arrays and
+to_frames() flat pandas DataFrames with nullable Int and categorical columns.
+
+Clock and field position come as numbers as well as the quarter/clock strings, so situational filters are plain
+vectorized comparisons, e.g. drives starting inside their own 20 in the last 2 minutes of a half:
+
+    games, drives, plays = games_to_frames(games)
+    drives[(drives.drive_start_half_seconds_remaining <= 120) & (drives.drive_start_yards_to_end_zone >= 80)]
+
+Games can be added one at a time across a whole season; call to_frames(reset=True) to emit what has been built so far
+and start fresh, e.g. once per week.
+"""
+from array import array
+import numpy as np
+import pandas as pd
+from pynfldata.data_tools import nfl_types
+
+# (column, array typecode) for the numeric columns of each table. Nullable columns also get a mask buffer
+_GAME_INT_COLUMNS = [('season_year', 'h'), ('game_week', 'h'), ('home_score', 'h'), ('away_score', 'h')]
+_GAME_STR_COLUMNS = ['game_id', 'season_type', 'home_team', 'away_team']
+_DRIVE_INT_COLUMNS = [('drive_id', 'h'), ('drive_start', 'b'), ('drive_start_quarter', 'b'),
+                      ('drive_start_yards_to_end_zone', 'b'), ('drive_start_game_seconds_elapsed', 'h'),
+                      ('drive_start_game_seconds_remaining', 'h'), ('drive_start_half', 'b'),
+                      ('drive_start_half_seconds_remaining', 'h'), ('drive_num_plays', 'h'), ('drive_points', 'b')]
+_DRIVE_STR_COLUMNS = ['drive_pos_team', 'drive_start_clock', 'drive_scoring_team']
+_PLAY_INT_COLUMNS = [('play_id', 'l'), ('yardline', 'b'), ('yards_to_end_zone', 'b'), ('quarter', 'b'),
+                     ('game_seconds_elapsed', 'h'), ('game_seconds_remaining', 'h'), ('half', 'b'),
+                     ('half_seconds_remaining', 'h'), ('down', 'b'), ('yards_to_go', 'h'), ('yards', 'h'),
+                     ('points', 'b')]
+_PLAY_BOOL_COLUMNS = ['penalty', 'real_play']
+_PLAY_STR_COLUMNS = ['pos_team', 'play_type', 'scoring_team', 'description']
+
+# string columns with few distinct values, returned as pandas categoricals
+_CATEGORICAL_COLUMNS = {'season_type', 'home_team', 'away_team', 'drive_pos_team', 'drive_scoring_team',
+                        'drive_start_clock', 'pos_team', 'play_type', 'scoring_team'}
+
+
+# a nullable int column - values plus a mask of which ones are missing
+class _IntColumn:
+    def __init__(self, typecode: str):
+        self.values = array(typecode)
+        self.mask = array('b')
+
+    def append(self, value):
+        if value is None:
+            self.values.append(0)
+            self.mask.append(1)
+        else:
+            self.values.append(value)
+            self.mask.append(0)
+
+    def to_numpy(self):
+        return np.ma.MaskedArray(_to_numpy(self.values), _to_numpy(self.mask).astype(bool))
+
+
+# copy an array.array into NumPy. A copy rather than a view, so the buffer can keep growing afterwards
+def _to_numpy(values: array):
+    return np.array(values, dtype=values.typecode)
+
+
+class ColumnarBuilder:
+    def __init__(self, descriptions: bool = True):
+        self.descriptions = descriptions
+        self.reset()
+
+    # drop everything built so far
+    def reset(self):
+        self.games = {name: _IntColumn(code) for name, code in _GAME_INT_COLUMNS}
+        self.games.update({name: [] for name in _GAME_STR_COLUMNS})
+        self.drives = {name: _IntColumn(code) for name, code in _DRIVE_INT_COLUMNS}
+        self.drives.update({name: [] for name in _DRIVE_STR_COLUMNS})
+        self.plays = {name: _IntColumn(code) for name, code in _PLAY_INT_COLUMNS}
+        self.plays.update({name: array('b') for name in _PLAY_BOOL_COLUMNS})
+        self.plays.update({name: [] for name in _PLAY_STR_COLUMNS if name != 'description' or self.descriptions})
+        # drive_offsets[i]:drive_offsets[i+1] are game i's drives, play_offsets the same for a drive's plays
+        self.drive_offsets = array('l', [0])
+        self.play_offsets = array('l', [0])
+
+    def __len__(self):
+        return len(self.drive_offsets) - 1
+
+    # append one game (with details already fetched) to the column buffers. A summary game (see
+    # Game.get_game_details) adds its drives without any play rows
+    def add_game(self, game):
+        g = self.games
+        g['game_id'].append(game.game_id)
+        g['season_year'].append(game.season_year)
+        g['season_type'].append(game.season_type)
+        g['game_week'].append(game.game_week)
+        g['home_team'].append(game.home_team)
+        g['away_team'].append(game.away_team)
+        g['home_score'].append(nfl_types._int_or_none(game.home_score))
+        g['away_score'].append(nfl_types._int_or_none(game.away_score))
+
+        d = self.drives
+        p = self.plays
+        for drive in game.drives:
+            # the same fields the other exports write, see nfl_types._drive_record, plus the drive start quarter/clock
+            drive_record = nfl_types._drive_record(drive, True, self.descriptions)
+            drive_record['drive_start_quarter'] = nfl_types._int_or_none(drive.start_quarter)
+            drive_record['drive_start_clock'] = drive.start_quarter_clock
+            for name, column in d.items():
+                column.append(drive_record[name])
+
+            if 'plays' not in drive_record:
+                self.play_offsets.append(len(p['penalty']))
+                continue
+            for play, play_record in zip(drive.plays, drive_record['plays']):
+                play_record['yardline'] = play.yard_int
+                play_record['pos_team'] = play.pos_team
+                play_record['quarter'] = nfl_types._int_or_none(play.quarter)
+                for name, column in p.items():
+                    column.append(play_record[name])
+
+            self.play_offsets.append(len(p['penalty']))
+        self.drive_offsets.append(len(self.play_offsets) - 1)
+
+    def add_games(self, games):
+        for game in games:
+            self.add_game(game)
+        return self
+
+    # return {'games': {...}, 'drives': {...}, 'plays': {...}, 'drive_offsets': ..., 'play_offsets': ...} of NumPy
+    # arrays. Nullable ints come back as masked arrays, strings as object arrays
+    def to_arrays(self):
+        tables = {}
+        for table_name, table in (('games', self.games), ('drives', self.drives), ('plays', self.plays)):
+            columns = {}
+            for name, column in table.items():
+                if isinstance(column, _IntColumn):
+                    columns[name] = column.to_numpy()
+                elif isinstance(column, array):
+                    columns[name] = _to_numpy(column).astype(bool)
+                else:
+                    columns[name] = np.array(column, dtype=object)
+            tables[table_name] = columns
+        tables['drive_offsets'] = _to_numpy(self.drive_offsets)
+        tables['play_offsets'] = _to_numpy(self.play_offsets)
+        return tables
+
+    # return flat (games, drives, plays) DataFrames. drives and plays carry game_id (and drive_id) for joining
+    def to_frames(self, reset: bool = False):
+        arrays = self.to_arrays()
+        drives_per_game = np.diff(arrays['drive_offsets'])
+        plays_per_drive = np.diff(arrays['play_offsets'])
+
+        game_ids = arrays['games']['game_id']
+        arrays['drives']['game_id'] = np.repeat(game_ids, drives_per_game)
+        arrays['plays']['game_id'] = np.repeat(arrays['drives']['game_id'], plays_per_drive)
+        arrays['plays']['drive_id'] = np.repeat(arrays['drives']['drive_id'], plays_per_drive)
+
+        frames = []
+        for table_name, first_columns in (('games', ['game_id']),
+                                          ('drives', ['game_id', 'drive_id']),
+                                          ('plays', ['game_id', 'drive_id', 'play_id'])):
+            table = arrays[table_name]
+            order = first_columns + [x for x in table if x not in first_columns]
+            frames.append(pd.DataFrame({name: _to_series_values(name, table[name]) for name in order}))
+
+        if reset:
+            self.reset()
+        return tuple(frames)
+
+
+# convert one NumPy column into the pandas array type used in the frames
+def _to_series_values(name: str, values):
+    if isinstance(values, np.ma.MaskedArray):
+        return pd.arrays.IntegerArray(values.data, values.mask)
+    if name in _CATEGORICAL_COLUMNS:
+        return pd.Categorical(values)
+    return values
+
+
+# convenience - build (games, drives, plays) frames for a list of games
+def games_to_frames(games: list, descriptions: bool = True):
+    return ColumnarBuilder(descriptions).add_games(games).to_frames()
@@ -0,0 +1,270 @@
+"""Season-wide data quality checks over flattened games, drives and plays
+
+The checks run on the (games, drives, plays) frames columnar.ColumnarBuilder builds, a whole season (or more) at a time,
+as pandas groupby/vectorized operations rather than per game while parsing. Every problem found is one row of the issues
+DataFrame (see ISSUE_COLUMNS), with a check from CHECKS:
+    score_mismatch          a team's final score doesn't match the points its scoring plays add up to
+    missing_field           a game is missing a schedule or score field
+    duplicate_play_id       a play_id shows up more than once in a game
+    drive_without_start     a drive with real plays has no start yardline or clock
+    multiple_scoring_teams  more than one team scored on a drive
+    unknown_team            a drive's possession team or a scoring team isn't one of the game's teams
+    stale_team_abbr         a team abbr isn't the one the franchise used that season (see team_functions)
+    parse_failure           the game couldn't be parsed at all
+
+Games with an error-level issue go on the machine-maintained exclusion list that functions.filter_games leaves out,
+alongside the hand-kept functions.bad_games. validate_seasons() parses, checks and updates everything in one go:
+
+    report = data_quality.validate_seasons(2009, 2019, workers=4)
+    report['issues']    # number of issues per check
+"""
+import json
+import logging
+import os
+import pandas as pd
+from pynfldata.data_tools import columnar
+from pynfldata.data_tools import functions as f
+from pynfldata.data_tools import metrics
+from pynfldata.data_tools import team_functions
+
+# setup logging
+logger = logging.getLogger('data_quality.py')
+handler = logging.StreamHandler()
+formatter = logging.Formatter('%(asctime)s %(levelname)-8s %(message)s')
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+logger.setLevel(logging.INFO)
+
+# check -> severity. Games with an 'error' issue are excluded from builds
+CHECKS = {'score_mismatch': 'error',
+          'missing_field': 'error',
+          'duplicate_play_id': 'warning',
+          'drive_without_start': 'error',
+          'multiple_scoring_teams': 'warning',
+          'unknown_team': 'error',
+          'stale_team_abbr': 'warning',
+          'parse_failure': 'error'}
+ISSUE_COLUMNS = ['check', 'severity', 'season_year', 'game_id', 'drive_id', 'detail']
+DEFAULT_REPORT_FILENAME = 'output/data_quality.json'
+
+
+# issues rows for one check. frame holds game_id and season_year, plus drive_id for drive-level checks
+def _issues(check: str, frame: pd.DataFrame, detail):
+    return pd.DataFrame({'check': check,
+                         'severity': CHECKS[check],
+                         'season_year': frame['season_year'].to_numpy(),
+                         'game_id': frame['game_id'].astype(object).to_numpy(),
+                         'drive_id': frame['drive_id'].to_numpy() if 'drive_id' in frame else None,
+                         'detail': pd.Series(detail, index=frame.index).astype(str).to_numpy()},
+                        columns=ISSUE_COLUMNS)
+
+
+# team column as the franchise's current abbr, so abbr changes don't count as different teams - not even an abbr
+# used outside its seasons, like JAC in 2019, which check_stale_team_abbr reports instead.
+# Only a handful of distinct (abbr, season) pairs, so those are looked up one by one
+def _franchise(frame: pd.DataFrame, column: str):
+    teams = frame[[column, 'season_year']].astype({column: object})
+    pairs = teams.dropna().drop_duplicates()
+    franchises = pd.Series([team_functions.get_nearest_franchise_abbr(team, year)
+                            for team, year in zip(pairs[column], pairs['season_year'])],
+                           index=pd.MultiIndex.from_frame(pairs), dtype=object)
+    return pd.Series(franchises.reindex(pd.MultiIndex.from_frame(teams)).to_numpy(), index=frame.index, name=column)
+
+
+# scoring plays with their game's season_year and the scoring team as a franchise abbr
+def _get_scoring_plays(games: pd.DataFrame, plays: pd.DataFrame):
+    scored = plays.loc[plays['points'].notna(), ['game_id', 'drive_id', 'play_id', 'scoring_team', 'points']]
+    scored = scored.merge(games[['game_id', 'season_year']], on='game_id')
+    scored['team'] = _franchise(scored, 'scoring_team')
+    return scored
+
+
+# each team's final score against the points its scoring plays add up to
+def check_score_mismatch(games: pd.DataFrame, scored: pd.DataFrame):
+    teams = pd.concat([games[['game_id', 'season_year']].assign(team=games['home_team'], score=games['home_score']),
+                       games[['game_id', 'season_year']].assign(team=games['away_team'], score=games['away_score'])])
+    # games missing a team or score are reported by check_missing_field
+    teams = teams[teams['score'].notna() & teams['team'].notna()]
+    teams['team'] = _franchise(teams, 'team')
+    points = scored.groupby(['game_id', 'team'])['points'].sum().rename('play_points').reset_index()
+    teams = teams.merge(points, on=['game_id', 'team'], how='left')
+    teams['play_points'] = teams['play_points'].fillna(0)
+    bad = teams[teams['score'] != teams['play_points']]
+    return _issues('score_mismatch', bad, bad['team'].astype(str) + ' scored ' + bad['score'].astype(str) +
+                   ', plays add up to ' + bad['play_points'].astype(str))
+
+
+# games missing any schedule or score field, like Game.is_valid
+def check_missing_field(games: pd.DataFrame):
+    missing = games.isna()
+    rows = missing.any(axis=1)
+    return _issues('missing_field', games[rows],
+                   [', '.join(games.columns[x]) for x in missing[rows].to_numpy()])
+
+
+# play_ids that show up more than once in a game - reported against the first drive holding them
+def check_duplicate_play_id(games: pd.DataFrame, plays: pd.DataFrame):
+    counts = plays.groupby(['game_id', 'play_id'], sort=False).agg(drive_id=('drive_id', 'first'),
+                                                                   count=('drive_id', 'size')).reset_index()
+    bad = counts[counts['count'] > 1].merge(games[['game_id', 'season_year']], on='game_id')
+    return _issues('duplicate_play_id', bad,
+                   'play_id ' + bad['play_id'].astype(str) + ' appears ' + bad['count'].astype(str) + ' times')
+
+
+# drives with real plays other than a kickoff but no start yardline or clock. Drives that are just a kickoff (and
+# timeouts etc.) have no start by design - see Drive._scan_plays
+def check_drive_without_start(drives: pd.DataFrame, plays: pd.DataFrame):
+    no_start = drives.loc[drives['drive_start'].isna() | drives['drive_start_quarter'].isna(),
+                          ['game_id', 'season_year', 'drive_id']]
+    real = plays.loc[plays['real_play'] & (plays['play_type'] != 'KICK_OFF'), ['game_id', 'drive_id']]
+    real = real.groupby(['game_id', 'drive_id']).size().rename('real_plays').reset_index()
+    bad = no_start.merge(real, on=['game_id', 'drive_id'])
+    return _issues('drive_without_start', bad, 'no start yardline or clock, ' + bad['real_plays'].astype(str) +
+                   ' real plays')
+
+
+# drives where more than one team scored
+def check_multiple_scoring_teams(scored: pd.DataFrame):
+    teams = scored[scored['team'].notna()].drop_duplicates(['game_id', 'drive_id', 'team'])
+    teams = teams[teams.groupby(['game_id', 'drive_id'])['team'].transform('size') > 1]
+    bad = teams.groupby(['game_id', 'season_year', 'drive_id'])['team'].agg(', '.join).reset_index()
+    return _issues('multiple_scoring_teams', bad, 'scoring teams ' + bad['team'].astype(str))
+
+
+# drive possession teams and scoring teams that aren't one of the game's teams
+def check_unknown_team(games: pd.DataFrame, drives: pd.DataFrame, scored: pd.DataFrame):
+    game_teams = pd.DataFrame({'game_id': games['game_id'],
+                               'home': _franchise(games, 'home_team'),
+                               'away': _franchise(games, 'away_team')}).dropna()
+    team_rows = pd.concat([pd.DataFrame({'game_id': drives['game_id'], 'season_year': drives['season_year'],
+                                         'drive_id': drives['drive_id'], 'role': 'possession team',
+                                         'team': _franchise(drives, 'drive_pos_team')}),
+                           scored[['game_id', 'season_year', 'drive_id']].assign(role='scoring team',
+                                                                                 team=scored['team'])])
+    team_rows = team_rows[team_rows['team'].notna()].merge(game_teams, on='game_id')
+    bad = team_rows[(team_rows['team'] != team_rows['home']) & (team_rows['team'] != team_rows['away'])]
+    bad = bad.drop_duplicates(['game_id', 'drive_id', 'role', 'team'])
+    return _issues('unknown_team', bad, bad['role'] + ' ' + bad['team'].astype(str) + ' not in ' +
+                   bad['away'].astype(str) + ' @ ' + bad['home'].astype(str))
+
+
+# team abbrs that aren't the ones their franchises used in the game's season - used before the franchise took the abbr,
+# e.g. LAC in 2015, or after it dropped it, e.g. JAC in 2019
+def check_stale_team_abbr(games: pd.DataFrame, drives: pd.DataFrame, scored: pd.DataFrame):
+    abbrs = pd.concat([games[['game_id', 'season_year']].assign(drive_id=None, team=games['home_team']),
+                       games[['game_id', 'season_year']].assign(drive_id=None, team=games['away_team']),
+                       drives[['game_id', 'season_year', 'drive_id']].assign(team=drives['drive_pos_team']),
+                       scored[['game_id', 'season_year', 'drive_id']].assign(team=scored['scoring_team'])])
+    abbrs['team'] = abbrs['team'].astype(object)
+    abbrs = abbrs[abbrs['team'].notna()]
+    # only a handful of distinct (abbr, season) pairs, so look those up one by one
+    pairs = abbrs[['team', 'season_year']].drop_duplicates()
+    pairs['season_abbr'] = [team_functions.get_season_abbr(team_functions.get_nearest_franchise_abbr(team, year), year)
+                            for team, year in zip(pairs['team'], pairs['season_year'])]
+    abbrs = abbrs.merge(pairs, on=['team', 'season_year'])
+    bad = abbrs[abbrs['team'] != abbrs['season_abbr']].drop_duplicates(['game_id', 'drive_id', 'team'])
+    return _issues('stale_team_abbr', bad, bad['team'].astype(str) + ' was ' + bad['season_abbr'].astype(str) + ' in ' +
+                   bad['season_year'].astype(str))
+
+
+# run every check over (games, drives, plays) frames from columnar.ColumnarBuilder. Returns the issues DataFrame
+def validate_frames(games: pd.DataFrame, drives: pd.DataFrame, plays: pd.DataFrame):
+    drives = drives.merge(games[['game_id', 'season_year']], on='game_id')
+    scored = _get_scoring_plays(games, plays)
+    issues = pd.concat([check_score_mismatch(games, scored),
+                        check_missing_field(games),
+                        check_duplicate_play_id(games, plays),
+                        check_drive_without_start(drives, plays),
+                        check_multiple_scoring_teams(scored),
+                        check_unknown_team(games, drives, scored),
+                        check_stale_team_abbr(games, drives, scored)], ignore_index=True)
+    issues['drive_id'] = issues['drive_id'].astype('Int16')
+    return issues.sort_values(['game_id', 'drive_id', 'check'], na_position='first', ignore_index=True)
+
+
+# parse failures ((game_id, error) tuples, see functions.iter_parse_games) as issues
+def get_failure_issues(failures: list, season_year: int):
+    frame = pd.DataFrame(failures, columns=['game_id', 'error']).assign(season_year=season_year)
+    return _issues('parse_failure', frame, frame['error'])
+
+
+# {game_id: sorted checks} for games with an error-level issue
+def get_excluded_games(issues: pd.DataFrame):
+    errors = issues[issues['severity'] == 'error']
+    return {game_id: sorted(set(checks)) for game_id, checks in errors.groupby('game_id')['check']}
+
+
+# JSON-serializable summary and list of the issues
+def get_report(issues: pd.DataFrame, num_games: int):
+    return {'games': num_games,
+            'games_with_issues': int(issues['game_id'].nunique()),
+            'issues': {check: int((issues['check'] == check).sum()) for check in CHECKS},
+            'excluded_games': get_excluded_games(issues),
+            'issue_list': json.loads(issues.to_json(orient='records'))}
+
+
+def write_report(report: dict, filename: str = DEFAULT_REPORT_FILENAME):
+    os.makedirs(os.path.dirname(filename) or '.', exist_ok=True)
+    with open(filename, 'w') as outfile:
+        json.dump(report, outfile, indent=1)
+
+
+# replace the exclusion list's entries for the given seasons with the games issues says should be excluded.
+# Entries for other seasons are left alone, so validating one season doesn't forget what was found in the others
+def update_exclusions(issues: pd.DataFrame, seasons: list, filename: str = f.EXCLUDED_GAMES_FILENAME):
+    games = {}
+    if os.path.exists(filename):
+        with open(filename) as fh:
+            games = json.load(fh)['games']
+    games = {k: v for k, v in games.items() if v['season_year'] not in set(seasons)}
+
+    seasons_by_game = dict(zip(issues['game_id'], issues['season_year']))
+    for game_id, checks in get_excluded_games(issues).items():
+        games[game_id] = {'season_year': int(seasons_by_game[game_id]), 'checks': checks}
+
+    os.makedirs(os.path.dirname(filename) or '.', exist_ok=True)
+    folder, name = os.path.split(filename)
+    temp_filename = os.path.join(folder or '.', '.{}.tmp'.format(name))
+    with open(temp_filename, 'w') as fh:
+        json.dump({'games': games}, fh, indent=1, sort_keys=True)
+    os.replace(temp_filename, filename)
+    f.get_excluded_games.cache_clear()
+    return games
+
+
+# parse and check every game in a year range (end_year exclusive), games on the exclusion list included, a season at a
+# time. Writes the report to report_filename and, if update, brings the exclusion list up to date. Returns the report
+def validate_seasons(start_year: int, end_year: int, workers: int = 1, report_filename: str = DEFAULT_REPORT_FILENAME,
+                     update: bool = True):
+    seasons = list(range(start_year, end_year))
+    issues = []
+    num_games = 0
+    for year in seasons:
+        games = f.get_season_games(year, load=workers <= 1, skip_excluded=False)
+        builder = columnar.ColumnarBuilder(descriptions=False)
+        failures = []
+        for result, failure in f.iter_parse_games(games, workers):
+            if failure is not None:
+                failures.append(failure)
+            else:
+                builder.add_game(result)
+
+        with metrics.timer('validate'):
+            season_issues = pd.concat([validate_frames(*builder.to_frames()), get_failure_issues(failures, year)],
+                                      ignore_index=True)
+        issues.append(season_issues)
+        num_games += len(games)
+        logger.info('Checked {} games for {}: {} issues'.format(len(games), str(year), len(season_issues)))
+
+    issues = pd.concat(issues, ignore_index=True)
+    report = get_report(issues, num_games)
+    write_report(report, report_filename)
+    if update:
+        update_exclusions(issues, seasons)
+    logger.info('{} of {} games have issues, {} excluded'.format(report['games_with_issues'], num_games,
+                                                                 len(report['excluded_games'])))
+    return report
+
+
+if __name__ == '__main__':
+    validate_seasons(2009, 2019)
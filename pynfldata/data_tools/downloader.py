@@ -0,0 +1,112 @@
+"""Shared, rate-limited downloader for feeds-rs requests
+
+Every request goes through one transport - by default a single urllib3.PoolManager, see transport.py. Politeness
+towards nfl.com is enforced with a global token bucket instead of a fixed sleep after each request, so a batch of urls
+can be fetched on a thread pool and the total run time is bounded by the request budget rather than by serial latency.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+from pynfldata.data_tools import metrics
+from pynfldata.data_tools import transport as tr
+
+DEFAULT_RATE = 1.0  # tokens added to the bucket per second
+DEFAULT_BURST = 4  # max tokens the bucket can hold
+DEFAULT_WORKERS = 4  # threads used by fetch_many
+
+
+# Classic token bucket - tokens refill continuously at `rate` per second up to `capacity`.
+# acquire() blocks the calling thread until enough tokens are available, so it is shared safely between workers
+class TokenBucket:
+    def __init__(self, rate: float = DEFAULT_RATE, capacity: float = DEFAULT_BURST):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    # take tokens if they're available right now, without waiting. Returns whether they were taken
+    def try_acquire(self, tokens: float = 1):
+        with self._lock:
+            self._refill()
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return True
+            return False
+
+    def acquire(self, tokens: float = 1):
+        # a request can never cost more than a full bucket, otherwise it would wait forever
+        tokens = min(tokens, self.capacity)
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+# Holds the single transport and rate limiter used by every fetch in the package
+class Downloader:
+    def __init__(self, rate: float = DEFAULT_RATE, burst: float = DEFAULT_BURST, workers: int = DEFAULT_WORKERS,
+                 transport: tr.Transport = None):
+        self.workers = workers
+        self.bucket = TokenBucket(rate, burst)
+        self.transport = transport if transport is not None else tr.get_default_transport(workers)
+
+    # get a url's body and ensure that status 200 is returned. cost is the number of tokens the request uses
+    def fetch(self, url: str, cost: float = 1):
+        r = self.request(url, cost)
+        assert r.status == 200
+        return r.data
+
+    # make a rate-limited GET and return the full response, used for conditional requests that may return 304
+    def request(self, url: str, cost: float = 1, headers: dict = None):
+        if self.transport.rate_limited:
+            with metrics.timer('rate_limit_wait'):
+                self.bucket.acquire(cost)
+        with metrics.timer('download'):
+            r = self.transport.request(url, headers)
+        metrics.count('requests')
+        metrics.count('bytes_downloaded', len(r.data or b''))
+        return r
+
+    # fetch a list of urls on a thread pool, returning bodies in the same order as the urls
+    def fetch_many(self, urls: list, cost: float = 1):
+        return self.map(lambda url: self.fetch(url, cost), urls)
+
+    # run func over items on the worker pool, returning results in the same order as the items
+    def map(self, func, items: list):
+        if len(items) <= 1:
+            return [func(x) for x in items]
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            return list(executor.map(func, items))
+
+
+_downloader = None
+_downloader_lock = threading.Lock()
+
+
+# return the process-wide Downloader, building it with default settings on first use
+def get_downloader():
+    global _downloader
+    with _downloader_lock:
+        if _downloader is None:
+            _downloader = Downloader()
+        return _downloader
+
+
+# replace the process-wide Downloader, e.g. to raise the worker count, change the politeness budget or replay recorded
+# payloads instead of making requests
+def configure(rate: float = DEFAULT_RATE, burst: float = DEFAULT_BURST, workers: int = DEFAULT_WORKERS,
+              transport: tr.Transport = None):
+    global _downloader
+    with _downloader_lock:
+        _downloader = Downloader(rate, burst, workers, transport)
+        return _downloader
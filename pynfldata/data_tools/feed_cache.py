@@ -0,0 +1,110 @@
+"""Disk cache for the schedule and scores feeds, aware of the season phase
+
+Responses are stored as raw xml under data/feed_cache/ next to a small metadata file. Once a feed is final (every game
+in a scores week is FINAL, or the whole season's schedule has been played) the entry is kept permanently and never
+fetched again. Anything else is reused for TTL_SECS and then revalidated with a conditional GET, so an unchanged week
+costs a 304 instead of a full download.
+"""
+import json
+import os
+import threading
+import time
+from pynfldata.data_tools import downloader
+from pynfldata.data_tools import metrics
+from pynfldata.data_tools import transport
+
+TTL_SECS = 300  # how long a non-final feed is reused before it is revalidated
+
+_stats = {'hits': 0, 'misses': 0, 'revalidated': 0}
+_stats_lock = threading.Lock()
+
+
+def _count(stat: str):
+    with _stats_lock:
+        _stats[stat] += 1
+    metrics.count('feed_cache_' + stat)
+
+
+# return a copy of the hit/miss counters. revalidated counts stale entries that the server confirmed unchanged
+def get_cache_stats():
+    with _stats_lock:
+        return dict(_stats)
+
+
+def reset_cache_stats():
+    with _stats_lock:
+        for key in _stats:
+            _stats[key] = 0
+
+
+# given a feeds-rs url, return the (xml, metadata) file pair it is cached in
+def _get_cache_filenames(url: str):
+    base = 'data/feed_cache/{}'.format(transport.get_path(url).rstrip('/'))
+    os.makedirs(os.path.dirname(base), exist_ok=True)
+    return '{}.xml'.format(base), '{}.meta.json'.format(base)
+
+
+def _read_meta(meta_filename: str):
+    if not os.path.isfile(meta_filename):
+        return None
+    with open(meta_filename, 'r') as infile:
+        return json.load(infile)
+
+
+def _write_meta(meta_filename: str, meta: dict):
+    with open(meta_filename, 'w') as outfile:
+        json.dump(meta, outfile)
+
+
+# get a feed's xml, from disk where possible. is_final is called on freshly downloaded xml to decide if it can be
+# cached permanently
+def get_xml(url: str, timeout_secs: int = 1, is_final=None, ttl: int = None):
+    ttl = TTL_SECS if ttl is None else ttl
+    xml_filename, meta_filename = _get_cache_filenames(url)
+    meta = _read_meta(meta_filename)
+
+    if meta is not None and os.path.isfile(xml_filename):
+        if meta['final'] or time.time() - meta['fetched_at'] < ttl:
+            _count('hits')
+            with open(xml_filename, 'rb') as infile:
+                return infile.read()
+
+        # stale - ask the server whether it changed since we fetched it
+        headers = {}
+        if meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+        r = downloader.get_downloader().request(url, timeout_secs, headers)
+        if r.status == 304:
+            _count('revalidated')
+            meta['fetched_at'] = time.time()
+            _write_meta(meta_filename, meta)
+            with open(xml_filename, 'rb') as infile:
+                return infile.read()
+    else:
+        r = downloader.get_downloader().request(url, timeout_secs)
+
+    assert r.status == 200
+    _count('misses')
+    with open(xml_filename, 'wb') as outfile:
+        outfile.write(r.data)
+    _write_meta(meta_filename, {'final': bool(is_final and is_final(r.data)),
+                                'fetched_at': time.time(),
+                                'etag': r.headers.get('ETag'),
+                                'last_modified': r.headers.get('Last-Modified')})
+    return r.data
+
+
+# get many feeds at once, downloading the ones that aren't cached concurrently. Returns xml in the order given
+def get_xml_many(urls: list, timeout_secs: int = 1, is_final=None, ttl: int = None):
+    return downloader.get_downloader().map(lambda url: get_xml(url, timeout_secs, is_final, ttl), urls)
+
+
+# flag an already-cached feed as final, e.g. a schedule once all of its games have been played
+def mark_final(url: str):
+    xml_filename, meta_filename = _get_cache_filenames(url)
+    meta = _read_meta(meta_filename)
+    if meta is not None and not meta['final']:
+        meta['final'] = True
+        _write_meta(meta_filename, meta)
@@ -0,0 +1,126 @@
+"""Local stand-in for nfl.com/feeds-rs, serving recorded payloads for offline end-to-end runs and load tests
+
+Payloads are read from a folder in the transport.get_payload_filename layout (e.g. a RecordingTransport folder, or
+benchmarks/fixtures) and served under /feeds-rs/, with optional latency, random server errors and a rate limit that
+answers 429 once exceeded. Responses carry an ETag and honour If-None-Match, like the real feeds.
+
+    python -m pynfldata.data_tools.feeds_server benchmarks/fixtures --port 8765 --latency 0.2 --error-rate 0.05 --rate 5
+    PYNFLDATA_FEED_BASE_URL=http://127.0.0.1:8765/feeds-rs python -m pynfldata.drives_data.drive_parser
+
+or from code, start_server(folder) runs one on a background thread and returns it - its base_url is what to pass to
+transport.set_base_url().
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import argparse
+import os
+import random
+import threading
+import time
+from pynfldata.data_tools import downloader
+from pynfldata.data_tools import transport
+
+PATH_PREFIX = '/feeds-rs/'
+
+
+class FeedsServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, folder: str, port: int = 8765, host: str = '127.0.0.1', latency: float = 0, jitter: float = 0,
+                 error_rate: float = 0, rate: float = None, burst: float = None, seed: int = None):
+        self.folder = folder
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.bucket = downloader.TokenBucket(rate, burst or max(rate, 1)) if rate else None
+        self.random = random.Random(seed)
+        self.stats = {'requests': 0, 'ok': 0, 'not_modified': 0, 'not_found': 0, 'errors': 0, 'throttled': 0}
+        self._lock = threading.Lock()
+        super().__init__((host, port), FeedsRequestHandler)
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return 'http://{}:{}{}'.format(host, port, PATH_PREFIX.rstrip('/'))
+
+    def count(self, stat: str):
+        with self._lock:
+            self.stats[stat] += 1
+
+    # the random draws are shared between handler threads
+    def draw(self):
+        with self._lock:
+            return self.random.random()
+
+
+class FeedsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        server.count('requests')
+        if server.bucket is not None and not server.bucket.try_acquire():
+            server.count('throttled')
+            return self._respond(429, headers={'Retry-After': '1'})
+
+        if server.latency or server.jitter:
+            time.sleep(server.latency + server.jitter * server.draw())
+        if server.error_rate and server.draw() < server.error_rate:
+            server.count('errors')
+            return self._respond(503)
+
+        path = self.path.split('?')[0]
+        filename = None
+        if path.startswith(PATH_PREFIX):
+            filename = transport.get_payload_filename(server.folder, path[len(PATH_PREFIX):])
+        if filename is None or not os.path.isfile(filename):
+            server.count('not_found')
+            return self._respond(404)
+
+        with open(filename, 'rb') as infile:
+            data = infile.read()
+        etag = transport.get_etag(data)
+        if self.headers.get('If-None-Match') == etag:
+            server.count('not_modified')
+            return self._respond(304, headers={'ETag': etag})
+        server.count('ok')
+        self._respond(200, data, {'ETag': etag, 'Content-Type': 'application/xml'})
+
+    def _respond(self, status: int, data: bytes = b'', headers: dict = None):
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    # one line per request is far too much during a load test
+    def log_message(self, format, *args):
+        pass
+
+
+# start a FeedsServer on a background thread. port=0 picks a free port - see the returned server's base_url.
+# Call shutdown() on it when done
+def start_server(folder: str, port: int = 0, **kwargs):
+    server = FeedsServer(folder, port, **kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve recorded feeds-rs payloads locally')
+    parser.add_argument('folder', nargs='?', default='benchmarks/fixtures')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0, help='seconds added to every response')
+    parser.add_argument('--jitter', type=float, default=0, help='up to this many more seconds, at random')
+    parser.add_argument('--error-rate', type=float, default=0, help='fraction of requests answered with a 503')
+    parser.add_argument('--rate', type=float, help='requests per second allowed before answering 429')
+    parser.add_argument('--burst', type=float, help='requests allowed at once before the rate applies')
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args()
+
+    feeds_server = FeedsServer(args.folder, args.port, args.host, args.latency, args.jitter, args.error_rate,
+                               args.rate, args.burst, args.seed)
+    print('Serving {} at {}'.format(args.folder, feeds_server.base_url))
+    try:
+        feeds_server.serve_forever()
+    except KeyboardInterrupt:
+        print(feeds_server.stats)
@@ -1,62 +1,129 @@
 """General functions usable by any script
 
 """
-import urllib3
-import time
 import xmltodict
 from pynfldata.data_tools.nfl_types import Game
+from pynfldata.data_tools import downloader
+from pynfldata.data_tools import feed_cache
+from pynfldata.data_tools import game_cache
+from pynfldata.data_tools import metrics
+from pynfldata.data_tools import raw_store
+from pynfldata.data_tools import transport
+from concurrent.futures import ProcessPoolExecutor
+import functools
 import json
-from pathlib import Path
-import os
 import datetime
+import logging
+import os
+
+# setup logging
+logger = logging.getLogger('functions.py')
+handler = logging.StreamHandler()
+formatter = logging.Formatter('%(asctime)s %(levelname)-8s %(message)s')
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+logger.setLevel(logging.INFO)
 
 
 bad_games = ['2016080751',  # preseason game that wasn't actually played
              '2011120406'  # NO/DET game with a super-broken drive  # todo fix this drive/game
              ]
 
+# games the data quality pass found unusable, left out along with bad_games - see data_quality.update_exclusions
+EXCLUDED_GAMES_FILENAME = 'data/excluded_games.json'
+
+
+# game_ids in the machine-maintained exclusion list, read once per process
+@functools.lru_cache(maxsize=None)
+def get_excluded_games(filename: str = EXCLUDED_GAMES_FILENAME):
+    if not os.path.exists(filename):
+        return frozenset()
+    with open(filename) as fh:
+        return frozenset(json.load(fh)['games'])
+
 
 # function to get the xml and ensure that status 200 is returned
+# timeout_secs used to be a sleep after the request - it is now the request's cost against the shared rate limit
 def download_xml(path: str, timeout_secs: int = 2):
-    http = urllib3.PoolManager()
-    r = http.request('GET', path)
-    assert r.status == 200
-    time.sleep(timeout_secs)
-    return r.data
+    return downloader.get_downloader().fetch(path, timeout_secs)
+
+
+# same as download_xml, but fetches many paths concurrently. Returns the xml strings in the order given
+def download_xml_many(paths: list, timeout_secs: int = 2):
+    return downloader.get_downloader().fetch_many(paths, timeout_secs)
 
 
 def get_current_game_year():
-    url = "http://www.nfl.com/feeds-rs/schedules"
-    xml_string = download_xml(url, 1)
+    url = transport.get_url('schedules')
+    xml_string = feed_cache.get_xml(url, 1)
     game_year = xmltodict.parse(xml_string)['gameSchedulesFeed']['season']
     return int(game_year)
 
 
-# function to get data for other scripts
-# Gets the requested data from local if possible, downloads as xml and saves it as json if not
-def get_data(path: str, timeout_secs: int = 2, xml_args: dict = dict):
+# given a feeds-rs path, return the (feed, key) it is stored under, e.g. ('boxscorePbp', '2019090500')
+def _split_data_path(path: str):
     # gets the type of data requested, coaches, teams, boxscorepbp, etc, and the rest of the path
-    short_path = path.split('feeds-rs/')[1].split('/')
+    short_path = transport.get_path(path).split('/')
+    # the key is everything but the .xml extension
+    return short_path[0], short_path[1].split('.')[0]
 
-    # split short_path into folder (nested under /data) and file_path (everything but .xml because we'll be saving json)
-    folder = 'data/{}'.format(short_path[0])
-    file_path = '{}.json'.format(short_path[1].split('.')[0])
 
-    # if the folder doesn't exist, create it
-    if not os.path.exists(folder):
-        os.makedirs(folder)
+# raw data is either the xml as downloaded, or json converted from it by older versions of get_data
+def is_json_data(raw_data: bytes):
+    return raw_data.lstrip()[:1] == b'{'
 
-    # build a Path object and check if it's a file. if it is, use it. If not, download and convert the xml.
-    filename = Path('{}//{}'.format(folder, file_path))
-    if filename.is_file():
-        with open(filename, 'r') as infile:
-            json_data = json.load(infile)
+
+# Gets the requested raw data from local if possible, downloads and saves the xml if not
+def get_raw_data(path: str, timeout_secs: int = 2):
+    feed, key = _split_data_path(path)
+    with metrics.timer('raw_store_read'):
+        raw_data = raw_store.get_store().get(feed, key)
+    if raw_data is None:
+        metrics.count('raw_store_misses')
+        raw_data = download_xml(path, timeout_secs)
+        raw_store.get_store().put(feed, key, raw_data)
     else:
-        xml_string = download_xml(path, timeout_secs)
-        json_data = xmltodict.parse(xml_string, **xml_args)
-        with open(filename, 'w') as outfile:
-            json.dump(json_data, outfile)
-    return json_data
+        metrics.count('raw_store_hits')
+    return raw_data
+
+
+# function to get data for other scripts
+# Gets the requested data from local if possible, downloads it if not, and returns it converted to a dict
+def get_data(path: str, timeout_secs: int = 2, xml_args: dict = dict):
+    raw_data = get_raw_data(path, timeout_secs)
+    if is_json_data(raw_data):
+        with metrics.timer('json_load'):
+            return json.loads(raw_data)
+    with metrics.timer('xml_parse'):
+        return xmltodict.parse(raw_data, **xml_args)
+
+
+# make sure every path is available locally, downloading all of the missing ones concurrently
+# if load, they are then bulk-loaded so later get_data calls in this process don't go to disk one at a time
+def prefetch_data(paths: list, timeout_secs: int = 2, load: bool = True):
+    store = raw_store.get_store()
+    paths_by_feed = {}
+    for path in paths:
+        feed, key = _split_data_path(path)
+        paths_by_feed.setdefault(feed, {})[key] = path
+
+    for feed, feed_paths in paths_by_feed.items():
+        stored = store.contains(feed, list(feed_paths))
+        missing = [key for key in feed_paths if key not in stored]
+        metrics.count('prefetch_downloads', len(missing))
+        xml_strings = download_xml_many([feed_paths[key] for key in missing], timeout_secs)
+        store.put_many(feed, dict(zip(missing, xml_strings)))
+        if load:
+            store.prefetch(feed, list(feed_paths))
+
+
+# make sure one path is available locally, downloading it if it isn't
+def fetch_data(path: str, timeout_secs: int = 2):
+    feed, key = _split_data_path(path)
+    store = raw_store.get_store()
+    if not store.contains(feed, [key]):
+        metrics.count('prefetch_downloads')
+        store.put(feed, key, download_xml(path, timeout_secs))
 
 
 # Takes a NFL date string "MM/DD/YYYY" and converts it to a datetime.date object
@@ -66,11 +133,29 @@ def get_game_date(date_string: str):
     return game_date
 
 
+def _get_score_url(season_year: int, season_type: str, week: int):
+    return transport.get_url('scores/{y}/{t}/{w}'.format(y=season_year, t=season_type, w=week))
+
+
 # get full game information from the scores feeds-rs object. downloads week by week
 def get_game_score(season_year: int, season_type: str, week: int):
-    score_url = "http://www.nfl.com/feeds-rs/scores/{y}/{t}/{w}".format(y=season_year, t=season_type, w=week)
-    score_xml_string = download_xml(score_url, 1)
+    score_xml_string = feed_cache.get_xml(_get_score_url(season_year, season_type, week), 1, _is_week_final)
+    return _parse_game_score(score_xml_string)
+
 
+# get scores for many (year, type, week) tuples at once, fetching the uncached weeks concurrently
+def get_game_scores(weeks: list):
+    score_xml_strings = feed_cache.get_xml_many([_get_score_url(*week) for week in weeks], 1, _is_week_final)
+    return [_parse_game_score(x) for x in score_xml_strings]
+
+
+# a week's scores can be cached permanently once every game in it is final
+def _is_week_final(score_xml_string):
+    scores = _parse_game_score(score_xml_string)
+    return all(x.get('score') and 'FINAL' in x['score']['@phase'] for x in scores)
+
+
+def _parse_game_score(score_xml_string):
     score_game_dict_raw = xmltodict.parse(score_xml_string)['scoresFeed']['gameScores']
 
     # If there is only one element in the XML list, Python does wonky things. Force it to make a list in this case.
@@ -83,25 +168,40 @@ def get_game_score(season_year: int, season_type: str, week: int):
 
 # function to get all games from a schedule file and build Game objects
 def get_games_from_schedule(game_year: int):
-    # get all games from the year's schedule file
-    schedule_url = "http://www.nfl.com/feeds-rs/schedules/{}".format(str(game_year))
-    schedule_xml_string = download_xml(schedule_url)
+    # get all games from the year's schedule file, and the scores for each of its weeks
+    schedule_url, game_weeks = get_schedule_weeks(game_year)
+    scores = []
+    for week_scores in get_game_scores(game_weeks):
+        scores += week_scores
+
+    # remove scheduled games that don't have a final score
+    games_list = get_final_games(scores)
+
+    # once every scheduled game is final the season is over and its schedule won't change again
+    if len(games_list) == len(scores):
+        feed_cache.mark_final(schedule_url)
+
+    return games_list
+
+
+# get the year's schedule file, returning its url and a sorted list of year/type/week tuples using every game in it
+def get_schedule_weeks(game_year: int):
+    schedule_url = transport.get_url('schedules/{}'.format(str(game_year)))
+    schedule_xml_string = feed_cache.get_xml(schedule_url, 2)
     schedule_game_dict = xmltodict.parse(schedule_xml_string)['gameSchedulesFeed']['gameSchedules']['gameSchedule']
 
-    # build a tuple of year/type/week using every game in the schedule
     game_weeks = set()
     for game in schedule_game_dict:
         game_weeks.add((int(game['@season']), game['@seasonType'], int(game['@week'])))
+    return schedule_url, sorted(game_weeks)
 
-    # get the scores for each week, add to a list, then remove scheduled games that don't have a score
-    # this occurs if a game is scheduled but hasn't happened yet
-    scores = []
-    for week in game_weeks:
-        scores += get_game_score(*week)
-    scores = [x for x in scores if x.get('score')]  # Filter out games that don't have a score object - haven't happened
-    scores = [x for x in scores if 'FINAL' in x['score']['@phase']]  # Filter out games that aren't final
 
-    # build Game objects using scores list
+# build Game objects from a list of scores, leaving out games that don't have a score object (scheduled but haven't
+# happened yet) and games that aren't final
+def get_final_games(scores: list):
+    scores = [x for x in scores if x.get('score')]
+    scores = [x for x in scores if 'FINAL' in x['score']['@phase']]
+
     games_list = []
     for game in scores:
         score_dict = game.get('score')
@@ -118,19 +218,125 @@ def get_games_from_schedule(game_year: int):
     return games_list
 
 
-# given a year range, get Game objects and return in a list
-def get_games_for_years(start_year: int, end_year: int):
-    games_list = []
-    for year in range(start_year, end_year):
+# leave out the pro bowl, known bad games (bad_games and the exclusion list) and any game_ids in exclude
+# skip_excluded=False keeps games from the exclusion list (but not bad_games), e.g. to check them again
+def filter_games(games: list, exclude: set = frozenset(), skip_excluded: bool = True):
+    excluded = set(bad_games) | get_excluded_games() if skip_excluded else set(bad_games)
+    metrics.count('bad_games', sum(1 for g in games if g.game_id in excluded))
+    return [g for g in games if g.season_type != 'PRO' and g.game_id not in excluded and g.game_id not in exclude]
+
+
+# worker process setup - use the parent's raw store and profiling choice, not whatever the environment would build
+def _init_parse_worker(store: raw_store.RawStore, profile_game: tuple = (None, None),
+                       cache: game_cache.GameCache = None):
+    raw_store.set_store(store)
+    game_cache.set_cache(cache)
+    # a forked worker starts with a copy of the parent's metrics - only send back what it records itself
+    metrics.reset()
+    if profile_game[0] is not None:
+        metrics.set_profile_game(*profile_game)
+
+
+# get one game's details, returning (result, error) so failures can be collected instead of raised
+def _parse_game(game: Game, export: bool = False, summary: bool = False):
+    try:
+        with metrics.profile(game.game_id):
+            game.get_game_details(summary)
+            if export:
+                with metrics.timer('export'):
+                    result = game.export()
+            else:
+                result = game
+        metrics.count('games')
+        return result, None
+    except KeyError as e:
+        metrics.count('failed_games')
+        return None, (game.game_id, repr(e))
+
+
+# _parse_game in a worker process - also sends back the metrics recorded for the game
+def _parse_game_in_worker(game: Game, export: bool = False, summary: bool = False):
+    result, failure = _parse_game(game, export, summary)
+    return result, failure, metrics.drain()
+
+
+# get a season's finished games (without details), minus the pro bowl, known bad games and any game_ids in exclude
+# every game not already on disk is downloaded concurrently, so getting details only reads local files
+def get_season_games(year: int, load: bool = True, exclude: set = frozenset(), skip_excluded: bool = True):
+    with metrics.timer('schedule'):
         games = get_games_from_schedule(year)
+    games = filter_games(games, exclude, skip_excluded)
+    # games already in the game cache don't need their raw data. In this process, read them all in one go
+    cache = game_cache.get_cache()
+    cached = set()
+    if cache is not None:
+        cached = cache.contains(games)
+        if load and cached:
+            cache.prefetch(year)
+    prefetch_data([g.url for g in games if g.game_id not in cached], 2, load=load)
+    return games
 
-        # using list of games, get game details and append full Game.export() dict to new list
+
+# get details for games one at a time, optionally across a pool of worker processes, yielding (result, failure)
+# pairs in the order given. result is the Game object (or its export() dict), failure a (game_id, error) tuple for
+# a game that couldn't be parsed. Parallel work is submitted a batch at a time, so only a batch of parsed games is
+# ever held in memory. summary gets drive summaries only, without plays - see Game.get_game_details
+def iter_parse_games(games: list, workers: int = 1, export: bool = False, batch_size: int = 64,
+                     summary: bool = False):
+    if workers <= 1 or len(games) <= 1:
         for g in games:
-            if g.season_type != 'PRO' and g.game_id not in bad_games:  # exclude pro bowl and bad games
-                try:
-                    g.get_game_details()
-                    games_list.append(g)
-                except KeyError:
-                    print('ERROR WITH GAME {}'.format(g.game_id))
+            yield _parse_game(g, export, summary)
+        return
 
-    return games_list
+    parse = functools.partial(_parse_game_in_worker, export=export, summary=summary)
+    batch_size = max(batch_size, workers)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_parse_worker,
+                             initargs=(raw_store.get_store(), metrics.get_profile_game(),
+                                       game_cache.get_cache())) as executor:
+        for i in range(0, len(games), batch_size):
+            batch = games[i:i + batch_size]
+            for result, failure, worker_metrics in executor.map(parse, batch,
+                                                                chunksize=max(1, len(batch) // (workers * 4))):
+                metrics.merge(worker_metrics)
+                yield result, failure
+
+
+# log a (game_id, error) failure from _parse_game, appending it to failures if given
+def log_failure(failure: tuple, failures: list = None):
+    logger.error('ERROR WITH GAME {}: {}'.format(*failure))
+    if failures is not None:
+        failures.append(failure)
+
+
+# get details for a list of games, optionally across a pool of worker processes.
+# returns (results, failures): results are Game objects (or their export() dicts) in the order given,
+# failures are (game_id, error) tuples for games that couldn't be parsed
+def parse_games(games: list, workers: int = 1, export: bool = False, summary: bool = False):
+    parsed = list(iter_parse_games(games, workers, export, summary=summary))
+    results = [x[0] for x in parsed if x[1] is None]
+    failures = [x[1] for x in parsed if x[1] is not None]
+    return results, failures
+
+
+# given a year range, yield Game objects (or their export() dicts) one at a time, in schedule order
+# workers > 1 parses the (locally cached) games on that many processes, summary keeps drive summaries only.
+# Games that can't be parsed are logged and skipped, and their (game_id, error) tuples appended to failures if given
+def iter_games_for_years(start_year: int, end_year: int, workers: int = 1, export: bool = False,
+                         summary: bool = False, failures: list = None):
+    for year in range(start_year, end_year):
+        games = get_season_games(year, load=workers <= 1)
+
+        # pro bowl and bad games were excluded by get_season_games
+        for result, failure in iter_parse_games(games, workers, export, summary=summary):
+            if failure is not None:
+                log_failure(failure, failures)
+            else:
+                yield result
+
+
+# given a year range, get Game objects and return in a list
+# workers > 1 parses the (locally cached) games on that many processes, summary keeps drive summaries only.
+# failures collects the (game_id, error) tuples of games that couldn't be parsed, as in iter_games_for_years
+def get_games_for_years(start_year: int, end_year: int, workers: int = 1, summary: bool = False,
+                        failures: list = None):
+    return list(iter_games_for_years(start_year, end_year, workers, summary=summary, failures=failures))
@@ -0,0 +1,207 @@
+"""Cache of fully parsed Game objects, so reruns over historical games skip parsing and reconciliation entirely
+
+Each Game, drives and plays included, is pickled (protocol 5) into one SQLite file, data/game_cache.sqlite, keyed by
+game_id plus the parser version - a hash of the parsing modules' source, so changing the parser makes every older entry
+a miss without any manual invalidation. Entries also record the scores they were reconciled against, and are only
+used while the schedule still reports the same scores.
+
+The cache is bounded to max_bytes of pickled data. Once it grows past that the least recently used entries are evicted.
+Each process keeps a running total of the bytes it has seen stored rather than adding them up on every put, so puts
+from other processes (e.g. parse workers) only count once the total is read back from the file at the next eviction.
+prefetch() reads a whole season's entries in one query, which functions.get_season_games does before parsing.
+
+The cache is off unless it is turned on with set_cache() or the PYNFLDATA_GAME_CACHE environment variable (set to the
+cache file, or to 1 for the default location).
+"""
+import functools
+import hashlib
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from pynfldata.data_tools import nfl_types
+from pynfldata.data_tools import pbp_parser
+from pynfldata.data_tools import team_functions
+
+PARSER_MODULES = [nfl_types, pbp_parser, team_functions]
+DEFAULT_FILENAME = 'data/game_cache.sqlite'
+DEFAULT_MAX_BYTES = 512 * 1024 ** 2
+
+
+# hash of the source of a list of modules, used to tell parser versions apart
+def get_source_hash(modules: list):
+    h = hashlib.sha1()
+    for module in modules:
+        with open(module.__file__, 'rb') as fh:
+            h.update(fh.read())
+    return h.hexdigest()[:16]
+
+
+@functools.lru_cache(maxsize=None)
+def get_parser_version():
+    return get_source_hash(PARSER_MODULES)
+
+
+def _scores(game):
+    return '{}-{}'.format(game.home_score, game.away_score)
+
+
+class GameCache:
+    def __init__(self, filename: str = DEFAULT_FILENAME, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.filename = filename
+        self.max_bytes = max_bytes
+        self._conn = None
+        self._prefetched = {}
+        # bytes of pickled data in the file, read from it on the first put and kept up to date from then on
+        self._total_bytes = None
+        self._lock = threading.RLock()
+
+    # the connection and prefetched entries stay in the process that opened them, e.g. when sent to worker processes
+    def __getstate__(self):
+        return {'filename': self.filename, 'max_bytes': self.max_bytes}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def _connection(self):
+        with self._lock:
+            if self._conn is None:
+                os.makedirs(os.path.dirname(self.filename) or '.', exist_ok=True)
+                self._conn = sqlite3.connect(self.filename, timeout=30, check_same_thread=False)
+                self._conn.execute('PRAGMA journal_mode=WAL')
+                self._conn.execute('PRAGMA synchronous=NORMAL')
+                self._conn.execute('CREATE TABLE IF NOT EXISTS games (game_id TEXT NOT NULL, '
+                                   'parser_version TEXT NOT NULL, season_year INTEGER NOT NULL, '
+                                   'scores TEXT NOT NULL, data BLOB NOT NULL, size INTEGER NOT NULL, '
+                                   'last_used REAL NOT NULL, PRIMARY KEY (game_id, parser_version))')
+                self._conn.execute('CREATE INDEX IF NOT EXISTS games_season ON games (season_year, parser_version)')
+                self._conn.execute('CREATE INDEX IF NOT EXISTS games_last_used ON games (last_used)')
+            return self._conn
+
+    # return the cached drives for a Game (with schedule fields but no details), or None if there's no current entry
+    def get(self, game):
+        with self._lock:
+            row = self._prefetched.pop(game.game_id, None)
+            if row is None:
+                conn = self._connection()
+                row = conn.execute('SELECT scores, data FROM games WHERE game_id = ? AND parser_version = ?',
+                                   (game.game_id, get_parser_version())).fetchone()
+                if row is not None:
+                    with conn:
+                        conn.execute('UPDATE games SET last_used = ? WHERE game_id = ? AND parser_version = ?',
+                                     (time.time(), game.game_id, get_parser_version()))
+        if row is None or row[0] != _scores(game):
+            return None
+        return pickle.loads(row[1]).drives
+
+    # store a Game whose details have been fetched, evicting the least recently used entries if over max_bytes
+    def put(self, game):
+        data = pickle.dumps(game, protocol=5)
+        with self._lock:
+            conn = self._connection()
+            if self._total_bytes is None:
+                self._total_bytes = self._get_total_bytes()
+            replaced = conn.execute('SELECT size FROM games WHERE game_id = ? AND parser_version = ?',
+                                    (game.game_id, get_parser_version())).fetchone()
+            with conn:
+                conn.execute('INSERT OR REPLACE INTO games VALUES (?, ?, ?, ?, ?, ?, ?)',
+                             (game.game_id, get_parser_version(), game.season_year, _scores(game), data, len(data),
+                              time.time()))
+            self._total_bytes += len(data) - (replaced[0] if replaced else 0)
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _get_total_bytes(self):
+        return self._connection().execute('SELECT COALESCE(SUM(size), 0) FROM games').fetchone()[0]
+
+    def _evict(self):
+        conn = self._connection()
+        # other processes may have added or evicted entries since the total was last read
+        total = self._total_bytes = self._get_total_bytes()
+        if total <= self.max_bytes:
+            return
+        # evict down to 90% so the next few puts don't each have to evict again
+        target = total - int(self.max_bytes * 0.9)
+        evicted = 0
+        to_delete = []
+        for game_id, parser_version, size in conn.execute(
+                'SELECT game_id, parser_version, size FROM games ORDER BY last_used'):
+            if evicted >= target:
+                break
+            to_delete.append((game_id, parser_version))
+            evicted += size
+        with conn:
+            conn.executemany('DELETE FROM games WHERE game_id = ? AND parser_version = ?', to_delete)
+        self._total_bytes -= evicted
+
+    # the game_ids of the Games (with schedule fields but no details) that get() would return drives for - entries for
+    # the current parser version that were reconciled against the same scores
+    def contains(self, games: list):
+        scores = {game.game_id: _scores(game) for game in games}
+        game_ids = list(scores)
+        found = set()
+        with self._lock:
+            conn = self._connection()
+            # stay well under SQLite's limit on the number of parameters
+            for i in range(0, len(game_ids), 500):
+                chunk = game_ids[i:i + 500]
+                rows = conn.execute('SELECT game_id, scores FROM games WHERE parser_version = ? AND game_id IN ({})'
+                                    .format(', '.join('?' * len(chunk))), [get_parser_version()] + chunk)
+                found.update(row[0] for row in rows if row[1] == scores[row[0]])
+        return found
+
+    # read every current entry of a season in one query, so later get() calls don't go to the database one at a time
+    def prefetch(self, season_year: int):
+        with self._lock:
+            conn = self._connection()
+            rows = conn.execute('SELECT game_id, scores, data FROM games WHERE season_year = ? AND parser_version = ?',
+                                (season_year, get_parser_version())).fetchall()
+            with conn:
+                conn.execute('UPDATE games SET last_used = ? WHERE season_year = ? AND parser_version = ?',
+                             (time.time(), season_year, get_parser_version()))
+            self._prefetched.update({row[0]: row[1:] for row in rows})
+        return len(rows)
+
+    # every cached Game of a season, details included, without touching the schedule or raw data
+    def load_season(self, season_year: int):
+        rows = self._connection().execute('SELECT data FROM games WHERE season_year = ? AND parser_version = ? '
+                                          'ORDER BY game_id', (season_year, get_parser_version())).fetchall()
+        return [pickle.loads(row[0]) for row in rows]
+
+    def clear(self):
+        with self._lock:
+            with self._connection() as conn:
+                conn.execute('DELETE FROM games')
+            self._prefetched = {}
+            self._total_bytes = 0
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+            self._prefetched = {}
+            self._total_bytes = None
+
+
+_cache = None
+_cache_configured = False
+
+
+# return the configured cache, or None if the cache is off
+def get_cache():
+    global _cache, _cache_configured
+    if not _cache_configured:
+        setting = os.environ.get('PYNFLDATA_GAME_CACHE')
+        if setting:
+            _cache = GameCache(DEFAULT_FILENAME if setting == '1' else setting)
+        _cache_configured = True
+    return _cache
+
+
+# turn the cache on with the given GameCache, or off with None
+def set_cache(cache: GameCache):
+    global _cache, _cache_configured
+    _cache = cache
+    _cache_configured = True
@@ -0,0 +1,237 @@
+"""In-memory store of parsed Games with secondary indexes, for lookups and drive-outcome queries without linear scans
+
+Games are indexed by game_id, season, season/week, team (home or away) and season_type, and their drives by game,
+possession team and drive start bucket - the drive start yardline (-50:50, see Yardline) in bands of BUCKET_YARDS.
+Queries intersect the indexes and only look at the drives that could match:
+
+    store = GameStore(f.iter_games_for_years(2015, 2020))
+    store.get('2019090800')
+    store.drives(team='SEA', season=2019, start_min=30, quarter=4)    # SEA drives starting in the red zone in Q4
+    store.summarize('team', season=2019)                            # points per drive and scoring rate per team
+
+Running totals (drives, scoring drives, points) are kept per season, team, season_type and start bucket as games are
+added, so summarize() over one of those without filters reads them instead of going through the drives at all.
+Points and scoring drives count the possession team's scores only - a pick-six isn't a scoring drive for the offense.
+add() inserts games incrementally; adding a game_id that's already in the store replaces it.
+"""
+import logging
+from pynfldata.data_tools import functions as f
+
+# setup logging
+logger = logging.getLogger('game_store.py')
+handler = logging.StreamHandler()
+formatter = logging.Formatter('%(asctime)s %(levelname)-8s %(message)s')
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+logger.setLevel(logging.INFO)
+
+BUCKET_YARDS = 10
+GROUPS = ['season', 'team', 'season_type', 'start_bucket']
+
+
+# the start bucket of a drive start yardline, or None for drives without a start (e.g. a lone kickoff)
+def get_start_bucket(yard_int: int):
+    return None if yard_int is None else yard_int // BUCKET_YARDS
+
+
+# points the possession team scored on a drive
+def get_offense_points(drive):
+    return drive.points if drive.points and drive.scoring_team == drive.pos_team else 0
+
+
+# running drive totals for one group
+class _Totals:
+    __slots__ = ['drives', 'scoring_drives', 'points']
+
+    def __init__(self):
+        self.drives = 0
+        self.scoring_drives = 0
+        self.points = 0
+
+    # sign is 1 to add a drive, -1 to take it back out
+    def add(self, drive, sign: int = 1):
+        points = get_offense_points(drive)
+        self.drives += sign
+        self.scoring_drives += sign * (points > 0)
+        self.points += sign * points
+
+    def to_dict(self):
+        return {'drives': self.drives,
+                'scoring_drives': self.scoring_drives,
+                'points': self.points,
+                'points_per_drive': self.points / self.drives if self.drives else None,
+                'scoring_rate': self.scoring_drives / self.drives if self.drives else None}
+
+
+# the group keys of one of GROUPS for a drive of a game. A drive counts for its possession team only
+def _group_keys(group: str, game, drive):
+    if group == 'season':
+        return [game.season_year]
+    elif group == 'team':
+        return [drive.pos_team]
+    elif group == 'season_type':
+        return [game.season_type]
+    elif group == 'start_bucket':
+        return [get_start_bucket(drive.start_yard_int)]
+    raise ValueError('Unknown group {} - should be one of {}'.format(group, GROUPS))
+
+
+class GameStore:
+    def __init__(self, games=()):
+        self._games = {}
+        # drive keys are (game_id, index of the drive in game.drives)
+        self._game_index = {'season': {}, 'season_week': {}, 'team': {}, 'season_type': {}}
+        self._drive_index = {'game': {}, 'team': {}, 'start_bucket': {}}
+        self._totals = {group: {} for group in GROUPS}
+        for game in games:
+            self.add(game)
+
+    def __len__(self):
+        return len(self._games)
+
+    def __contains__(self, game_id):
+        return game_id in self._games
+
+    def __iter__(self):
+        return iter(self._games.values())
+
+    def _game_keys(self, game):
+        return {'season': [game.season_year],
+                'season_week': [(game.season_year, game.game_week)],
+                'team': [game.home_team, game.away_team],
+                'season_type': [game.season_type]}
+
+    @staticmethod
+    def _drive_keys(game, drive):
+        return {'game': [game.game_id],
+                'team': [drive.pos_team],
+                'start_bucket': [get_start_bucket(drive.start_yard_int)]}
+
+    # add a Game, replacing any game with the same game_id. Its details are fetched if they haven't been yet.
+    # Only drive-level fields are used, so summary games (see Game.get_game_details) work just as well
+    def add(self, game):
+        if game.game_id in self._games:
+            self.remove(game.game_id)
+
+        self._games[game.game_id] = game
+        for index_name, keys in self._game_keys(game).items():
+            for key in keys:
+                self._game_index[index_name].setdefault(key, set()).add(game.game_id)
+        for i, drive in enumerate(game.drives):
+            for index_name, keys in self._drive_keys(game, drive).items():
+                for key in keys:
+                    self._drive_index[index_name].setdefault(key, set()).add((game.game_id, i))
+            self._add_totals(game, drive, 1)
+
+    def add_many(self, games):
+        for game in games:
+            self.add(game)
+
+    def remove(self, game_id: str):
+        game = self._games.pop(game_id)
+        for index_name, keys in self._game_keys(game).items():
+            for key in keys:
+                self._discard(self._game_index[index_name], key, game_id)
+        for i, drive in enumerate(game.drives):
+            for index_name, keys in self._drive_keys(game, drive).items():
+                for key in keys:
+                    self._discard(self._drive_index[index_name], key, (game_id, i))
+            self._add_totals(game, drive, -1)
+        return game
+
+    @staticmethod
+    def _discard(index: dict, key, value):
+        index[key].discard(value)
+        if not index[key]:
+            del index[key]
+
+    def _add_totals(self, game, drive, sign: int):
+        for group in GROUPS:
+            for key in _group_keys(group, game, drive):
+                totals = self._totals[group].setdefault(key, _Totals())
+                totals.add(drive, sign)
+                if not totals.drives:
+                    del self._totals[group][key]
+
+    def get(self, game_id: str):
+        return self._games.get(game_id)
+
+    # game_ids matching every given filter, or None if no filter was given (i.e. every game)
+    def _filter_game_ids(self, season: int = None, week: int = None, team: str = None, season_type: str = None):
+        candidates = []
+        if season is not None and week is not None:
+            candidates.append(self._game_index['season_week'].get((season, week), set()))
+        elif season is not None:
+            candidates.append(self._game_index['season'].get(season, set()))
+        elif week is not None:
+            candidates.append(set(x for k, v in self._game_index['season_week'].items() if k[1] == week for x in v))
+        if team is not None:
+            candidates.append(self._game_index['team'].get(team, set()))
+        if season_type is not None:
+            candidates.append(self._game_index['season_type'].get(season_type, set()))
+        if not candidates:
+            return None
+        return set.intersection(*sorted(candidates, key=len))
+
+    # Games matching every given filter, in game_id order. team matches either the home or away team
+    def games(self, season: int = None, week: int = None, team: str = None, season_type: str = None):
+        game_ids = self._filter_game_ids(season, week, team, season_type)
+        return [self._games[x] for x in sorted(self._games if game_ids is None else game_ids)]
+
+    # (Game, Drive) pairs matching every given filter, in game and drive order.
+    # team is the drive's possession team, start_min/start_max bound the drive start yard_int (inclusive) and
+    # quarter is the quarter the drive started in. Drives without a start never match a start_min/start_max
+    def drives(self, season: int = None, week: int = None, season_type: str = None, team: str = None,
+               game_id: str = None, start_min: int = None, start_max: int = None, quarter: int = None):
+        candidates = []
+        game_ids = self._filter_game_ids(season, week, None, season_type)
+        if game_id is not None:
+            game_ids = {game_id} if game_ids is None else game_ids & {game_id}
+        if game_ids is not None:
+            candidates.append(set(x for g in game_ids for x in self._drive_index['game'].get(g, ())))
+        if team is not None:
+            candidates.append(self._drive_index['team'].get(team, set()))
+        if start_min is not None or start_max is not None:
+            low = get_start_bucket(-50 if start_min is None else start_min)
+            high = get_start_bucket(50 if start_max is None else start_max)
+            candidates.append(set(x for k, v in self._drive_index['start_bucket'].items()
+                                  if k is not None and low <= k <= high for x in v))
+
+        if candidates:
+            keys = sorted(set.intersection(*sorted(candidates, key=len)))
+        else:
+            keys = [(g, i) for g in sorted(self._games) for i in range(len(self._games[g].drives))]
+
+        results = []
+        for g, i in keys:
+            game = self._games[g]
+            drive = game.drives[i]
+            # buckets at the edges of the range can hold drives just outside it
+            if start_min is not None and not (drive.start_yard_int is not None and drive.start_yard_int >= start_min):
+                continue
+            if start_max is not None and not (drive.start_yard_int is not None and drive.start_yard_int <= start_max):
+                continue
+            if quarter is not None and drive.start_quarter != quarter:
+                continue
+            results.append((game, drive))
+        return results
+
+    # drives, scoring drives, points, points per drive and scoring rate per group - one of GROUPS, or a function
+    # of (game, drive) returning the group key. The filters are the ones drives() takes. Returns {key: totals_dict}
+    def summarize(self, by: str = 'team', **filters):
+        if not filters and by in GROUPS:
+            return {k: v.to_dict() for k, v in sorted(self._totals[by].items(), key=lambda x: str(x[0]))}
+
+        group_keys = by if callable(by) else lambda game, drive: _group_keys(by, game, drive)[0]
+        totals = {}
+        for game, drive in self.drives(**filters):
+            totals.setdefault(group_keys(game, drive), _Totals()).add(drive)
+        return {k: v.to_dict() for k, v in sorted(totals.items(), key=lambda x: str(x[0]))}
+
+
+# build a GameStore of every game in a year range (end_year exclusive), like functions.get_games_for_years
+# summary=True (the default) skips the plays, which the store doesn't use
+def load_game_store(start_year: int, end_year: int, workers: int = 1, summary: bool = True):
+    store = GameStore(f.iter_games_for_years(start_year, end_year, workers, summary=summary))
+    logger.info('Loaded {} games into the game store'.format(len(store)))
+    return store
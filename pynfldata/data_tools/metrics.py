@@ -0,0 +1,232 @@
+"""Per-stage timings and counters for the ingest pipeline
+
+Stages are timed with `with metrics.timer('parse'):` and things are counted with metrics.count('plays', n). Each stage
+keeps a histogram of its wall times (fixed buckets, so memory doesn't grow with the number of games) plus its count,
+total, min and max. Stages and counters used by the package:
+    download, rate_limit_wait, schedule, raw_store_read, xml_parse, json_load, parse_pbp, drive_details, reconcile,
+    export, write, season, warehouse_load, validate
+    requests, bytes_downloaded, feed_cache_hits/misses/revalidated, raw_store_hits/misses, game_cache_hits/misses,
+    prefetch_downloads, games, drives, plays, reconciled_games, bad_games, failed_games
+
+get_summary() returns everything as one JSON-serializable dict and write_summary() saves it, e.g. once per run.
+Sinks added with add_sink() see every timing and count as it happens, and the summary on flush() - see LoggingSink for
+the interface. set_profile_game() (or the PYNFLDATA_PROFILE_GAME environment variable) runs cProfile over one game's
+parse and export and saves the stats.
+Worker processes keep their own metrics, which functions.iter_parse_games merges back into the parent's.
+"""
+import cProfile
+import contextlib
+import json
+import logging
+import os
+import threading
+import time
+
+# setup logging
+logger = logging.getLogger('metrics.py')
+handler = logging.StreamHandler()
+formatter = logging.Formatter('%(asctime)s %(levelname)-8s %(message)s')
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+logger.setLevel(logging.INFO)
+
+# upper bounds (seconds) of the histogram buckets - anything slower goes in the last, open-ended bucket
+HISTOGRAM_BOUNDS = [0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 60]
+
+
+class _Histogram:
+    __slots__ = ['count', 'total', 'min', 'max', 'buckets']
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self.buckets = [0] * (len(HISTOGRAM_BOUNDS) + 1)
+
+    def add(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        self.min = seconds if self.min is None else min(self.min, seconds)
+        self.max = seconds if self.max is None else max(self.max, seconds)
+        for i, bound in enumerate(HISTOGRAM_BOUNDS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+                return
+        self.buckets[-1] += 1
+
+    def merge(self, other: dict):
+        self.count += other['count']
+        self.total += other['total_secs']
+        if other['min_secs'] is not None:
+            self.min = other['min_secs'] if self.min is None else min(self.min, other['min_secs'])
+        if other['max_secs'] is not None:
+            self.max = other['max_secs'] if self.max is None else max(self.max, other['max_secs'])
+        self.buckets = [x + y for x, y in zip(self.buckets, other['buckets'])]
+
+    def to_dict(self):
+        return {'count': self.count,
+                'total_secs': self.total,
+                'mean_secs': self.total / self.count if self.count else None,
+                'min_secs': self.min,
+                'max_secs': self.max,
+                'bucket_bounds_secs': HISTOGRAM_BOUNDS + [None],
+                'buckets': list(self.buckets)}
+
+
+# Base class for metrics sinks, e.g. to forward to statsd or a time series database. Every method is optional
+class MetricsSink:
+    def timing(self, stage: str, seconds: float):
+        pass
+
+    def count(self, name: str, n: int):
+        pass
+
+    # called with the full summary when a run finishes
+    def flush(self, summary: dict):
+        pass
+
+
+# logs the summary of every run through the given logger
+class LoggingSink(MetricsSink):
+    def __init__(self, sink_logger: logging.Logger = None, level: int = logging.INFO):
+        self.logger = sink_logger if sink_logger is not None else logger
+        self.level = level
+
+    def flush(self, summary: dict):
+        stages = ', '.join('{} {:.3f}s/{}'.format(k, v['total_secs'], v['count']) for k, v in summary['stages'].items())
+        counters = ', '.join('{} {}'.format(k, v) for k, v in summary['counters'].items())
+        self.logger.log(self.level, 'Stages: {}. Counters: {}'.format(stages, counters))
+
+
+# appends every run's summary to a file as one JSON line
+class JSONLinesSink(MetricsSink):
+    def __init__(self, filename: str):
+        self.filename = filename
+
+    def flush(self, summary: dict):
+        os.makedirs(os.path.dirname(self.filename) or '.', exist_ok=True)
+        with open(self.filename, 'a') as outfile:
+            outfile.write(json.dumps(summary) + '\n')
+
+
+_lock = threading.Lock()
+_stages = {}
+_counters = {}
+_started_at = time.time()
+_sinks = []
+_profile_game_id = None
+_profile_filename = None
+
+
+@contextlib.contextmanager
+def timer(stage: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_timing(stage, time.perf_counter() - start)
+
+
+def record_timing(stage: str, seconds: float):
+    with _lock:
+        if stage not in _stages:
+            _stages[stage] = _Histogram()
+        _stages[stage].add(seconds)
+    for sink in _sinks:
+        sink.timing(stage, seconds)
+
+
+def count(name: str, n: int = 1):
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + n
+    for sink in _sinks:
+        sink.count(name, n)
+
+
+def add_sink(sink: MetricsSink):
+    _sinks.append(sink)
+
+
+def remove_sink(sink: MetricsSink):
+    _sinks.remove(sink)
+
+
+def reset():
+    global _started_at
+    with _lock:
+        _stages.clear()
+        _counters.clear()
+        _started_at = time.time()
+
+
+def get_summary():
+    with _lock:
+        return {'started_at': _started_at,
+                'wall_secs': time.time() - _started_at,
+                'stages': {k: v.to_dict() for k, v in sorted(_stages.items())},
+                'counters': dict(sorted(_counters.items()))}
+
+
+# return the summary and start over - used to ship a worker process's metrics back to its parent
+def drain():
+    summary = get_summary()
+    reset()
+    return summary
+
+
+# add a summary (e.g. from a worker process) into this process's metrics. Sinks only see it in the flushed summary
+def merge(summary: dict):
+    with _lock:
+        for stage, histogram in summary['stages'].items():
+            if stage not in _stages:
+                _stages[stage] = _Histogram()
+            _stages[stage].merge(histogram)
+        for name, n in summary['counters'].items():
+            _counters[name] = _counters.get(name, 0) + n
+
+
+# save the summary as JSON and hand it to every sink
+def write_summary(filename: str = None):
+    summary = get_summary()
+    if filename is not None:
+        os.makedirs(os.path.dirname(filename) or '.', exist_ok=True)
+        with open(filename, 'w') as outfile:
+            json.dump(summary, outfile, indent=1)
+    for sink in _sinks:
+        sink.flush(summary)
+    return summary
+
+
+# profile the next parse of game_id with cProfile, saving the stats to filename (output/profile_<game_id>.prof)
+# for pstats/snakeviz. None turns profiling off
+def set_profile_game(game_id: str, filename: str = None):
+    global _profile_game_id, _profile_filename
+    _profile_game_id = game_id
+    _profile_filename = filename or 'output/profile_{}.prof'.format(game_id)
+
+
+def get_profile_game():
+    return _profile_game_id, _profile_filename
+
+
+# context manager that profiles its body if game_id is the one picked with set_profile_game
+@contextlib.contextmanager
+def profile(game_id: str):
+    if game_id != _profile_game_id:
+        yield
+        return
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        os.makedirs(os.path.dirname(_profile_filename) or '.', exist_ok=True)
+        profiler.dump_stats(_profile_filename)
+        logger.info('Saved profile of game {} to {}'.format(game_id, _profile_filename))
+
+
+if os.environ.get('PYNFLDATA_PROFILE_GAME'):
+    set_profile_game(os.environ['PYNFLDATA_PROFILE_GAME'])
@@ -0,0 +1,12 @@
+"""Convert an existing data/ tree of per-game json files into the packed SQLite raw store
+
+usage: python -m pynfldata.data_tools.migrate_raw_store [src_folder] [dst_folder]
+src_folder defaults to data, dst_folder to <src_folder>/packed
+"""
+import os
+import sys
+from pynfldata.data_tools import raw_store
+
+src_folder = sys.argv[1] if len(sys.argv) > 1 else 'data'
+dst_folder = sys.argv[2] if len(sys.argv) > 2 else os.path.join(src_folder, 'packed')
+raw_store.migrate(raw_store.FileStore(src_folder), raw_store.SQLiteStore(dst_folder))
@@ -0,0 +1,99 @@
+"""Streaming newline-delimited JSON output for exported games
+
+Each game is written as one line as soon as it is exported, instead of collecting a season of export() dicts into a
+DataFrame first, so memory use doesn't grow with the number of games. Lines are produced by pandas exactly as
+pd.DataFrame(games_dicts).to_json(orient='records', lines=True) would write them, so the files are byte-identical to
+the ones written before. Output goes to a temporary file that is renamed into place once everything was written.
+"""
+import gzip
+import json
+import os
+import pandas as pd
+from pynfldata.data_tools import metrics
+
+
+# one exported game as the line pandas would write for it, including the trailing newline
+def to_json_line(game_dict: dict):
+    return pd.DataFrame([game_dict]).to_json(orient='records', lines=True)
+
+
+# context manager that writes exported games to filename (gzip-compressed if compress), e.g.
+#     with NDJSONWriter('output/drives_2019.json') as writer:
+#         for g in games:
+#             writer.write(g.export())
+class NDJSONWriter:
+    def __init__(self, filename: str, compress: bool = False):
+        self.filename = filename
+        self.compress = compress
+        self.num_lines = 0
+        folder, name = os.path.split(filename)
+        self._temp_filename = os.path.join(folder or '.', '.{}.tmp'.format(name))
+        self._file = None
+        self._discarded = False
+
+    def __enter__(self):
+        os.makedirs(os.path.dirname(self.filename) or '.', exist_ok=True)
+        if self.compress:
+            self._file = gzip.GzipFile(self._temp_filename, 'wb', mtime=0)
+        else:
+            self._file = open(self._temp_filename, 'wb')
+        return self
+
+    def write(self, game_dict: dict):
+        with metrics.timer('write'):
+            self.write_line(to_json_line(game_dict))
+
+    # write a line that was already serialized, e.g. one kept from a previous run's output
+    def write_line(self, line: str):
+        self._file.write(line.encode())
+        self.num_lines += 1
+
+    # throw away what was written, leaving any existing file at filename as it is
+    def discard(self):
+        self._discarded = True
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # pandas writes a lone newline for an empty DataFrame - keep doing the same
+        if exc_type is None and self.num_lines == 0:
+            self._file.write(b'\n')
+        self._file.close()
+        if exc_type is None and not self._discarded:
+            os.replace(self._temp_filename, self.filename)
+        else:
+            os.remove(self._temp_filename)
+        return False
+
+
+# write exported game dicts (any iterable, e.g. a generator) to filename. Returns the number of games written
+def write_games(game_dicts, filename: str, compress: bool = False):
+    with NDJSONWriter(filename, compress) as writer:
+        for game_dict in game_dicts:
+            writer.write(game_dict)
+    return writer.num_lines
+
+
+# read back the lines of a file written by NDJSONWriter one at a time, in file order, as (game_id, line) pairs with
+# newlines included
+def iter_lines(filename: str):
+    opener = gzip.open if filename.endswith('.gz') else open
+    with opener(filename, 'rt', encoding='utf-8', newline='') as fh:
+        for line in fh:
+            if line.strip():
+                yield get_line_game_id(line), line
+
+
+# read back the lines of a file written by NDJSONWriter as {game_id: line}, newlines included
+def read_lines(filename: str):
+    return dict(iter_lines(filename))
+
+
+# the game_ids of a file written by NDJSONWriter, without holding on to the lines
+def read_game_ids(filename: str):
+    return {game_id for game_id, _ in iter_lines(filename)}
+
+
+# game_id is the first key written by Game.export, so it can be read without parsing the whole line
+def get_line_game_id(line: str):
+    if line.startswith('{"game_id":"'):
+        return line[12:line.index('"', 12)]
+    return json.loads(line)['game_id']
@@ -1,7 +1,16 @@
 from dataclasses import dataclass
 import dataclasses as dc
 from pynfldata.data_tools import functions as f
+from pynfldata.data_tools import game_cache
+from pynfldata.data_tools import metrics
+from pynfldata.data_tools import pbp_parser
+from pynfldata.data_tools import team_functions
+from pynfldata.data_tools import transport
+import bisect
+import functools
+import json
 import logging
+import sys
 
 # setup logging
 logger = logging.getLogger('nfl_types.py')
@@ -12,31 +21,128 @@ logger.addHandler(handler)
 logger.setLevel(logging.DEBUG)
 
 
-@dataclass
-class Clock:
-    quarter: int
-    quarter_clock: str
+# Play, Drive, Clock and Yardline are slotted classes rather than dataclasses to keep a season's worth of them small.
+# Clock and Yardline values are immutable and shared - use Clock.of() and Yardline.of() to get one.
+# Plays and Drives store the underlying ints/strings inline and build (cached) Clock/Yardline objects on access
+
+
+# intern short, heavily repeated strings (team abbrs, play types) so every Play shares one copy
+def _intern(value):
+    return sys.intern(value) if type(value) is str else value
+
+
+# quarters come to us as strings - store them as small ints where possible
+def _to_int(value):
+    return int(value) if type(value) is str and value.isdigit() else value
+
+
+# feeds-rs gives us most numbers as strings - as ints, None if missing
+def _int_or_none(value):
+    return None if value is None or value == '' else int(value)
+
+
+# make repr of slotted classes look like the dataclass ones they replaced
+def _slots_repr(obj, fields):
+    return '{}({})'.format(type(obj).__name__, ', '.join('{}={!r}'.format(x, getattr(obj, x)) for x in fields))
+
+
+class _Immutable:
+    __slots__ = ()
+
+    def __setattr__(self, key, value):
+        raise AttributeError('{} is immutable'.format(type(self).__name__))
+
+    # instances are shared, so a copy is just the same object
+    def __reduce__(self):
+        return type(self).of, tuple(getattr(self, x) for x in self._key_fields)
+
+
+QUARTER_SECONDS = 15 * 60
+REGULATION_SECONDS = 4 * QUARTER_SECONDS
+
+
+# seconds left in the quarter from a "MM:SS" quarter clock, None if it's missing or not a clock
+def _get_clock_seconds(quarter_clock: str):
+    try:
+        minutes, seconds = quarter_clock.split(':')
+        return int(minutes) * 60 + int(seconds)
+    except (AttributeError, ValueError):
+        return None
+
+
+# (game seconds elapsed, game seconds remaining, half, half seconds remaining) for a quarter and quarter clock.
+# Overtime is half 3, and its remaining seconds are the ones left in the overtime period - its length has changed over
+# the years, so elapsed seconds count every overtime period as a full quarter. All None if the time is unknown
+def _get_clock_numbers(quarter: int, quarter_clock: str):
+    quarter_seconds = _get_clock_seconds(quarter_clock)
+    if type(quarter) is not int or quarter < 1 or quarter_seconds is None:
+        return None, None, None, None
+    elapsed = quarter * QUARTER_SECONDS - quarter_seconds
+    if quarter > 4:
+        return elapsed, quarter_seconds, 3, quarter_seconds
+    half_seconds = quarter_seconds + (QUARTER_SECONDS if quarter % 2 else 0)
+    return elapsed, REGULATION_SECONDS - elapsed, (quarter + 1) // 2, half_seconds
+
+
+# class to contain the game clock, with its numeric game and half times worked out once per distinct clock
+class Clock(_Immutable):
+    __slots__ = ('quarter', 'quarter_clock', 'game_seconds_elapsed', 'game_seconds_remaining', 'half',
+                 'half_seconds_remaining')
+    _key_fields = ('quarter', 'quarter_clock')
+
+    def __init__(self, quarter: int, quarter_clock: str):
+        quarter = _to_int(quarter)
+        object.__setattr__(self, 'quarter', quarter)
+        object.__setattr__(self, 'quarter_clock', _intern(quarter_clock))
+        for name, value in zip(self.__slots__[2:], _get_clock_numbers(quarter, quarter_clock)):
+            object.__setattr__(self, name, value)
+
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def of(quarter: int, quarter_clock: str):
+        return Clock(quarter, quarter_clock)
+
+    def __eq__(self, other):
+        return type(other) is Clock and (self.quarter, self.quarter_clock) == (other.quarter, other.quarter_clock)
+
+    def __hash__(self):
+        return hash((self.quarter, self.quarter_clock))
 
     def __repr__(self):
         return 'Q{} {}'.format(str(self.quarter), self.quarter_clock)
 
+
 # class to contain yardline data. It comes to us as "TEAM yardline" like SEA 25, so include int (-50:50)
-@dataclass
-class Yardline:
-    yard_int: int
-    side: str = dc.field(default=None, init=False)
-    side_pos: int = dc.field(default=None, init=False)
-
-    def __post_init__(self):
-        if self.yard_int is None:
-            self.side = None
-            self.side_pos = None
-        elif self.yard_int == 0:
-            self.side = 'OWN'
-            self.side_pos = 50
+# and the yards the possession team has left to the opponent's end zone (100 at its own goal line)
+class Yardline(_Immutable):
+    __slots__ = ('yard_int', 'side', 'side_pos', 'yards_to_end_zone')
+    _key_fields = ('yard_int',)
+
+    def __init__(self, yard_int: int):
+        if yard_int is None:
+            side = None
+            side_pos = None
+        elif yard_int == 0:
+            side = 'OWN'
+            side_pos = 50
         else:
-            self.side = 'OWN' if self.yard_int <= 0 else 'OPP'
-            self.side_pos = 50 + self.yard_int if self.yard_int <= 0 else 50 - self.yard_int
+            side = 'OWN' if yard_int <= 0 else 'OPP'
+            side_pos = 50 + yard_int if yard_int <= 0 else 50 - yard_int
+        object.__setattr__(self, 'yard_int', yard_int)
+        object.__setattr__(self, 'side', side)
+        object.__setattr__(self, 'side_pos', side_pos)
+        object.__setattr__(self, 'yards_to_end_zone', None if yard_int is None else 50 - yard_int)
+
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def of(yard_int: int):
+        return Yardline(yard_int)
+
+    def __eq__(self, other):
+        return type(other) is Yardline and self.yard_int == other.yard_int
+
+    def __hash__(self):
+        return hash(self.yard_int)
 
     def __repr__(self):
         if self.yard_int == 0:
@@ -48,23 +154,60 @@ class Yardline:
 __scoring_dict__ = {'TD': 6, 'FG': 3, 'PAT': 1, 'PAT2': 2, 'SFTY': 2}
 __fake_plays__ = ['TIMEOUT', 'END_QUARTER', 'END_HALF', 'END_GAME', 'COMMENT']
 
+
 # class to contain Play data, uses above dict to calculate points
-@dataclass
+# yardline and play_time are stored as yard_int/quarter/quarter_clock and exposed as shared Yardline/Clock objects
 class Play:
-    play_id: int
-    pos_team: str
-    description: str
-    yardline: Yardline
-    play_time: Clock  # fixme this is wrong in most JSONs, dunno how to deal with
-    play_type: str
-    real_play: bool  # False if it's a end of quarter, timeout, etc
-    down: int
-    yards_to_go: int
-    yards: int
-    penalty: bool
-    scoring_type: str = None
-    scoring_team_abbr: str = None
-    points: int = 0
+    __slots__ = ('play_id', 'pos_team', 'description', 'yard_int', 'quarter', 'quarter_clock', 'play_type',
+                 'real_play', 'down', 'yards_to_go', 'yards', 'penalty', 'scoring_type', 'scoring_team_abbr', 'points')
+    _fields = ('play_id', 'pos_team', 'description', 'yardline', 'play_time', 'play_type', 'real_play', 'down',
+               'yards_to_go', 'yards', 'penalty', 'scoring_type', 'scoring_team_abbr', 'points')
+
+    def __init__(self, play_id: int, pos_team: str, description: str, yardline: Yardline,
+                 play_time: Clock,  # fixme this is wrong in most JSONs, dunno how to deal with
+                 play_type: str,
+                 real_play: bool,  # False if it's a end of quarter, timeout, etc
+                 down: int, yards_to_go: int, yards: int, penalty: bool,
+                 scoring_type: str = None, scoring_team_abbr: str = None, points: int = 0):
+        self.play_id = play_id
+        self.pos_team = _intern(pos_team)
+        self.description = description
+        self.yardline = yardline
+        self.play_time = play_time
+        self.play_type = _intern(play_type)
+        self.real_play = real_play
+        self.down = _intern(down)
+        self.yards_to_go = _intern(yards_to_go)
+        self.yards = _intern(yards)
+        self.penalty = penalty
+        self.scoring_type = _intern(scoring_type)
+        self.scoring_team_abbr = _intern(scoring_team_abbr)
+        self.points = points
+
+    @property
+    def yardline(self):
+        return Yardline.of(self.yard_int)
+
+    @yardline.setter
+    def yardline(self, yardline: Yardline):
+        self.yard_int = yardline.yard_int
+
+    @property
+    def play_time(self):
+        return Clock.of(self.quarter, self.quarter_clock)
+
+    @play_time.setter
+    def play_time(self, play_time: Clock):
+        self.quarter = play_time.quarter
+        self.quarter_clock = play_time.quarter_clock
+
+    def __eq__(self, other):
+        if type(other) is not Play:
+            return NotImplemented
+        return all(getattr(self, x) == getattr(other, x) for x in self.__slots__)
+
+    def __repr__(self):
+        return _slots_repr(self, self._fields)
 
     # Given a scoring play, calculate points using the above dictionary
     def calculate_points(self):
@@ -72,82 +215,182 @@ class Play:
             self.points = __scoring_dict__.get(self.scoring_type)
 
 
-# class to contain Drive data. Contains all plays in drive, and some post_init calculated fields
-@dataclass
-class Drive:
-    drive_id: int
-    plays: list
-    pos_team: str
-    drive_start: Yardline = dc.field(default=None, init=False)
-    start_time: Clock = dc.field(default=None, init=False)
-    scoring_team: str = dc.field(default=None, init=False)
-    points: int = dc.field(default=None, init=False)
-
-    # After being initialized, calculate points for all plays then the drive, then calculate the drive start
-    def __post_init__(self):
-        [x.calculate_points() for x in self.plays]
-        self.calculate_scoring()
-        self.drive_start, self.start_time = self.calculate_drive_start(self.plays)
+# class to contain the drive-level fields of a Drive, without its plays - what Game.get_game_details(summary=True) keeps
+class DriveSummary:
+    __slots__ = ('drive_id', 'pos_team', 'start_yard_int', 'start_quarter', 'start_quarter_clock', 'scoring_team',
+                 'points', 'num_real_plays', 'has_duplicate_plays')
+    _fields = ('drive_id', 'pos_team', 'drive_start', 'start_time', 'scoring_team', 'points')
+    _state = __slots__
+
+    def __init__(self, drive_id: int, pos_team: str, drive_start: Yardline, start_time: Clock, scoring_team: str = None,
+                 points: int = None, num_real_plays: int = 0, has_duplicate_plays: bool = False):
+        self.drive_id = drive_id
+        self.pos_team = _intern(pos_team)
+        self.drive_start = drive_start
+        self.start_time = start_time
+        self.scoring_team = _intern(scoring_team)
+        self.points = points
+        self.num_real_plays = num_real_plays
+        self.has_duplicate_plays = has_duplicate_plays
+
+    # the summary of a full Drive
+    @staticmethod
+    def of(drive):
+        return DriveSummary(drive.drive_id, drive.pos_team, drive.drive_start, drive.start_time, drive.scoring_team,
+                            drive.points, drive.num_real_plays, drive.has_duplicate_plays)
+
+    @property
+    def drive_start(self):
+        return Yardline.of(self.start_yard_int)
+
+    @drive_start.setter
+    def drive_start(self, drive_start: Yardline):
+        self.start_yard_int = drive_start.yard_int
+
+    @property
+    def start_time(self):
+        return Clock.of(self.start_quarter, self.start_quarter_clock)
+
+    @start_time.setter
+    def start_time(self, start_time: Clock):
+        self.start_quarter = start_time.quarter
+        self.start_quarter_clock = start_time.quarter_clock
+
+    def __eq__(self, other):
+        if type(other) is not type(self):
+            return NotImplemented
+        return all(getattr(self, x) == getattr(other, x) for x in self._state)
 
-    # Function to calculate the starting yardline of a drive given the drive's plays
-    # Complicated as some drives' first play has no yardline or is a kickoff, hence the recursion
-    def calculate_drive_start(self, plays_list):
-        if len(plays_list) == 1 and plays_list[0].play_type == 'KICK_OFF':
-            return Yardline(None), Clock(None, None)
-        elif plays_list[0].play_type in __fake_plays__:  # drives after a score have play 1 being a kickoff - discard
-            return self.calculate_drive_start(plays_list[1:])
-        elif plays_list[0].yardline is not None:
-            return plays_list[0].yardline, plays_list[0].play_time
+    def __repr__(self):
+        return _slots_repr(self, self._fields)
+
+    # add one play's points to the drive's points and scoring team. Plays added after correct_drive_team has run
+    # (reconciled scoring plays) pass the season_year, so their scoring team is compared with - and stored as - the
+    # same season's abbr the drive's teams were corrected to
+    def _add_points(self, play, season_year: int = None):
+        play.calculate_points()
+        if not play.points:
+            return
+        scoring_team = play.scoring_team_abbr
+        if season_year is not None:
+            scoring_team = team_functions.get_season_abbr(scoring_team, season_year)
+        if self.points is None:
+            self.points = play.points
+            self.scoring_team = _intern(scoring_team)
         else:
-            logger.debug("Drive's first play has no yardline: {}".format(plays_list[0]))
-            return self.calculate_drive_start(plays_list[1:])
-
-    # Given the drive's plays, calculate drive's score and ensure only one team scored
-    def calculate_scoring(self):
-        if any([x.points for x in self.plays]):
-            self.points = sum([x.points for x in self.plays])
-            scoring_team_list = [x.scoring_team_abbr for x in self.plays if x.points != 0]
-            if all(x != scoring_team_list[0] for x in scoring_team_list):
-                logger.warning("Different teams are listed as scoring in this drive! {}".format(scoring_team_list))
-            self.scoring_team = scoring_team_list[0]
+            self.points += play.points
+            # ensure only one team scored
+            if scoring_team != self.scoring_team:
+                logger.warning("Different teams are listed as scoring in this drive! {}"
+                               .format([self.scoring_team, scoring_team]))
+
+    # add a (reconciled) scoring play's points to the drive - a summary doesn't keep the play itself
+    def append_play(self, play, season_year: int = None):
+        self._add_points(play, season_year)
+        if play.real_play:
+            self.num_real_plays += 1
 
     # For some stupid reason, newly-downloaded files have some issues with team names being post-change ones
-    # This should fix that
+    # This should fix that, using the same abbr history as team_functions.make_teams_continuous
     def correct_drive_team(self, season_year):
-        if self.pos_team == 'JAX' and season_year < 2013:
-            self.pos_team = 'JAC'
-        if self.scoring_team == 'JAX' and season_year < 2013:
-            self.scoring_team = 'JAC'
-
-        if self.pos_team == 'LAC' and season_year <= 2017:
-            self.pos_team = 'SD'
-        if self.scoring_team == 'LAC' and season_year <= 2017:
-            self.scoring_team = 'SD'
+        self.pos_team = team_functions.get_season_abbr(self.pos_team, season_year)
+        if self.scoring_team is not None:
+            self.scoring_team = team_functions.get_season_abbr(self.scoring_team, season_year)
+
+
+# class to contain Drive data. Contains all plays in drive, and some calculated fields
+class Drive(DriveSummary):
+    __slots__ = ('plays',)
+    _fields = ('drive_id', 'plays', 'pos_team', 'drive_start', 'start_time', 'scoring_team', 'points')
+    _state = ('drive_id', 'plays') + DriveSummary.__slots__[1:]
+
+    # After being initialized, calculate points, scoring, drive start and play counts in one pass over the plays
+    def __init__(self, drive_id: int, plays: list, pos_team: str):
+        self.drive_id = drive_id
+        self.plays = plays
+        self.pos_team = _intern(pos_team)
+        self._scan_plays()
+
+    # Single pass over the plays: calculate each play's points, the drive's points and scoring team, the number of
+    # real plays, whether any play_id is repeated, and the drive start
+    def _scan_plays(self):
+        self.points = None
+        self.scoring_team = None
+        self.num_real_plays = 0
+        self.has_duplicate_plays = False
+        start_play = None
+        play_ids = set()
+
+        num_plays = len(self.plays)
+        for i, play in enumerate(self.plays):
+            self._add_to_totals(play, play_ids)
+
+            # the drive starts at the first play that isn't a timeout, end of quarter, etc.
+            # drives after a score have play 1 being a kickoff - if that's the drive's only play it has no start
+            if start_play is None:
+                if i == num_plays - 1 and play.play_type == 'KICK_OFF':
+                    start_play = False
+                elif play.play_type not in __fake_plays__:
+                    start_play = play
+
+        if start_play is None:
+            raise IndexError('Drive {} has no plays to start from'.format(self.drive_id))
+        elif start_play is False:
+            self.drive_start, self.start_time = Yardline.of(None), Clock.of(None, None)
+        else:
+            self.drive_start, self.start_time = start_play.yardline, start_play.play_time
+
+    # add one play's contribution to the drive's points, scoring team, real play count and duplicate check
+    def _add_to_totals(self, play, play_ids, season_year: int = None):
+        self._add_points(play, season_year)
+        if play.real_play:
+            self.num_real_plays += 1
+        if play.play_id in play_ids:
+            self.has_duplicate_plays = True
+        play_ids.add(play.play_id)
+
+    # add a play to the end of the drive, updating the calculated fields without rescanning the other plays
+    # (the drive start can't change, as it comes from the earliest plays). season_year as for _add_points
+    def append_play(self, play, season_year: int = None):
+        play_ids = set(x.play_id for x in self.plays) if not self.has_duplicate_plays else set()
+        self.plays.append(play)
+        self._add_to_totals(play, play_ids, season_year)
 
-        if self.pos_team == 'LA' and season_year <= 2016:
-            self.pos_team = 'STL'
-        if self.scoring_team == 'LA' and season_year <= 2016:
-            self.scoring_team = 'STL'
+    # Function to calculate the starting yardline of a drive given the drive's plays
+    # Some drives' first play is a timeout or a kickoff, so skip those
+    def calculate_drive_start(self, plays_list):
+        for i, play in enumerate(plays_list):
+            if i == len(plays_list) - 1 and play.play_type == 'KICK_OFF':
+                return Yardline.of(None), Clock.of(None, None)
+            elif play.play_type not in __fake_plays__:
+                return play.yardline, play.play_time
+        raise IndexError('Drive {} has no plays to start from'.format(self.drive_id))
+
+    # Given the drive's plays, recalculate drive's score, start and counts, e.g. after changing the plays list
+    def calculate_scoring(self):
+        self._scan_plays()
 
 
-# Return a Play object, given a play dictionary
-def _process_play_dict(play: dict):  # DRY
-    # calculate Yardline - there are issues with midfield so do this separately
+# calculate a play's Yardline from its play dictionary - there are issues with midfield so do this separately
+def _get_yardline(play: dict):
     if play.get('@playType') in __fake_plays__:
-        yardline = Yardline(None)
+        return Yardline.of(None)
     elif play.get('@yardlineNumber', None) == '50':
-        yardline = Yardline(0)
+        return Yardline.of(0)
     elif play.get('@yardlineSide', None) is not None:
-        yardline = Yardline((-1 if play['@teamId'] == play['@yardlineSide'] else 1) * (
-                                 50 - int(play['@yardlineNumber'])))
+        return Yardline.of((-1 if play['@teamId'] == play['@yardlineSide'] else 1) * (
+                            50 - int(play['@yardlineNumber'])))
     else:
-        yardline = Yardline(None)
+        return Yardline.of(None)
+
 
+# Return a Play object, given a play dictionary
+def _process_play_dict(play: dict):  # DRY
     return Play(int(play.get('@playId', None)),
                 play.get('@teamId', None),
                 play.get('playDescription', None),
-                yardline,
-                Clock(play.get('@quarter', None), play.get('@time', None)),
+                _get_yardline(play),
+                Clock.of(play.get('@quarter', None), play.get('@time', None)),
                 play.get('@playType', None),
                 play.get('@playType', '') not in __fake_plays__,
                 play.get('@down', None),
@@ -159,6 +402,55 @@ def _process_play_dict(play: dict):  # DRY
 
 # class to hold Game data. Has some fields meant to be input on init (from the NFL schedule XML)
 # and some fields added later (from boxscorePbP XML)
+# drives are fetched and parsed on first access, at full detail. get_game_details(summary=True) instead keeps only
+# DriveSummary objects, without plays - load_plays() or get_drive() get the plays later if they turn out to be needed
+# reconciled_play_ids lists the scoring plays the last parse had to add to the drives (see
+# _remedy_incorrect_scoreline), or is None if the drives came from the game cache and weren't parsed
+# one play as a record - the one place Game.export, parquet_writer and columnar get a play's fields from.
+# numbers gives down, yards_to_go and yards as ints instead of the strings feeds-rs has them as
+def _play_record(play, numbers: bool = False, descriptions: bool = True):
+    yardline, play_time = play.yardline, play.play_time
+    scored = play.points > 0
+    return {'play_id': play.play_id,
+            'yardline': {'side': yardline.side,
+                         'side_pos': yardline.side_pos,
+                         'yard_int': yardline.yard_int},
+            'yards_to_end_zone': yardline.yards_to_end_zone,
+            'game_seconds_elapsed': play_time.game_seconds_elapsed,
+            'game_seconds_remaining': play_time.game_seconds_remaining,
+            'half': play_time.half,
+            'half_seconds_remaining': play_time.half_seconds_remaining,
+            'down': _int_or_none(play.down) if numbers else play.down,
+            'yards_to_go': _int_or_none(play.yards_to_go) if numbers else play.yards_to_go,
+            'yards': _int_or_none(play.yards) if numbers else play.yards,
+            'penalty': play.penalty,
+            'play_type': play.play_type,
+            'real_play': play.real_play,
+            'points': play.points if scored else None,
+            'scoring_team': play.scoring_team_abbr if scored else None,
+            'description': play.description if descriptions else None}
+
+
+# one drive as a record, plays included (see _play_record) unless it's a DriveSummary
+def _drive_record(drive, numbers: bool = False, descriptions: bool = True):
+    drive_start, start_time = drive.drive_start, drive.start_time
+    drive_data = {'drive_id': drive.drive_id,
+                  'drive_pos_team': drive.pos_team,
+                  'drive_start': drive_start.yard_int,
+                  'drive_start_time': str(start_time),
+                  'drive_start_yards_to_end_zone': drive_start.yards_to_end_zone,
+                  'drive_start_game_seconds_elapsed': start_time.game_seconds_elapsed,
+                  'drive_start_game_seconds_remaining': start_time.game_seconds_remaining,
+                  'drive_start_half': start_time.half,
+                  'drive_start_half_seconds_remaining': start_time.half_seconds_remaining,
+                  'drive_num_plays': drive.num_real_plays,
+                  'drive_scoring_team': drive.scoring_team,
+                  'drive_points': drive.points}
+    if type(drive) is not DriveSummary:
+        drive_data['plays'] = [_play_record(play, numbers, descriptions) for play in drive.plays]
+    return drive_data
+
+
 @dataclass
 class Game:
     season_year: int
@@ -169,7 +461,23 @@ class Game:
     game_id: str
     home_score: int
     away_score: int
-    drives: list = dc.field(default=None, init=False)
+    _drives: list = dc.field(default=None, init=False)
+    reconciled_play_ids: list = dc.field(default=None, init=False, repr=False, compare=False)
+
+    @property
+    def drives(self):
+        if self._drives is None:
+            self.get_game_details()
+        return self._drives
+
+    @drives.setter
+    def drives(self, drives: list):
+        self._drives = drives
+
+    # True if the drives have been loaded as DriveSummary objects, without plays
+    @property
+    def is_summary(self):
+        return bool(self._drives) and type(self._drives[0]) is DriveSummary
 
     def __repr__(self):
         str_rep = """{year}_{type}_{week}, id={game_id}\t{away} ({away_score}) vs. {home} ({home_score})"""\
@@ -180,67 +488,138 @@ class Game:
         return str_rep
 
     # The NFL data doesn't include conversion attempts after a fumble/pick-six
-    def _remedy_incorrect_scoreline(self, full_dict):
-        # To remedy this, first get a list of all detected plays in all drives
-        detected_plays = [(x.drive_id, y) for x in self.drives for y in x.plays]
-
-        # The NFL JSON does include a full list of scoring plays separate from the drives object - get all plays here
-        scoring_plays = [_process_play_dict(x) for x in full_dict['scoringPlays']['play']]
-        [x.calculate_points() for x in scoring_plays]
-
-        # Get any scoring plays not found in Drives
-        undetected_plays = [x for x in scoring_plays if x not in [y[1] for y in detected_plays]]
+    # Plays are identified by play_id: a scoring play is missing if no drive has a play with its play_id.
+    # drive_play_ids are the play_ids of each drive, needed if the drives are DriveSummary objects.
+    # Returns the sorted play_ids of the plays that were added to drives
+    def _remedy_incorrect_scoreline(self, scoring_plays, drive_play_ids: list = None):
+        if drive_play_ids is None:
+            drive_play_ids = [[play.play_id for play in drive.plays] for drive in self.drives]
+        # To remedy this, first index all detected plays in all drives - play_id -> index of the drive holding it
+        drive_index = {}
+        for i, play_ids in enumerate(drive_play_ids):
+            for play_id in play_ids:
+                drive_index.setdefault(play_id, i)
+        detected_play_ids = sorted(drive_index)
+
+        # The NFL JSON does include a full list of scoring plays separate from the drives object - passed in here
+        if scoring_plays is None:
+            raise KeyError('scoringPlays')
 
         # If any scoring plays were unaccounted for, add them to the drive here
-        if len(undetected_plays) > 0:
-            for play in undetected_plays:
-                # find the play that comes right before the undetected play
-                max_play_id = max([x[1].play_id for x in detected_plays if x[1].play_id < play.play_id])
-                # get drive that includes that play
-                max_drive_id = [x[0] for x in detected_plays if x[1].play_id == max_play_id][0]
-                # add scoring play to the end of that drive
-                self.drives[max_drive_id - 1].plays.append(play)
-                # recalculate drive's points
-                self.drives[max_drive_id - 1].calculate_scoring()
-
-    def _get_drive_details(self, full_dict):
+        reconciled_play_ids = set()
+        for play in scoring_plays:
+            if play.play_id in drive_index or play.play_id in reconciled_play_ids:
+                continue
+            # find the play that comes right before the undetected play
+            position = bisect.bisect_left(detected_play_ids, play.play_id)
+            if position == 0:
+                raise ValueError('No play found before scoring play {} in game {}'.format(play.play_id, self.game_id))
+            # get drive that includes that play and add scoring play to the end of it, updating the drive's points
+            self.drives[drive_index[detected_play_ids[position - 1]]].append_play(play, self.season_year)
+            reconciled_play_ids.add(play.play_id)
+
+        return sorted(reconciled_play_ids)
+
+    # build Drives from the xmltodict version of the boxscorePbp feed, as stored by older versions of get_data
+    # returns (drives, scoring_plays) like pbp_parser.parse_boxscore_xml
+    @staticmethod
+    def _parse_game_dict(full_dict):
         drives_dict = full_dict['drives']['drive']
 
         drives_list = [Drive(int(float(x['@sequence'])),  # Python has some dumb bugs man
                              [_process_play_dict(y) for y in x['plays'].get('play')],
                              x['@possessionTeamAbbr']) for x in drives_dict]
 
+        scoring_plays = full_dict.get('scoringPlays')
+        if scoring_plays is not None:
+            scoring_plays = [_process_play_dict(x) for x in scoring_plays['play']]
+
+        return drives_list, scoring_plays
+
+    def _get_drive_details(self, drives_list):
         for drive in drives_list:
             drive.correct_drive_team(self.season_year)
 
         self.drives = drives_list
 
+    @property
+    def url(self):
+        return transport.get_url('boxscorePbp/{}.xml'.format(self.game_id))
+
     # given the game id, get boxscorePbP XML and populate Drives objects and all other Game fields
-    def get_game_details(self):
-        # Build URL, get XML, convert to dict, get out and store easy values
-        game_url = "http://www.nfl.com/feeds-rs/boxscorePbp/{}.xml".format(self.game_id)
-        logger.log(5, 'Getting game details {}'.format(game_url))
-        game_dict = f.get_data(game_url, 2, {'force_list': {'play': True}})['boxScorePBPFeed']
-
-        # Extract the 'drives'/'drive' dict and all data from within it
-        self._get_drive_details(game_dict)
+    # summary only keeps DriveSummary objects - the drive-level fields export() uses, without plays or descriptions
+    def get_game_details(self, summary: bool = False):
+        # games parsed by this version of the parser before come straight out of the game cache, if it's on
+        cache = game_cache.get_cache()
+        if cache is not None:
+            drives = cache.get(self)
+            if drives is not None:
+                self.drives = [DriveSummary.of(x) for x in drives] if summary else drives
+                self.reconciled_play_ids = None
+                metrics.count('game_cache_hits')
+                return self
+            metrics.count('game_cache_misses')
+
+        # Build URL, get XML, parse Drives and Plays straight out of it
+        logger.log(5, 'Getting game details {}'.format(self.url))
+        raw_data = f.get_raw_data(self.url, 2)
+        drive_play_ids = None
+        if f.is_json_data(raw_data):
+            with metrics.timer('json_load'):
+                full_dict = json.loads(raw_data)['boxScorePBPFeed']
+            with metrics.timer('parse_pbp'):
+                drives_list, scoring_plays = self._parse_game_dict(full_dict)
+                if summary:
+                    drive_play_ids = [[play.play_id for play in drive.plays] for drive in drives_list]
+                    drives_list = [DriveSummary.of(x) for x in drives_list]
+        elif summary:
+            with metrics.timer('parse_pbp'):
+                drives_list, drive_play_ids, scoring_plays = pbp_parser.parse_boxscore_summary(raw_data)
+        else:
+            with metrics.timer('parse_pbp'):
+                drives_list, scoring_plays = pbp_parser.parse_boxscore_xml(raw_data)
+
+        # Store the drives and all data from within them
+        with metrics.timer('drive_details'):
+            self._get_drive_details(drives_list)
+        metrics.count('drives', len(self.drives))
+        if not summary:
+            metrics.count('plays', sum(len(x.plays) for x in self.drives))
         # Check to see if plays/drives score matches game final score. If not, fix.
+        self.reconciled_play_ids = []
         if not self.check_score_integrity():
-            self._remedy_incorrect_scoreline(full_dict=game_dict)
+            with metrics.timer('reconcile'):
+                self.reconciled_play_ids = self._remedy_incorrect_scoreline(scoring_plays, drive_play_ids)
+            metrics.count('reconciled_games')
             if not self.check_score_integrity():
                 logger.warning('Game has incorrect scoreline!: {}'.format(self))
 
-        # Check to see if any duplicate plays
+        # Check to see if any duplicate plays - found while building the drives
         for drive in self.drives:
-            distinct_plays = set(x.play_id for x in drive.plays)
-            if len(distinct_plays) != len(drive.plays):
+            if drive.has_duplicate_plays:
                 logger.warning('Duplicate play_ids found')
 
+        if cache is not None and not summary:
+            cache.put(self)
+        return self
+
+    # replace drive summaries with full Drives, plays included
+    def load_plays(self):
+        if self.is_summary:
+            self.get_game_details()
         return self
 
+    # one full Drive, plays included. A summary game stays a summary - the full drives are parsed and then dropped
+    def get_drive(self, drive_id: int):
+        drives = dc.replace(self).get_game_details().drives if self.is_summary else self.drives
+        for drive in drives:
+            if drive.drive_id == drive_id:
+                return drive
+        raise KeyError('Game {} has no drive {}'.format(self.game_id, drive_id))
+
     # check to make sure that the number of points recorded within drives matches the top-level given result
     def check_score_integrity(self):
-        drives_points = sum([x.points for y in self.drives for x in y.plays])
+        drives_points = sum([x.points for x in self.drives if x.points])
         game_points = int(self.home_score) + int(self.away_score)
         return drives_points == game_points
 
@@ -252,6 +631,7 @@ class Game:
         return state
 
     # smart export - since I only need drive result, make this a drive-level line-output for file storage
+    # drives of a summary game have no 'plays'
     def export(self):
         game_data = {'game_id': self.game_id,
                      'season_year': self.season_year,
@@ -261,25 +641,6 @@ class Game:
                      'away_team': self.away_team,
                      'home_score': self.home_score,
                      'away_score': self.away_score,
-                     'drives': [{'drive_id': drive.drive_id,
-                                 'drive_pos_team': drive.pos_team,
-                                 'drive_start': drive.drive_start.yard_int,
-                                 'drive_start_time': str(drive.start_time),
-                                 'drive_num_plays': sum([1 for x in drive.plays if x.real_play]),
-                                 'drive_scoring_team': drive.scoring_team,
-                                 'drive_points': drive.points,
-                                 'plays': [{'play_id': play.play_id,
-                                            'yardline': play.yardline,
-                                            'down': play.down,
-                                            'yards_to_go': play.yards_to_go,
-                                            'yards': play.yards,
-                                            'penalty': play.penalty,
-                                            'play_type': play.play_type,
-                                            'real_play': play.real_play,
-                                            'points': play.points if play.points > 0 else None,
-                                            'scoring_team': play.scoring_team_abbr if play.points > 0 else None,
-                                            'description': play.description
-                                            } for play in drive.plays]
-                                 } for drive in self.drives]
+                     'drives': [_drive_record(drive) for drive in self.drives]
                      }
         return game_data
@@ -0,0 +1,113 @@
+"""Write Game data straight to a season-partitioned Parquet dataset, without Spark or a JSON round trip
+
+Layout is Hive-style, one folder per season and one file (a single row group) per season type and week:
+    output/drives.pq/season_year=2019/REG_01.parquet
+so a new week is added by writing one new file, and rerunning a week replaces only that week's file.
+Each row is one game with its drives, and each drive's plays, nested under it - see GAME_SCHEMA.
+Team and play_type columns are dictionary-encoded.
+"""
+import os
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from pynfldata.data_tools import nfl_types
+
+PLAY_TYPE = pa.struct([('play_id', pa.int32()),
+                       ('yardline', pa.struct([('side', pa.string()),
+                                               ('side_pos', pa.int8()),
+                                               ('yard_int', pa.int8())])),
+                       ('yards_to_end_zone', pa.int8()),
+                       ('game_seconds_elapsed', pa.int16()),
+                       ('game_seconds_remaining', pa.int16()),
+                       ('half', pa.int8()),
+                       ('half_seconds_remaining', pa.int16()),
+                       ('down', pa.int8()),
+                       ('yards_to_go', pa.int16()),
+                       ('yards', pa.int16()),
+                       ('penalty', pa.bool_()),
+                       ('play_type', pa.string()),
+                       ('real_play', pa.bool_()),
+                       ('points', pa.int8()),
+                       ('scoring_team', pa.string()),
+                       ('description', pa.string())])
+
+DRIVE_TYPE = pa.struct([('drive_id', pa.int16()),
+                        ('drive_pos_team', pa.string()),
+                        ('drive_start', pa.int8()),
+                        ('drive_start_time', pa.string()),
+                        ('drive_start_yards_to_end_zone', pa.int8()),
+                        ('drive_start_game_seconds_elapsed', pa.int16()),
+                        ('drive_start_game_seconds_remaining', pa.int16()),
+                        ('drive_start_half', pa.int8()),
+                        ('drive_start_half_seconds_remaining', pa.int16()),
+                        ('drive_num_plays', pa.int16()),
+                        ('drive_scoring_team', pa.string()),
+                        ('drive_points', pa.int8()),
+                        ('plays', pa.list_(PLAY_TYPE))])
+
+# season_year is the partition column, so it isn't stored in the files themselves
+GAME_SCHEMA = pa.schema([('game_id', pa.string()),
+                         ('season_type', pa.string()),
+                         ('game_week', pa.int16()),
+                         ('home_team', pa.string()),
+                         ('away_team', pa.string()),
+                         ('home_score', pa.int16()),
+                         ('away_score', pa.int16()),
+                         ('drives', pa.list_(DRIVE_TYPE))])
+
+DICTIONARY_COLUMNS = ['season_type', 'home_team', 'away_team',
+                      'drives.list.element.drive_pos_team',
+                      'drives.list.element.drive_scoring_team',
+                      'drives.list.element.plays.list.element.play_type',
+                      'drives.list.element.plays.list.element.scoring_team']
+
+
+# build the nested record for one game, matching Game.export() but with numbers as numbers.
+# The drives of a summary game (see Game.get_game_details) have no plays, which come out as null
+def _game_record(game, descriptions: bool = True):
+    return {'game_id': game.game_id,
+            'season_type': game.season_type,
+            'game_week': game.game_week,
+            'home_team': game.home_team,
+            'away_team': game.away_team,
+            'home_score': nfl_types._int_or_none(game.home_score),
+            'away_score': nfl_types._int_or_none(game.away_score),
+            'drives': [nfl_types._drive_record(drive, True, descriptions) for drive in game.drives]
+            }
+
+
+# path of the file holding one week of a season
+def get_week_filename(root: str, season_year: int, season_type: str, game_week: int):
+    return os.path.join(root, 'season_year={}'.format(season_year), '{}_{:02d}.parquet'.format(season_type, game_week))
+
+
+# write one week's games (all from the same season, season type and week) as a single row group,
+# replacing that week's file if it already exists
+def write_week(games: list, root: str, descriptions: bool = True):
+    season_year, season_type, game_week = games[0].season_year, games[0].season_type, games[0].game_week
+    filename = get_week_filename(root, season_year, season_type, game_week)
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+
+    table = pa.Table.from_pylist([_game_record(g, descriptions) for g in games], schema=GAME_SCHEMA)
+    # write next to the final file and rename, so readers never see half a week. Dot files are ignored by readers
+    temp_filename = os.path.join(os.path.dirname(filename), '.{}.tmp'.format(os.path.basename(filename)))
+    pq.write_table(table, temp_filename, row_group_size=max(len(games), 1), use_dictionary=DICTIONARY_COLUMNS,
+                   compression='snappy')
+    os.replace(temp_filename, filename)
+    return filename
+
+
+# write any number of games, grouped into one file per season/season type/week. Returns the files written
+def write_games(games: list, root: str = 'output/drives.pq', descriptions: bool = True):
+    weeks = {}
+    for game in games:
+        weeks.setdefault((game.season_year, game.season_type, game.game_week), []).append(game)
+    return [write_week(weeks[week], root, descriptions) for week in sorted(weeks)]
+
+
+# read the dataset (or some seasons of it) back as a pyarrow Table, with season_year restored from the folder names
+def read_games(root: str = 'output/drives.pq', seasons: list = None):
+    dataset = ds.dataset(root, format='parquet', partitioning='hive')
+    if seasons is not None:
+        return dataset.to_table(filter=ds.field('season_year').isin(seasons))
+    return dataset.to_table()
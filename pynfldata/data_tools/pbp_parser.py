@@ -0,0 +1,137 @@
+"""Streaming parser for boxscorePbp xml
+
+Builds Play and Drive objects directly as <play> and <drive> elements close, instead of converting the whole document
+with xmltodict and walking the resulting dict afterwards. Elements are cleared as soon as they are used so only one
+drive is held in memory at a time. The scoringPlays block is collected alongside, for Game._remedy_incorrect_scoreline.
+Results are identical to building the same objects from the xmltodict version of the document.
+parse_boxscore_summary skips the plays altogether, building DriveSummary objects straight from the play attributes.
+"""
+import io
+import xml.etree.ElementTree as ET
+from pynfldata.data_tools import nfl_types
+
+
+# the text of a play's description, stripped the same way xmltodict does it
+def _get_description(play_elem):
+    description = play_elem.findtext('playDescription')
+    return (description.strip() or None) if description is not None else None
+
+
+# build a Play from a <play> element, via the same dict shape xmltodict would have produced
+def _process_play_elem(play_elem):
+    play_dict = {'@' + k: v for k, v in play_elem.attrib.items()}
+    play_dict['playDescription'] = _get_description(play_elem)
+    return nfl_types._process_play_dict(play_dict)
+
+
+# builds a DriveSummary from a drive's <play> attributes as they're parsed, without making Play objects.
+# Follows Drive._scan_plays: the drive starts at its first play that isn't a timeout, end of quarter, etc., unless
+# that's a kickoff that is also the drive's last play
+class _DriveSummaryBuilder:
+    def __init__(self):
+        self.play_ids = []
+        # the same play_ids as a set, for the duplicate check
+        self._seen_play_ids = set()
+        self.points = None
+        self.scoring_team = None
+        self.num_real_plays = 0
+        self.has_duplicate_plays = False
+        self.start = None
+
+    def add(self, attrib: dict):
+        play_id = int(attrib.get('playId'))
+        play_type = attrib.get('playType')
+        if play_id in self._seen_play_ids:
+            self.has_duplicate_plays = True
+        self._seen_play_ids.add(play_id)
+        self.play_ids.append(play_id)
+        if play_type not in nfl_types.__fake_plays__:
+            self.num_real_plays += 1
+            if self.start is None:
+                self.start = (len(self.play_ids) - 1, {'@' + k: v for k, v in attrib.items()})
+        points = nfl_types.__scoring_dict__.get(attrib.get('scoringType'))
+        if points:
+            scoring_team = attrib.get('scoringTeamId')
+            if self.points is None:
+                self.points = points
+                self.scoring_team = scoring_team
+            else:
+                self.points += points
+                if scoring_team != self.scoring_team:
+                    nfl_types.logger.warning("Different teams are listed as scoring in this drive! {}"
+                                             .format([self.scoring_team, scoring_team]))
+
+    def finish(self, drive_id: int, pos_team: str):
+        if self.start is None:
+            raise IndexError('Drive {} has no plays to start from'.format(drive_id))
+        index, start = self.start
+        if index == len(self.play_ids) - 1 and start.get('@playType') == 'KICK_OFF':
+            drive_start, start_time = nfl_types.Yardline.of(None), nfl_types.Clock.of(None, None)
+        else:
+            drive_start = nfl_types._get_yardline(start)
+            start_time = nfl_types.Clock.of(start.get('@quarter'), start.get('@time'))
+        return nfl_types.DriveSummary(drive_id, pos_team, drive_start, start_time, self.scoring_team, self.points,
+                                      self.num_real_plays, self.has_duplicate_plays)
+
+
+# parse a boxscorePbp xml string, returning (drives, scoring_plays)
+# drives is a list of Drive objects in document order, scoring_plays a list of Play objects from the scoringPlays block,
+# or None if the document doesn't have one
+def parse_boxscore_xml(xml_string: bytes):
+    drives, _, scoring_plays = _parse_boxscore(xml_string, False)
+    return drives, scoring_plays
+
+
+# like parse_boxscore_xml, but builds DriveSummary objects straight from the plays' attributes, skipping Play objects
+# and descriptions. Returns (drives, drive_play_ids, scoring_plays) - drive_play_ids holds the play_ids of each drive,
+# for Game._remedy_incorrect_scoreline
+def parse_boxscore_summary(xml_string: bytes):
+    return _parse_boxscore(xml_string, True)
+
+
+def _parse_boxscore(xml_string: bytes, summary: bool):
+    drives = None
+    drive_play_ids = []
+    scoring_plays = None
+    drive_plays = None
+    tags = []  # tags of the currently open elements
+
+    for event, elem in ET.iterparse(io.BytesIO(xml_string), events=('start', 'end')):
+        if event == 'start':
+            if not tags and elem.tag != 'boxScorePBPFeed':
+                raise KeyError('boxScorePBPFeed')
+            if elem.tag == 'drives' and len(tags) == 1:
+                drives = []
+            elif elem.tag == 'scoringPlays' and len(tags) == 1:
+                scoring_plays = []
+            elif elem.tag == 'drive' and tags[-1] == 'drives':
+                drive_plays = None
+            elif elem.tag == 'plays' and tags[-1] == 'drive':
+                drive_plays = _DriveSummaryBuilder() if summary else []
+            tags.append(elem.tag)
+            continue
+
+        tags.pop()
+        if elem.tag == 'play':
+            if tags[-1] == 'plays' and drive_plays is not None:
+                if summary:
+                    drive_plays.add(elem.attrib)
+                else:
+                    drive_plays.append(_process_play_elem(elem))
+            elif tags[-1] == 'scoringPlays':
+                scoring_plays.append(_process_play_elem(elem))
+            elem.clear()
+        elif elem.tag == 'drive' and tags[-1] == 'drives':
+            if drive_plays is None or not (drive_plays.play_ids if summary else drive_plays):
+                raise KeyError('play')
+            drive_id = int(float(elem.attrib['sequence']))
+            if summary:
+                drives.append(drive_plays.finish(drive_id, elem.attrib['possessionTeamAbbr']))
+                drive_play_ids.append(drive_plays.play_ids)
+            else:
+                drives.append(nfl_types.Drive(drive_id, drive_plays, elem.attrib['possessionTeamAbbr']))
+            elem.clear()
+
+    if drives is None:
+        raise KeyError('drives')
+    return drives, drive_play_ids, scoring_plays
@@ -0,0 +1,250 @@
+"""Storage backends for raw feeds-rs data, as used by functions.get_data
+
+FileStore is the original layout - one uncompressed data/<feed>/<key>.json per game, or <key>.xml for data stored as
+downloaded. SQLiteStore packs every key of a feed type and season into one indexed SQLite archive with zlib-compressed
+blobs, which avoids thousands of small files and lets a whole season be read with one query.
+
+The backend is chosen with set_store() or the PYNFLDATA_RAW_STORE environment variable ('files' or 'sqlite').
+Existing data/ trees can be converted with:
+    python -m pynfldata.data_tools.migrate_raw_store [src_folder] [dst_folder]
+"""
+import abc
+import logging
+import os
+import sqlite3
+import threading
+import zlib
+from pathlib import Path
+
+# setup logging
+logger = logging.getLogger('raw_store.py')
+handler = logging.StreamHandler()
+formatter = logging.Formatter('%(asctime)s %(levelname)-8s %(message)s')
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+logger.setLevel(logging.INFO)
+
+# the feeds-rs feeds a FileStore folder can hold. data/ also has folders that aren't feeds, like feed_cache and packed
+FEEDS = ['boxscorePbp', 'coach', 'schedules', 'scores', 'teams']
+
+
+# Base class for raw stores. Keys are grouped by feed (boxscorePbp, teams, etc.), data is the raw xml or json bytes
+class RawStore(abc.ABC):
+    @abc.abstractmethod
+    def get(self, feed: str, key: str):
+        pass
+
+    @abc.abstractmethod
+    def put(self, feed: str, key: str, data: bytes):
+        pass
+
+    # store many {key: data} pairs at once
+    def put_many(self, feed: str, data: dict):
+        for key, value in data.items():
+            self.put(feed, key, value)
+
+    # return the subset of keys that are already stored
+    def contains(self, feed: str, keys: list):
+        return {key for key in keys if self.get(feed, key) is not None}
+
+    # return {key: data} for every stored key in keys
+    def get_many(self, feed: str, keys: list):
+        data = {key: self.get(feed, key) for key in keys}
+        return {key: value for key, value in data.items() if value is not None}
+
+    # load many keys in one read so later get() calls don't touch the disk. A no-op unless the backend benefits
+    def prefetch(self, feed: str, keys: list):
+        pass
+
+    @abc.abstractmethod
+    def feeds(self):
+        pass
+
+    @abc.abstractmethod
+    def keys(self, feed: str):
+        pass
+
+    def close(self):
+        pass
+
+
+# One file per key, the original data/<feed>/<key>.json layout. Data stored as xml goes in <key>.xml instead
+class FileStore(RawStore):
+    def __init__(self, folder: str = 'data'):
+        self.folder = Path(folder)
+
+    # return the existing file for a key, or None
+    def _find(self, feed: str, key: str):
+        for extension in ('json', 'xml'):
+            filename = self.folder / feed / '{}.{}'.format(key, extension)
+            if filename.is_file():
+                return filename
+        return None
+
+    def get(self, feed: str, key: str):
+        filename = self._find(feed, key)
+        if filename is None:
+            return None
+        with open(filename, 'rb') as infile:
+            return infile.read()
+
+    def put(self, feed: str, key: str, data: bytes):
+        extension = 'json' if data.lstrip()[:1] == b'{' else 'xml'
+        filename = self.folder / feed / '{}.{}'.format(key, extension)
+        os.makedirs(filename.parent, exist_ok=True)
+        with open(filename, 'wb') as outfile:
+            outfile.write(data)
+
+    def contains(self, feed: str, keys: list):
+        return {key for key in keys if self._find(feed, key) is not None}
+
+    def feeds(self):
+        if not self.folder.is_dir():
+            return []
+        return sorted(x.name for x in self.folder.iterdir() if x.is_dir() and x.name in FEEDS and self.keys(x.name))
+
+    def keys(self, feed: str):
+        filenames = list((self.folder / feed).glob('*.json')) + list((self.folder / feed).glob('*.xml'))
+        return sorted(set(x.stem for x in filenames))
+
+
+# Keys go in one SQLite archive per feed and season, data/packed/<feed>/<season>.sqlite, compressed with zlib.
+# The season is the first four characters of the key (game ids start with the year), 'all' if they aren't digits.
+# Game ids are YYYYMMDDNN, so January and February games go with the previous year - the season they were played in
+class SQLiteStore(RawStore):
+    def __init__(self, folder: str = 'data/packed', compression_level: int = 6):
+        self.folder = Path(folder)
+        self.compression_level = compression_level
+        self._connections = {}
+        self._prefetched = {}
+        self._lock = threading.RLock()
+
+    # connections and prefetched data stay in the process that opened them, e.g. when sent to worker processes
+    def __getstate__(self):
+        return {'folder': self.folder, 'compression_level': self.compression_level}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    @staticmethod
+    def _season(key: str):
+        if not key[:4].isdigit():
+            return 'all'
+        if len(key) == 10 and key.isdigit() and key[4:6] in ('01', '02'):
+            return str(int(key[:4]) - 1)
+        return key[:4]
+
+    def _connection(self, feed: str, season: str, create: bool = True):
+        with self._lock:
+            if (feed, season) not in self._connections:
+                filename = self.folder / feed / '{}.sqlite'.format(season)
+                if not create and not filename.is_file():
+                    return None
+                os.makedirs(filename.parent, exist_ok=True)
+                conn = sqlite3.connect(str(filename), check_same_thread=False)
+                conn.execute('PRAGMA journal_mode=WAL')
+                conn.execute('PRAGMA synchronous=NORMAL')
+                conn.execute('CREATE TABLE IF NOT EXISTS raw (key TEXT PRIMARY KEY, data BLOB NOT NULL)')
+                self._connections[(feed, season)] = conn
+            return self._connections[(feed, season)]
+
+    # group keys by season so each archive is queried once
+    def _by_season(self, keys: list):
+        seasons = {}
+        for key in keys:
+            seasons.setdefault(self._season(key), []).append(key)
+        return seasons
+
+    def get(self, feed: str, key: str):
+        with self._lock:
+            if (feed, key) in self._prefetched:
+                return zlib.decompress(self._prefetched.pop((feed, key)))
+            conn = self._connection(feed, self._season(key), create=False)
+            row = conn.execute('SELECT data FROM raw WHERE key = ?', (key,)).fetchone() if conn else None
+        return zlib.decompress(row[0]) if row else None
+
+    def put(self, feed: str, key: str, data: bytes):
+        blob = zlib.compress(data, self.compression_level)
+        with self._lock:
+            conn = self._connection(feed, self._season(key))
+            with conn:
+                conn.execute('INSERT OR REPLACE INTO raw (key, data) VALUES (?, ?)', (key, blob))
+
+    # insert many {key: data} pairs, one transaction per season
+    def put_many(self, feed: str, data: dict):
+        with self._lock:
+            for season, keys in self._by_season(list(data)).items():
+                conn = self._connection(feed, season)
+                with conn:
+                    conn.executemany('INSERT OR REPLACE INTO raw (key, data) VALUES (?, ?)',
+                                     [(key, zlib.compress(data[key], self.compression_level)) for key in keys])
+
+    def _select(self, feed: str, keys: list, column: str):
+        rows = []
+        with self._lock:
+            for season, season_keys in self._by_season(keys).items():
+                conn = self._connection(feed, season, create=False)
+                if conn is None:
+                    continue
+                # stay under SQLite's bound-parameter limit
+                for i in range(0, len(season_keys), 500):
+                    chunk = season_keys[i:i + 500]
+                    query = 'SELECT {} FROM raw WHERE key IN ({})'.format(column, ','.join('?' * len(chunk)))
+                    rows += conn.execute(query, chunk).fetchall()
+        return rows
+
+    def contains(self, feed: str, keys: list):
+        return {row[0] for row in self._select(feed, keys, 'key')}
+
+    def get_many(self, feed: str, keys: list):
+        return {row[0]: zlib.decompress(row[1]) for row in self._select(feed, keys, 'key, data')}
+
+    def prefetch(self, feed: str, keys: list):
+        rows = self._select(feed, keys, 'key, data')
+        with self._lock:
+            self._prefetched.update({(feed, row[0]): row[1] for row in rows})
+
+    def feeds(self):
+        if not self.folder.is_dir():
+            return []
+        return sorted(x.name for x in self.folder.iterdir() if x.is_dir())
+
+    def keys(self, feed: str):
+        keys = []
+        for filename in sorted((self.folder / feed).glob('*.sqlite')):
+            conn = self._connection(feed, filename.stem)
+            keys += [row[0] for row in conn.execute('SELECT key FROM raw ORDER BY key')]
+        return keys
+
+    def close(self):
+        with self._lock:
+            for conn in self._connections.values():
+                conn.close()
+            self._connections = {}
+            self._prefetched = {}
+
+
+_store = None
+
+
+# return the configured store, building it from PYNFLDATA_RAW_STORE on first use
+def get_store():
+    global _store
+    if _store is None:
+        _store = SQLiteStore() if os.environ.get('PYNFLDATA_RAW_STORE') == 'sqlite' else FileStore()
+    return _store
+
+
+def set_store(store: RawStore):
+    global _store
+    _store = store
+
+
+# copy every key of every feed from one store into another
+def migrate(src: RawStore, dst: RawStore, batch_size: int = 500):
+    for feed in src.feeds():
+        keys = src.keys(feed)
+        for i in range(0, len(keys), batch_size):
+            dst.put_many(feed, src.get_many(feed, keys[i:i + batch_size]))
+        logger.info('Migrated {} {} keys'.format(len(keys), feed))
+
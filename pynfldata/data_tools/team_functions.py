@@ -1,49 +1,115 @@
 """Functions that apply to a whole team to make some sort of change to the team's data"""
+import numpy as np
 import pandas as pd
-import functools
+
+# Every abbreviation change or franchise move since 1969 as (abbr, first_season, last_season, franchise_abbr).
+# A team listed as abbr between first_season and last_season (None = open-ended) is the franchise now known as
+# franchise_abbr. Rows never overlap for the same abbr and season.
+# Rows with a last_season also tell us which abbr a franchise used in a past season - see get_season_abbr.
+# Franchises that took over an abbr another one had left have a row mapping it to itself, so a later use of the abbr
+# isn't mistaken for a stale one - see get_nearest_franchise_abbr
+TEAM_ABBR_HISTORY = [
+    # name-change-only ones
+    ('BOS', None, None, 'NE'),
+    ('JAC', None, 2012, 'JAX'),
+    ('PHO', None, None, 'ARI'),
+    ('SD', None, 2017, 'LAC'),
+    ('RAI', None, None, 'OAK'),
+    # moves
+    ('BAL', None, 1983, 'IND'),  # Colts BAL-> IND
+    ('STL', None, 1987, 'ARI'),  # Cardinals STL -> ARI
+    ('HOU', None, 1996, 'TEN'),  # Oilers HOU -> TEN
+    ('CLE', None, 1995, 'BAL'),  # CLE Browns -> BAL Ravens
+    ('RAM', None, None, 'LA'),  # Rams clusterfuck
+    ('STL', 1995, 2016, 'LA'),
+    # new franchises reusing an abbr
+    ('BAL', 1996, None, 'BAL'),  # Ravens
+    ('CLE', 1999, None, 'CLE'),  # Browns, back
+    ('HOU', 2002, None, 'HOU'),  # Texans
+]
+
+
+def _in_seasons(season_year: int, first_season: int, last_season: int):
+    return (first_season is None or season_year >= first_season) and (last_season is None or season_year <= last_season)
+
+
+# abbr -> rows of TEAM_ABBR_HISTORY for that abbr, and franchise abbr -> rows with a last_season, for scalar lookups
+_BY_ABBR = {}
+_BY_FRANCHISE = {}
+for _row in TEAM_ABBR_HISTORY:
+    _BY_ABBR.setdefault(_row[0], []).append(_row)
+    if _row[2] is not None:
+        _BY_FRANCHISE.setdefault(_row[3], []).append(_row)
+
+
+# given an abbr and season, return the abbr the franchise uses today, e.g. ('SD', 2010) -> 'LAC'
+def get_franchise_abbr(abbr: str, season_year: int):
+    for row_abbr, first_season, last_season, franchise_abbr in _BY_ABBR.get(abbr, []):
+        if _in_seasons(season_year, first_season, last_season):
+            return franchise_abbr
+    return abbr
+
+
+# like get_franchise_abbr, but an abbr listed in a season none of its rows cover still gets the franchise of the
+# nearest of those rows in time, e.g. ('JAC', 2019) -> 'JAX'. Used to spot abbrs used after they were dropped
+def get_nearest_franchise_abbr(abbr: str, season_year: int):
+    rows = _BY_ABBR.get(abbr)
+    if not rows:
+        return abbr
+
+    def distance(row):
+        first_season, last_season = row[1], row[2]
+        if last_season is not None and season_year > last_season:
+            return season_year - last_season
+        if first_season is not None and season_year < first_season:
+            return first_season - season_year
+        return 0
+
+    return min(rows, key=distance)[3]
+
+
+# given a franchise's current abbr and a season, return the abbr it was listed as then, e.g. ('LAC', 2010) -> 'SD'
+def get_season_abbr(abbr: str, season_year: int):
+    for row_abbr, first_season, last_season, franchise_abbr in _BY_FRANCHISE.get(abbr, []):
+        if _in_seasons(season_year, first_season, last_season):
+            return row_abbr
+    return abbr
 
 
 # function meant to account for team moves by changing the historical name to match the current name
 # also corrects for team abbr changes, like BOSton Patriots -> NE Patriots
 # takes the dataframe, and the names of the two columns involved in this change
+# works on whole columns at once, and keeps categorical name columns categorical
 def make_teams_continuous(df: pd.DataFrame, name_col: str, year_col: str):
-    pass_func = functools.partial(_process_team_continuity, name_col, year_col)
-    df = df.apply(pass_func, axis=1)
-    return df
+    names = df[name_col]
+    years = df[year_col]
 
+    # one boolean mask per table row, all computed against the original names so rules can't chain
+    masks = []
+    for abbr, first_season, last_season, franchise_abbr in TEAM_ABBR_HISTORY:
+        if abbr == franchise_abbr:
+            continue
+        mask = (names == abbr).to_numpy(dtype=bool, na_value=False)
+        if first_season is not None:
+            mask = mask & (years >= first_season).to_numpy(dtype=bool, na_value=False)
+        if last_season is not None:
+            mask = mask & (years <= last_season).to_numpy(dtype=bool, na_value=False)
+        masks.append((mask, franchise_abbr))
 
-def _process_team_continuity(name_col: str, year_col: str, row: pd.Series):
-    # process the easy name-change-only ones first
-    if row[name_col] == 'BOS':
-        row[name_col] = 'NE'
-    if row[name_col] == 'JAC':
-        row[name_col] = 'JAX'
-    if row[name_col] == 'PHO':
-        row[name_col] = 'ARI'
-    if row[name_col] == 'SD':
-        row[name_col] = 'LAC'
-    if row[name_col] == 'RAI':
-        row[name_col] = 'OAK'
-
-    # Now process moves
-    # Colts BAL-> IND
-    if row[name_col] == 'BAL' and row[year_col] < 1984:
-        row[name_col] = 'IND'
-
-    # Cardinals STL -> ARI
-    if row[name_col] == 'STL' and row[year_col] < 1988:
-        row[name_col] = 'ARI'
-
-    # Oilers HOU -> TEN
-    if row[name_col] == 'HOU' and row[year_col] < 1997:
-        row[name_col] = 'TEN'
-
-    # CLE Browns -> BAL Ravens
-    if row[name_col] == 'CLE' and row[year_col] < 1996:
-        row[name_col] = 'BAL'
-
-    # Rams clusterfuck
-    if row[name_col] == 'RAM' or (row[name_col] == 'STL' and row[year_col] > 1994):
-        row[name_col] = 'LA'
-
-    return row
+    if isinstance(names.dtype, pd.CategoricalDtype):
+        new_categories = sorted(set(x[1] for x in masks) - set(names.cat.categories))
+        codes = names.cat.add_categories(new_categories).cat.codes.to_numpy().copy()
+        categories = list(names.cat.categories) + new_categories
+        for mask, franchise_abbr in masks:
+            codes[mask] = categories.index(franchise_abbr)
+        continuous = pd.Categorical.from_codes(codes, categories=categories, ordered=names.cat.ordered)
+        continuous = pd.Series(continuous, index=names.index, name=name_col)
+    else:
+        continuous = pd.Series(np.select([x[0] for x in masks], [x[1] for x in masks], names.to_numpy(dtype=object)),
+                               index=names.index, name=name_col)
+        if names.dtype != object:
+            continuous = continuous.astype(names.dtype)
+
+    df = df.copy()
+    df[name_col] = continuous
+    return df
@@ -0,0 +1,131 @@
+"""Where feeds-rs requests go: the feed base URL, and the transports the Downloader sends requests through
+
+The base URL defaults to http://www.nfl.com/feeds-rs and can be changed with set_base_url() or the
+PYNFLDATA_FEED_BASE_URL environment variable, e.g. to point at a local feeds_server.
+
+HTTPTransport makes real requests. RecordingTransport wraps another transport and saves every successful response to a
+folder, and ReplayTransport answers requests from such a folder without touching the network. Recorded payloads are
+stored under their feeds-rs path (see get_payload_filename), the same layout as benchmarks/fixtures and the folder
+feeds_server serves from. Set PYNFLDATA_RECORD=<folder> or PYNFLDATA_REPLAY=<folder> to pick a transport without code
+changes, or pass one to downloader.configure().
+"""
+import abc
+import hashlib
+import os
+import urllib3
+
+DEFAULT_BASE_URL = 'http://www.nfl.com/feeds-rs'
+
+_base_url = os.environ.get('PYNFLDATA_FEED_BASE_URL', DEFAULT_BASE_URL).rstrip('/')
+
+
+def get_base_url():
+    return _base_url
+
+
+def set_base_url(base_url: str):
+    global _base_url
+    _base_url = base_url.rstrip('/')
+
+
+# full url of a feeds-rs path, e.g. 'schedules/2019' -> 'http://www.nfl.com/feeds-rs/schedules/2019'
+def get_url(path: str):
+    return '{}/{}'.format(_base_url, path.lstrip('/'))
+
+
+# feeds-rs path of a url, the inverse of get_url. Urls built with another base still work as long as they contain
+# 'feeds-rs/', so data cached from nfl.com keeps its keys when the base url changes
+def get_path(url: str):
+    if url.startswith(_base_url + '/'):
+        return url[len(_base_url) + 1:]
+    return url.split('feeds-rs/')[1]
+
+
+# file a payload is recorded in. Single-segment paths like 'schedules' go to 'schedules/index', so they can sit next
+# to the 'schedules/2019' style paths below them
+def get_payload_filename(folder: str, path: str):
+    path = path.strip('/')
+    if '/' not in path:
+        path += '/index'
+    return os.path.join(folder, *path.split('/'))
+
+
+def get_etag(data: bytes):
+    return '"{}"'.format(hashlib.sha1(data).hexdigest())
+
+
+# the parts of a response the package uses, for transports that don't make real requests
+class Response:
+    def __init__(self, status: int, data: bytes = b'', headers: dict = None):
+        self.status = status
+        self.data = data
+        self.headers = headers or {}
+
+
+# Base class for transports. request() makes a GET and returns something with status, data and headers
+class Transport(abc.ABC):
+    # whether requests should be held to the Downloader's politeness budget
+    rate_limited = True
+
+    @abc.abstractmethod
+    def request(self, url: str, headers: dict = None):
+        pass
+
+
+# Real requests through one urllib3.PoolManager. Connection errors and 429/5xx responses are retried with backoff
+class HTTPTransport(Transport):
+    def __init__(self, workers: int = 4, retries: int = 3, backoff_factor: float = 0.5):
+        retry = urllib3.Retry(total=retries, backoff_factor=backoff_factor,
+                              status_forcelist=[429, 500, 502, 503, 504], raise_on_status=False)
+        self.http = urllib3.PoolManager(maxsize=workers, block=True, retries=retry)
+
+    def request(self, url: str, headers: dict = None):
+        return self.http.request('GET', url, headers=headers)
+
+
+# Passes requests on to another transport and saves each 200 response's body under folder
+class RecordingTransport(Transport):
+    def __init__(self, folder: str, transport: Transport = None):
+        self.folder = folder
+        self.transport = transport if transport is not None else HTTPTransport()
+        self.rate_limited = self.transport.rate_limited
+
+    def request(self, url: str, headers: dict = None):
+        r = self.transport.request(url, headers)
+        if r.status == 200:
+            filename = get_payload_filename(self.folder, get_path(url))
+            os.makedirs(os.path.dirname(filename), exist_ok=True)
+            temp_filename = os.path.join(os.path.dirname(filename), '.{}.tmp'.format(os.path.basename(filename)))
+            with open(temp_filename, 'wb') as outfile:
+                outfile.write(r.data)
+            os.replace(temp_filename, filename)
+        return r
+
+
+# Answers requests from payloads recorded under folder - 404 if a path was never recorded, 304 for a matching ETag
+class ReplayTransport(Transport):
+    rate_limited = False
+
+    def __init__(self, folder: str):
+        self.folder = folder
+
+    def request(self, url: str, headers: dict = None):
+        filename = get_payload_filename(self.folder, get_path(url))
+        if not os.path.isfile(filename):
+            return Response(404)
+        with open(filename, 'rb') as infile:
+            data = infile.read()
+
+        etag = get_etag(data)
+        if (headers or {}).get('If-None-Match') == etag:
+            return Response(304, headers={'ETag': etag})
+        return Response(200, data, {'ETag': etag})
+
+
+# the transport picked by PYNFLDATA_REPLAY/PYNFLDATA_RECORD, plain HTTP if neither is set
+def get_default_transport(workers: int = 4):
+    if os.environ.get('PYNFLDATA_REPLAY'):
+        return ReplayTransport(os.environ['PYNFLDATA_REPLAY'])
+    if os.environ.get('PYNFLDATA_RECORD'):
+        return RecordingTransport(os.environ['PYNFLDATA_RECORD'], HTTPTransport(workers))
+    return HTTPTransport(workers)
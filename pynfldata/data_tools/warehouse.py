@@ -0,0 +1,99 @@
+"""Warehouses that exported games are loaded into, as used by plays_data/play_parser_bigquery
+
+BigQueryWarehouse is the real one, appending to pynfldata.drives.plays_nested_v1. SQLiteWarehouse is a local stand-in
+with the same interface, one row per game, for trying out and benchmarking loads without a Google Cloud project.
+
+The warehouse is chosen with set_warehouse() or the PYNFLDATA_WAREHOUSE environment variable ('bigquery' or 'sqlite').
+"""
+import abc
+import io
+import json
+import os
+import sqlite3
+import time
+
+
+# Base class for warehouses. Games are loaded as newline-delimited JSON, one Game.export() per line
+class Warehouse(abc.ABC):
+    # return the set of game_ids already loaded for a season
+    @abc.abstractmethod
+    def get_game_ids(self, season_year: int):
+        pass
+
+    # load one NDJSON batch from a binary file object. Returns the number of games loaded
+    @abc.abstractmethod
+    def load_ndjson(self, ndjson_file):
+        pass
+
+    def close(self):
+        pass
+
+
+class BigQueryWarehouse(Warehouse):
+    def __init__(self, table: str = 'pynfldata.drives.plays_nested_v1', client=None):
+        # imported here so google-cloud-bigquery is only needed when BigQuery is actually used
+        from google.cloud import bigquery as bq
+        self._bq = bq
+        self.table = table
+        self.client = client if client is not None else bq.Client()
+
+    def get_game_ids(self, season_year: int):
+        query = """SELECT DISTINCT game_id
+                     FROM `{}`
+                    WHERE season_year = {}""".format(self.table, int(season_year))
+        return {str(row.game_id) for row in self.client.query(query).result()}
+
+    def load_ndjson(self, ndjson_file):
+        load_config = self._bq.job.LoadJobConfig(write_disposition='WRITE_APPEND',
+                                                 source_format='NEWLINE_DELIMITED_JSON')
+        load_job = self.client.load_table_from_file(ndjson_file, self.table, job_config=load_config)
+        while load_job.running():
+            time.sleep(2)
+
+        if load_job.exception():
+            raise load_job.exception()
+        return load_job.output_rows
+
+
+# One table, games(game_id, season_year, data), with each game's NDJSON line kept as it was loaded
+class SQLiteWarehouse(Warehouse):
+    def __init__(self, filename: str = 'data/warehouse.sqlite'):
+        self.filename = filename
+        os.makedirs(os.path.dirname(filename) or '.', exist_ok=True)
+        self._conn = sqlite3.connect(filename)
+        self._conn.execute('CREATE TABLE IF NOT EXISTS games '
+                           '(game_id TEXT PRIMARY KEY, season_year INTEGER NOT NULL, data TEXT NOT NULL)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS games_season ON games (season_year)')
+
+    def get_game_ids(self, season_year: int):
+        rows = self._conn.execute('SELECT game_id FROM games WHERE season_year = ?', (int(season_year),))
+        return {row[0] for row in rows}
+
+    def load_ndjson(self, ndjson_file):
+        rows = []
+        for line in io.TextIOWrapper(ndjson_file, encoding='utf-8'):
+            if line.strip():
+                game = json.loads(line)
+                rows.append((str(game['game_id']), int(game['season_year']), line.rstrip('\n')))
+        with self._conn:
+            self._conn.executemany('INSERT OR REPLACE INTO games VALUES (?, ?, ?)', rows)
+        return len(rows)
+
+    def close(self):
+        self._conn.close()
+
+
+_warehouse = None
+
+
+# return the configured warehouse, building it from PYNFLDATA_WAREHOUSE on first use
+def get_warehouse():
+    global _warehouse
+    if _warehouse is None:
+        _warehouse = SQLiteWarehouse() if os.environ.get('PYNFLDATA_WAREHOUSE') == 'sqlite' else BigQueryWarehouse()
+    return _warehouse
+
+
+def set_warehouse(warehouse: Warehouse):
+    global _warehouse
+    _warehouse = warehouse
@@ -8,8 +8,9 @@ Will likely be useful but need to be refactored later when I need to get more da
 # todo better documentation
 import logging
 from pynfldata.data_tools import functions as f
-import pandas as pd
-import os
+from pynfldata.data_tools import build_manifest
+from pynfldata.data_tools import metrics
+from pynfldata.data_tools import parquet_writer
 
 # setup logging
 logger = logging.getLogger('drive_parser.py')
@@ -20,23 +21,42 @@ logger.addHandler(handler)
 logger.setLevel(logging.INFO)
 
 
-def build_and_save_json():
+# write one line per game to output/drives_{year}.json as each game is parsed, so a season is never held in memory.
+# compress=True writes gzipped output/drives_{year}.json.gz instead
+# only games that are new or changed since the last run are parsed, and seasons without any are left alone - see
+# build_manifest. rebuild=True parses everything again
+# timings and counts for the run are saved to output/drives_metrics.json - see metrics
+# pipeline gets each season's games through async_pipeline, with the given options - see build_season_json
+def build_and_save_json(compress: bool = False, rebuild: bool = False, pipeline: dict = None):
+    metrics.reset()
+    manifest = build_manifest.BuildManifest('output/drives_manifest.json')
+    if rebuild:
+        manifest.clear()
+
     # get all schedule files 2009+, process games in each year separately
     for year in range(2009, 2019):
-        games = f.get_games_for_years(year, year+1)
-
-        # using list of games, export game details and append to that year's list
-        games_dicts = []
-        for g in games:
-            games_dicts.append(g.export())
-        drives_df = pd.DataFrame(games_dicts)
-
-        # if the folder doesn't exist, create it
-        if not os.path.exists('output'):
-            os.makedirs('output')
-
-        drives_df.to_json('output/drives_{year}.json'.format(year=str(year)), orient='records', lines=True)
-        logger.info('Completed processing JSON for {}'.format(str(year)))
+        filename = 'output/drives_{year}.json'.format(year=str(year))
+        if compress:
+            filename += '.gz'
+
+        with metrics.timer('season'):
+            num_parsed = build_manifest.build_season_json(year, filename, manifest, compress, pipeline=pipeline)
+        if num_parsed is None:
+            logger.info('No new or changed games for {}, skipped'.format(str(year)))
+        else:
+            logger.info('Completed processing JSON for {}'.format(str(year)))
+    metrics.write_summary('output/drives_metrics.json')
+
+
+# same games as build_and_save_json, written to a season-partitioned Parquet dataset instead - see parquet_writer
+def build_and_save_parquet():
+    metrics.reset()
+    for year in range(2009, 2019):
+        with metrics.timer('season'):
+            games = f.get_games_for_years(year, year+1)
+            parquet_writer.write_games(games, 'output/drives.pq')
+        logger.info('Completed processing Parquet for {}'.format(str(year)))
+    metrics.write_summary('output/drives_pq_metrics.json')
 
 
 build_and_save_json()
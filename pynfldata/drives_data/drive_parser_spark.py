@@ -1,18 +1,29 @@
-"""File to get raw data from nfl.com and process drives out of it.
-Will likely be useful but need to be refactored later when I need to get more data than just drive outcomes
+"""File to get raw data from nfl.com and process drives out of it on Spark.
+
+The driver only reads the schedules and makes sure every game's raw data is in the local raw store (downloading what's
+missing, concurrently and within the rate limit - see functions.get_season_games). Executors then parse the games
+from the raw store with mapPartitions, setting up the raw store and game cache once per partition, and turn them into
+rows of SPARK_SCHEMA - parquet_writer.GAME_SCHEMA plus the season_year partition column. The rows are written straight
+from the executors, partitioned by season_year, so nothing is collected on the driver:
+
+    python -m pynfldata.drives_data.drive_parser_spark local[8]
+
+No SparkContext is started until one of the build functions runs - see get_spark().
 """
-# todo better documentation
+import copy
 import logging
-from pynfldata.data_tools import functions as f
-import pandas as pd
 import os
-from pyspark import SparkContext, SparkConf
-from pyspark.sql import SparkSession, SQLContext
-
-conf = SparkConf().setAppName('Drive Parser').setMaster('local[4]')
-sc = SparkContext(conf=conf)
-spark = SparkSession.builder.master("local").appName("Drive Parser").getOrCreate()
-sqlContext = SQLContext(sc)
+from pathlib import Path
+import pyarrow as pa
+from pyspark.sql import SparkSession
+from pyspark.sql.types import ArrayType, BooleanType, ByteType, IntegerType, LongType, ShortType, StringType, \
+    StructField, StructType
+import sys
+from pynfldata.data_tools import functions as f
+from pynfldata.data_tools import game_cache
+from pynfldata.data_tools import nfl_types
+from pynfldata.data_tools import parquet_writer
+from pynfldata.data_tools import raw_store
 
 # setup logging
 logger = logging.getLogger('drive_parser_spark.py')
@@ -22,32 +33,113 @@ handler.setFormatter(formatter)
 logger.addHandler(handler)
 logger.setLevel(logging.INFO)
 
+DEFAULT_MASTER = 'local[4]'
+_SPARK_INT_TYPES = {8: ByteType, 16: ShortType, 32: IntegerType, 64: LongType}
+
+
+# the Spark type of a pyarrow type, for the types used by parquet_writer.GAME_SCHEMA
+def _spark_type(arrow_type: pa.DataType):
+    if pa.types.is_struct(arrow_type):
+        return StructType([StructField(field.name, _spark_type(field.type), field.nullable)
+                           for field in (arrow_type.field(i) for i in range(arrow_type.num_fields))])
+    elif pa.types.is_list(arrow_type):
+        return ArrayType(_spark_type(arrow_type.value_type))
+    elif pa.types.is_string(arrow_type):
+        return StringType()
+    elif pa.types.is_boolean(arrow_type):
+        return BooleanType()
+    elif pa.types.is_integer(arrow_type):
+        return _SPARK_INT_TYPES[arrow_type.bit_width]()
+    raise TypeError('No Spark type for {}'.format(arrow_type))
+
+
+SPARK_SCHEMA = StructType(_spark_type(pa.struct(list(parquet_writer.GAME_SCHEMA))).fields +
+                          [StructField('season_year', ShortType(), False)])
+
+
+# a nested record (dicts and lists, as built by parquet_writer) as a row of nested tuples in schema order
+def _to_row(value, spark_type):
+    if value is None:
+        return None
+    elif isinstance(spark_type, StructType):
+        return tuple(_to_row(value.get(field.name), field.dataType) for field in spark_type.fields)
+    elif isinstance(spark_type, ArrayType):
+        return [_to_row(x, spark_type.elementType) for x in value]
+    return value
+
+
+# the Spark session, started on first use rather than at import
+def get_spark(master: str = DEFAULT_MASTER):
+    return SparkSession.builder.master(master).appName('Drive Parser').getOrCreate()
+
+
+# the driver's raw store and game cache as they're sent to the executors. Executors don't share the driver's working
+# directory, so the store's folder and the cache's filename are made absolute first
+def _get_executor_store_and_cache():
+    store = copy.copy(raw_store.get_store())
+    if isinstance(getattr(store, 'folder', None), Path):
+        store.folder = Path(os.path.abspath(store.folder))
+    cache = copy.copy(game_cache.get_cache())
+    if cache is not None:
+        cache.filename = os.path.abspath(cache.filename)
+    return store, cache
+
+
+# runs on the executors: parse one partition of games from the local raw store, yielding one row per game.
+# store and cache come from the driver, so every partition reads the same raw data and game cache
+def _parse_partition(games, store: raw_store.RawStore, cache: game_cache.GameCache, descriptions: bool):
+    raw_store.set_store(store)
+    game_cache.set_cache(cache)
+    for game_fields in games:
+        game, failure = f._parse_game(nfl_types.Game(*game_fields))
+        if failure is not None:
+            f.log_failure(failure)
+            continue
+        record = parquet_writer._game_record(game, descriptions)
+        record['season_year'] = game.season_year
+        yield _to_row(record, SPARK_SCHEMA)
+
+
+# a DataFrame of every game in a year range (end_year exclusive), parsed on the executors
+def get_games_df(start_year: int, end_year: int, master: str = DEFAULT_MASTER, num_partitions: int = None,
+                 descriptions: bool = True):
+    spark = get_spark(master)
+    games = []
+    for year in range(start_year, end_year):
+        # only the schedule fields go to the executors, which parse the games themselves
+        season_games = [(g.season_year, g.season_type, g.game_week, g.home_team, g.away_team, g.game_id,
+                         g.home_score, g.away_score) for g in f.get_season_games(year, load=False)]
+        logger.info('Got {} games for {}'.format(len(season_games), str(year)))
+        games += season_games
 
-# Still slower than the non-spark version
-def build_and_save_json():
-    # get all schedule files 2009+, process games in each year separately
-    for year in range(2009, 2019):
-        games = f.get_games_from_schedule(year)
+    num_partitions = num_partitions or spark.sparkContext.defaultParallelism * 4
+    store, cache = _get_executor_store_and_cache()
+    rows = spark.sparkContext.parallelize(games, num_partitions) \
+        .mapPartitions(lambda part: _parse_partition(part, store, cache, descriptions))
+    return spark.createDataFrame(rows, SPARK_SCHEMA, verifySchema=False)
 
-        games_par = sc.parallelize(games, 16)
-        games_par = games_par.filter(lambda x: x.season_type != 'PRO' and x.game_id not in f.bad_games)
-        games_dicts = games_par.map(lambda x: x.get_game_details()).map(lambda x: x.export())
 
-        drives_df = pd.DataFrame(games_dicts.collect())
+# write every game from 2009 through 2018 to a season_year-partitioned Parquet dataset, from the executors
+def build_and_save_parquet(output: str = 'output/drives_spark.pq', master: str = DEFAULT_MASTER,
+                           num_partitions: int = None):
+    get_games_df(2009, 2019, master, num_partitions).write.partitionBy('season_year').mode('overwrite') \
+        .parquet(output)
+    logger.info('Completed processing Parquet to {}'.format(output))
 
-        # if the folder doesn't exist, create it
-        if not os.path.exists('output'):
-            os.makedirs('output')
 
-        drives_df.to_json('output/drives_{year}.json'.format(year=str(year)), orient='records', lines=True)
-        logger.info('Completed processing JSON for {}'.format(str(year)))
+# same games as build_and_save_parquet, as season_year-partitioned JSON lines. Spark writes several part files per
+# season - drive_parser.build_and_save_json writes the one file per season the other scripts expect
+def build_and_save_json(output: str = 'output/drives_spark.json', master: str = DEFAULT_MASTER,
+                        num_partitions: int = None):
+    get_games_df(2009, 2019, master, num_partitions).write.partitionBy('season_year').mode('overwrite').json(output)
+    logger.info('Completed processing JSON to {}'.format(output))
 
 
-def convert_json_to_pq():
-    json_df = sqlContext.read.json(['output/drives_{}.json'.format(str(x)) for x in range(2009, 2019)])
-    print(json_df.head(5))
+# convert drive_parser's JSON output to Parquet
+def convert_json_to_pq(master: str = DEFAULT_MASTER):
+    json_df = get_spark(master).read.json(['output/drives_{}.json'.format(str(x)) for x in range(2009, 2019)])
     json_df.write.parquet('output/drives.pq')
 
 
-# build_and_save_json()
-convert_json_to_pq()
+if __name__ == '__main__':
+    build_and_save_parquet(master=sys.argv[1] if len(sys.argv) > 1 else DEFAULT_MASTER)
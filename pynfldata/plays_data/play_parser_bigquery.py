@@ -1,12 +1,19 @@
 """File to get raw data from nfl.com and process plays out of it and upload them to existing BigQuery tables
+
+The schedule's game_ids are diffed against the ones already in the warehouse first, so only games that are missing
+get downloaded and parsed. They're loaded in batches of NDJSON rather than one big string.
+load_new_games(pipeline={...}) gets the new games through async_pipeline instead, so loading overlaps with downloading
+and parsing.
+Set PYNFLDATA_WAREHOUSE=sqlite to load into a local SQLite stand-in instead of BigQuery - see warehouse.py
 """
 # todo better documentation
 import logging
+from pynfldata.data_tools import async_pipeline
 from pynfldata.data_tools import functions as f
-import pandas as pd
-from google.cloud import bigquery as bq
+from pynfldata.data_tools import metrics
+from pynfldata.data_tools import ndjson_writer
+from pynfldata.data_tools import warehouse
 import io
-import time
 
 # setup logging
 logger = logging.getLogger('plays_parser.py')
@@ -16,63 +23,81 @@ handler.setFormatter(formatter)
 logger.addHandler(handler)
 logger.setLevel(logging.DEBUG)
 
-bq_client = bq.Client()
-
 
-def get_existing_games_from_bq(season_year: int):
-    logger.debug('Getting games from BQ for {}'.format(str(season_year)))
-    query = """SELECT DISTINCT game_id 
-                 FROM `pynfldata.drives.plays_nested_v1` 
-                WHERE season_year = {}""".format(season_year)
-    query_job = bq_client.query(query)
-    return [str(row.game_id) for row in query_job.result()]
+def get_existing_games(season_year: int, wh: warehouse.Warehouse):
+    logger.debug('Getting games from the warehouse for {}'.format(str(season_year)))
+    return wh.get_game_ids(season_year)
 
 
-def get_finished_games(season_year: int):
+# finished games of the season that aren't in existing_game_ids. Only these get downloaded
+def get_new_games(season_year: int, existing_game_ids: set):
     logger.debug('Getting games from NFL feeds-rs for {}'.format(str(season_year)))
-    games = f.get_games_for_years(season_year, season_year + 1)
-    return games
-
-
-def export_new_games_to_json():
-    # Get a list of all finished games from feeds-rs, and all games currently in BigQuery
+    return f.get_season_games(season_year, exclude=existing_game_ids)
+
+
+# parse games and yield them as NDJSON file objects of at most batch_size games each
+def iter_ndjson_batches(games: list, batch_size: int = 50, workers: int = 1):
+    return _iter_batches(f.iter_parse_games(games, workers, export=True), batch_size)
+
+
+# batch up (result, failure) pairs of exported games as NDJSON file objects
+def _iter_batches(parsed, batch_size: int):
+    batch = []
+    for result, failure in parsed:
+        if failure is not None:
+            f.log_failure(failure)
+            continue
+        batch.append(ndjson_writer.to_json_line(result))
+        if len(batch) == batch_size:
+            yield io.BytesIO(''.join(batch).encode())
+            batch = []
+    if batch:
+        yield io.BytesIO(''.join(batch).encode())
+
+
+# load every finished game of the current season that isn't in the warehouse yet. Returns the number of games loaded
+# timings and counts for the run are saved to output/plays_bigquery_metrics.json - see metrics
+# pipeline gets the games through async_pipeline instead, with the given options (e.g. {'concurrency': {'fetch': 16}})
+def load_new_games(wh: warehouse.Warehouse = None, batch_size: int = 50, workers: int = 1, pipeline: dict = None):
+    metrics.reset()
+    wh = wh if wh is not None else warehouse.get_warehouse()
     current_year = f.get_current_game_year()
-    bq_games = get_existing_games_from_bq(current_year)
-    finished_games = get_finished_games(current_year)
-    finished_game_ids = [x.game_id for x in finished_games]
-
-    # Determine which finished games aren't in BQ
-    new_game_ids = [x for x in finished_game_ids if x not in bq_games]
-    new_games = [x.export() for x in finished_games if x.game_id in new_game_ids]
+    if pipeline is not None:
+        concurrency = dict({'parse': workers}, **pipeline.get('concurrency', {}))
+        return _load_new_games_pipelined(wh, current_year, batch_size, dict(pipeline, concurrency=concurrency))
 
+    new_games = get_new_games(current_year, get_existing_games(current_year, wh))
     if len(new_games) == 0:
-        return None
-    else:
-        logger.debug('Found {} games'.format(str(len(new_games))))
-        drives_df = pd.DataFrame(new_games)
-        return drives_df.to_json(orient='records', lines=True)
-
-
-def upload_to_bq(json_str):
-    load_config = bq.job.LoadJobConfig(write_disposition='WRITE_APPEND', source_format='NEWLINE_DELIMITED_JSON')
-    load_job = bq_client.load_table_from_file(json_str,
-                                              "pynfldata.drives.plays_nested_v1",
-                                              job_config=load_config)
-    while load_job.running():
-        time.sleep(2)
-
-    return load_job
-
-
-json_string = export_new_games_to_json()
-if json_string:
-    logger.debug('Loading {} games to BQ'.format(str(len(json_string.split('\n')))))
-    job = upload_to_bq(io.StringIO(json_string))
-
-    if job.exception():
-        logger.warning('Exception in BQ job! {}'.format(job.exception()))
-
-    if job.done():
-        logger.info('Load to BQ complete')
-else:
-    logger.info('No games found to upload')
+        logger.info('No games found to upload')
+        metrics.write_summary('output/plays_bigquery_metrics.json')
+        return 0
+
+    logger.debug('Found {} games'.format(str(len(new_games))))
+    num_loaded = 0
+    for ndjson_file in iter_ndjson_batches(new_games, batch_size, workers):
+        with metrics.timer('warehouse_load'):
+            num_loaded += wh.load_ndjson(ndjson_file)
+        logger.debug('Loaded {} of {} games'.format(num_loaded, len(new_games)))
+    logger.info('Load to warehouse complete')
+    metrics.write_summary('output/plays_bigquery_metrics.json')
+    return num_loaded
+
+
+# load_new_games on async_pipeline - batches are loaded while the next games are still being fetched and parsed
+def _load_new_games_pipelined(wh: warehouse.Warehouse, season_year: int, batch_size: int, pipeline: dict):
+    existing_game_ids = get_existing_games(season_year, wh)
+    logger.debug('Getting new games from NFL feeds-rs for {}'.format(str(season_year)))
+    parsed = ((result, failure) for game, result, failure in
+              async_pipeline.iter_games([season_year], export=True, exclude=existing_game_ids, **pipeline))
+    num_loaded = 0
+    for ndjson_file in _iter_batches(parsed, batch_size):
+        with metrics.timer('warehouse_load'):
+            num_loaded += wh.load_ndjson(ndjson_file)
+        logger.debug('Loaded {} games'.format(num_loaded))
+    logger.info('No games found to upload' if num_loaded == 0 else 'Load to warehouse complete')
+    metrics.write_summary('output/plays_bigquery_metrics.json')
+    return num_loaded
+
+
+if __name__ == '__main__':
+    load_new_games()
@@ -7,5 +7,5 @@ setup(
     author='Trevor Balint',
     author_email='trevor.balint@gmail.com',
     packages=['pynfldata', 'pynfldata.coaches_data', 'pynfldata.data_tools'],  # same as name
-    install_requires=['xmltodict', 'pandas', 'urllib3', 'pyspark'],  # external packages as dependencies
+    install_requires=['xmltodict', 'pandas', 'urllib3', 'pyspark', 'pyarrow'],  # external packages as dependencies
 )